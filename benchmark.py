@@ -0,0 +1,1340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+GIF Maker性能基准测试脚本
+
+使用方法：
+    python benchmark.py memory                 # 对比流式写入与一次性写入的峰值内存
+    python benchmark.py memory --width 1920 --height 1080 --seconds 5 20
+    python benchmark.py sampling               # 对比逐帧读取与跳帧采样的取出帧数和耗时
+    python benchmark.py resize --workers 1 2 4 8   # 不同进程数下批量调整图片大小的耗时
+    python benchmark.py palette                # 对比各调色板模式的耗时和文件大小
+    python benchmark.py delta                  # 对比帧间差分优化前后的耗时和文件大小
+    python benchmark.py batch                  # 对比每个任务启动一个进程与batch子命令的吞吐量
+    python benchmark.py append                 # 对比每新增一张图片后重新生成整个GIF与--append续写的耗时
+    python benchmark.py transform              # 对比先缩放再裁剪与先裁剪再缩放在各重采样滤镜下的每帧CPU时间
+    python benchmark.py videoframe             # 对比视频帧经过Image对象缩放与全程使用NumPy数组缩放的耗时
+    python benchmark.py select                 # 对比固定帧率抽帧与adaptive帧选择的帧数、耗时和文件大小
+    python benchmark.py multi                  # 对比每个尺寸单独转换与一次解码生成全部尺寸的耗时
+    python benchmark.py spool                  # 对比帧缓冲与内存列表的峰值内存，以及global调色板两遍处理与抽样的耗时
+    python benchmark.py encode --workers 1 2 4 # 对比逐帧LZW编码与进程池并行编码的耗时，并检查输出是否与逐帧编码完全相同
+    python benchmark.py formats                # 对比GIF、动画WebP和APNG输出的耗时和文件大小
+    python benchmark.py serve                  # 对比每个请求启动一个进程与serve渲染服务生成小GIF的p50/p99延迟
+    python benchmark.py outputcache            # 对比不使用输出缓存、缓存未命中与命中时的耗时，并检查命中时的输出是否相同
+    python benchmark.py segments               # 对比逐段调用与一遍读取所有时间片段（--segments、--split-segments）的耗时
+    python benchmark.py maxbytes               # 对比反复缩小重试与--max-bytes估算后一次编码的耗时和估算误差
+    python benchmark.py startup                # 对比启动时导入cv2与按需导入时images子命令的冷启动耗时
+    python benchmark.py suite -o results.json  # 在多种分辨率和长度的合成图片、视频上测试各个入口函数，结果写入JSON
+    python benchmark.py compare base.json results.json   # 对比两次suite结果，耗时或内存超出阈值时以非0状态退出
+
+每个测试用例都在独立的子进程中运行，以便准确测量该用例自身的峰值内存（RSS）。
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import json
+import subprocess
+import multiprocessing
+import queue as queue_module
+import contextlib
+import io
+import re
+import platform
+import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import gif_maker
+
+
+def peak_rss_mb():
+    """
+    返回当前进程的峰值常驻内存（MB），不支持的平台返回None
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux上单位为KB，macOS上单位为字节
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def make_synthetic_video(path, width, height, seconds, fps=30):
+    """
+    使用cv2.VideoWriter生成一段带有移动色块的合成视频
+
+    参数:
+        path: 输出视频文件路径
+        width: 视频宽度
+        height: 视频高度
+        seconds: 视频时长（秒）
+        fps: 视频帧率
+    """
+    import cv2
+    import numpy as np
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    gradient = np.linspace(0, 255, width, dtype=np.uint8)
+    base = np.dstack([np.tile(gradient, (height, 1))] * 3)
+    block = max(width, height) // 8
+    for i in range(int(seconds * fps)):
+        frame = base.copy()
+        x = (i * 7) % max(1, width - block)
+        y = (i * 3) % max(1, height - block)
+        frame[y:y + block, x:x + block] = (i % 256, 255 - i % 256, 128)
+        writer.write(frame)
+    writer.release()
+
+
+def make_static_video(path, width, height, seconds, fps=30, still=2.0, motion=1.0):
+    """
+    生成静止片段与运动片段交替出现的合成视频（类似讲解录屏），每个运动片段之后换一个背景（场景切换）
+
+    参数:
+        path: 输出视频文件路径
+        width: 视频宽度
+        height: 视频高度
+        seconds: 视频时长（秒）
+        fps: 视频帧率
+        still: 每个静止片段的时长（秒）
+        motion: 每个运动片段的时长（秒）
+    """
+    import cv2
+    import numpy as np
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    gradient = np.linspace(0, 255, width, dtype=np.uint8)
+    block = max(width, height) // 8
+    period = still + motion
+    for i in range(int(seconds * fps)):
+        scene, phase = divmod(i / fps, period)
+        frame = np.dstack([np.tile(gradient, (height, 1)), np.full((height, width), int(scene * 67) % 256, np.uint8), np.tile(gradient[::-1], (height, 1))])
+        x = int(max(0.0, phase - still) / motion * (width - block))
+        frame[height // 3:height // 3 + block, x:x + block] = (0, 0, 255)
+        writer.write(frame)
+    writer.release()
+
+
+def bench_select(args):
+    """对比固定帧率抽帧与adaptive帧选择的输出帧数、耗时和文件大小"""
+    from PIL import Image
+
+    print(f"视频: {args.width}x{args.height}, {args.seconds}秒，静止{args.still}秒与运动{args.motion}秒交替，输出{args.fps}fps")
+    print(f"{'帧选择':>14} {'帧数':>6} {'耗时(秒)':>10} {'文件大小(KB)':>14} {'总时长(秒)':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = os.path.join(tmp_dir, 'static.mp4')
+        make_static_video(video_path, args.width, args.height, args.seconds, still=args.still, motion=args.motion)
+        cases = [('fixed', 'fixed', 1)] + [(f'adaptive x{boost}', 'adaptive', boost) for boost in args.boost]
+        for name, select, boost in cases:
+            output_file = os.path.join(tmp_dir, f'{select}_{boost}.gif')
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                gif_maker.create_gif_from_video(video_path, output_file, fps=args.fps, select=select, select_threshold=args.threshold, scene_boost=boost)
+            elapsed = time.perf_counter() - start
+            with Image.open(output_file) as img:
+                frames = img.n_frames
+                total = 0
+                for index in range(frames):
+                    img.seek(index)
+                    total += img.info.get('duration', 0)
+            print(f"{name:>14} {frames:>6} {elapsed:>10.2f} {os.path.getsize(output_file) / 1024:>14.1f} {total / 1000:>10.2f}")
+
+
+def make_synthetic_images(directory, count, width, height):
+    """
+    生成一组带有渐变背景和移动色块的PNG图片
+
+    参数:
+        directory: 输出目录
+        count: 图片数量
+        width: 图片宽度
+        height: 图片高度
+
+    返回:
+        list: 按顺序排列的图片路径列表
+    """
+    import numpy as np
+    from PIL import Image
+
+    gradient = np.linspace(0, 255, width, dtype=np.uint8)
+    base = np.dstack([np.tile(gradient, (height, 1)), np.tile(gradient[::-1], (height, 1)), np.full((height, width), 96, np.uint8)])
+    block = max(width, height) // 8
+    paths = []
+    for i in range(count):
+        frame = base.copy()
+        x = (i * 37) % max(1, width - block)
+        y = (i * 17) % max(1, height - block)
+        frame[y:y + block, x:x + block] = (i * 5 % 256, 255 - i * 5 % 256, 32)
+        path = os.path.join(directory, f'frame_{i:05d}.png')
+        # 关闭压缩以缩短生成时间，测试的重点是解码和缩放
+        Image.fromarray(frame).save(path, compress_level=1)
+        paths.append(path)
+    return paths
+
+
+def _legacy_create_gif_from_video(video_path, output_file, fps, target_size):
+    """优化前的实现：先提取全部帧到列表，再一次性交给Pillow保存"""
+    frames = gif_maker.extract_frames_from_video(video_path, fps=fps, target_size=target_size)
+    frames[0].save(output_file, format='GIF', append_images=frames[1:], save_all=True,
+                   duration=int(1000 / fps), loop=0)
+
+
+def _run_case(mode, video_path, output_file, fps, target_size, queue):
+    """子进程入口：运行一个用例并回传耗时和峰值内存"""
+    sys.stdout = open(os.devnull, 'w')
+    start = time.perf_counter()
+    if mode == 'legacy':
+        _legacy_create_gif_from_video(video_path, output_file, fps, target_size)
+    else:
+        gif_maker.create_gif_from_video(video_path, output_file, fps=fps, target_size=target_size)
+    queue.put((time.perf_counter() - start, peak_rss_mb(), os.path.getsize(output_file)))
+
+
+def make_synthetic_screencast(count, width, height):
+    """
+    生成一组模拟屏幕录制的帧：静态界面背景上有移动的鼠标指针和逐字出现的文本
+
+    参数:
+        count: 帧数
+        width: 画面宽度
+        height: 画面高度
+
+    返回:
+        list: PIL Image对象列表
+    """
+    from PIL import Image, ImageDraw
+
+    background = Image.new('RGB', (width, height), (240, 240, 240))
+    draw = ImageDraw.Draw(background)
+    draw.rectangle((0, 0, width, 32), fill=(45, 45, 60))
+    draw.rectangle((0, 32, 180, height), fill=(225, 228, 235))
+    for y in range(48, height - 24, 28):
+        draw.rectangle((16, y, 164, y + 16), fill=(200, 205, 215))
+    draw.rectangle((200, 56, width - 24, height - 24), outline=(180, 180, 180), fill=(255, 255, 255))
+
+    text = 'The quick brown fox jumps over the lazy dog. ' * 8
+    line_chars = max(1, (width - 240) // 7)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        draw = ImageDraw.Draw(frame)
+        typed = text[:i * 2]
+        for row in range(0, len(typed), line_chars):
+            draw.text((212, 68 + row // line_chars * 16), typed[row:row + line_chars], fill=(20, 20, 20))
+        x = 220 + (i * 7) % max(1, width - 260)
+        y = 80 + (i * 3) % max(1, height - 120)
+        draw.polygon([(x, y), (x, y + 16), (x + 4, y + 12), (x + 11, y + 12)], fill=(0, 0, 0))
+        frames.append(frame)
+    return frames
+
+
+def run_isolated(mode, video_path, output_file, fps, target_size):
+    """
+    在独立子进程中运行一个用例
+
+    返回:
+        tuple: (耗时秒数, 峰值内存MB, 输出文件字节数)
+    """
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_run_case, args=(mode, video_path, output_file, fps, target_size, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def bench_memory(args):
+    """对比不同视频时长下流式写入与一次性写入的峰值内存"""
+    target_size = (args.target_width, args.target_height) if args.target_width and args.target_height else None
+    print(f"视频分辨率: {args.width}x{args.height}, 输出fps: {args.fps}, 目标大小: {target_size}")
+    print(f"{'时长(秒)':>8} {'模式':>8} {'耗时(秒)':>10} {'峰值内存(MB)':>14} {'文件大小(KB)':>14}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for seconds in args.seconds:
+            video_path = os.path.join(tmp_dir, f'synthetic_{seconds}s.mp4')
+            make_synthetic_video(video_path, args.width, args.height, seconds)
+            for mode in ('legacy', 'stream'):
+                output_file = os.path.join(tmp_dir, f'{mode}_{seconds}s.gif')
+                elapsed, peak, size = run_isolated(mode, video_path, output_file, args.fps, target_size)
+                peak_text = f"{peak:.1f}" if peak is not None else "N/A"
+                print(f"{seconds:>8} {mode:>8} {elapsed:>10.2f} {peak_text:>14} {size / 1024:>14.1f}")
+
+
+def _legacy_extract_frames(video_path, fps):
+    """优化前的抽帧方式：read()每一帧，按整数间隔保留，返回(帧列表, 取出帧数)"""
+    import cv2
+    from PIL import Image
+
+    cap = cv2.VideoCapture(video_path)
+    video_fps = cap.get(cv2.CAP_PROP_FPS)
+    interval = 1 if fps >= video_fps else int(video_fps / fps)
+    frames = []
+    decoded = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if decoded % interval == 0:
+            frames.append(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+        decoded += 1
+    cap.release()
+    return frames, decoded
+
+
+def bench_sampling(args):
+    """对比逐帧读取与按时间戳跳帧采样的取出帧数、耗时和时间轴误差"""
+    import cv2
+
+    print(f"视频分辨率: {args.width}x{args.height}, 时长: {args.seconds}秒, 输出fps: {args.fps}")
+    print(f"{'源fps':>8} {'模式':>8} {'输出帧数':>8} {'取出帧数':>8} {'耗时(秒)':>10} {'末帧时间误差(秒)':>16}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for source_fps in args.source_fps:
+            video_path = os.path.join(tmp_dir, f'synthetic_{source_fps}fps.mp4')
+            make_synthetic_video(video_path, args.width, args.height, args.seconds, source_fps)
+
+            cap = cv2.VideoCapture(video_path)
+            video_fps = cap.get(cv2.CAP_PROP_FPS)
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
+
+            start = time.perf_counter()
+            frames, decoded = _legacy_extract_frames(video_path, args.fps)
+            elapsed = time.perf_counter() - start
+            interval = 1 if args.fps >= video_fps else int(video_fps / args.fps)
+            # 最后一个输出帧在GIF中的时间点与其源帧真实时间点之差
+            drift = (len(frames) - 1) / args.fps - (len(frames) - 1) * interval / video_fps
+            print(f"{source_fps:>8} {'legacy':>8} {len(frames):>8} {decoded:>8} {elapsed:>10.2f} {drift:>16.3f}")
+
+            sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+            start = time.perf_counter()
+            frames = gif_maker.extract_frames_from_video(video_path, fps=args.fps)
+            elapsed = time.perf_counter() - start
+            sys.stdout = stdout
+            indices = gif_maker.sample_frame_indices(video_fps, total_frames, fps=args.fps)
+            drift = (len(indices) - 1) / args.fps - indices[-1] / video_fps
+            print(f"{source_fps:>8} {'sampled':>8} {len(frames):>8} {len(set(indices)):>8} {elapsed:>10.2f} {drift:>16.3f}")
+
+
+def bench_resize(args):
+    """测试不同并行进程数下resize_images的耗时和加速比"""
+    target_size = (args.target_width, args.target_height)
+    print(f"图片: {args.count}张 {args.width}x{args.height}, 目标大小: {target_size}, 填充模式: {args.fill_mode}")
+    print(f"{'进程数':>6} {'耗时(秒)':>10} {'加速比':>8}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = make_synthetic_images(tmp_dir, args.count, args.width, args.height)
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            frames = gif_maker.resize_images(paths, target_size, True, args.fill_mode, workers)
+            elapsed = time.perf_counter() - start
+            assert len(frames) == len(paths)
+            baseline = baseline or elapsed
+            print(f"{workers:>6} {elapsed:>10.2f} {baseline / elapsed:>8.2f}")
+
+
+def bench_palette(args):
+    """对比per-frame（原有方式）、global和adaptive调色板模式的耗时和文件大小"""
+    print(f"视频分辨率: {args.width}x{args.height}, 时长: {args.seconds}秒, 输出fps: {args.fps}")
+    print(f"{'调色板模式':>10} {'耗时(秒)':>10} {'加速比':>8} {'文件大小(KB)':>14}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = os.path.join(tmp_dir, 'synthetic.mp4')
+        make_synthetic_video(video_path, args.width, args.height, args.seconds)
+        baseline = None
+        for palette in gif_maker.PALETTE_MODES:
+            output_file = os.path.join(tmp_dir, f'{palette}.gif')
+            sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+            start = time.perf_counter()
+            gif_maker.create_gif_from_video(video_path, output_file, fps=args.fps, palette=palette)
+            elapsed = time.perf_counter() - start
+            sys.stdout = stdout
+            baseline = baseline or elapsed
+            print(f"{palette:>10} {elapsed:>10.2f} {baseline / elapsed:>8.2f} {os.path.getsize(output_file) / 1024:>14.1f}")
+
+
+def bench_delta(args):
+    """对比Pillow原有保存方式、全帧写入与帧间差分优化的耗时和文件大小"""
+    from PIL import Image
+
+    image_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_image')
+    image_files = sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir)) if os.path.isdir(image_dir) else []
+    datasets = []
+    if image_files:
+        target_size = Image.open(image_files[0]).size
+        sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+        datasets.append(('test_image', gif_maker.resize_images(image_files, target_size, True, 'center')))
+        sys.stdout = stdout
+    datasets.append(('screencast', make_synthetic_screencast(args.count, args.width, args.height)))
+
+    print(f"{'数据集':>12} {'写入方式':>10} {'帧数':>6} {'耗时(秒)':>10} {'文件大小(KB)':>14} {'大小比例':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, frames in datasets:
+            baseline = None
+            for mode in ('pillow', 'full', 'delta'):
+                output_file = os.path.join(tmp_dir, f'{name}_{mode}.gif')
+                start = time.perf_counter()
+                if mode == 'pillow':
+                    frames[0].save(output_file, format='GIF', append_images=frames[1:], save_all=True, duration=args.duration, loop=0)
+                else:
+                    writer = gif_maker.GifStreamWriter(output_file, args.duration, delta=(mode == 'delta'))
+                    for frame in frames:
+                        writer.write(frame)
+                    writer.close()
+                elapsed = time.perf_counter() - start
+                size = os.path.getsize(output_file)
+                baseline = baseline or size
+                print(f"{name:>12} {mode:>10} {len(frames):>6} {elapsed:>10.2f} {size / 1024:>14.1f} {size / baseline:>8.2f}")
+
+
+def bench_batch(args):
+    """对比每个任务单独启动一个gif_maker.py进程与batch子命令在不同进程数下的吞吐量"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gif_maker.py')
+    print(f"任务: {args.count}个，每个任务{args.frames}张 {args.width}x{args.height} 图片")
+    print(f"{'执行方式':>14} {'耗时(秒)':>10} {'吞吐量(个/秒)':>14} {'加速比':>8}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_dir = os.path.join(tmp_dir, 'images')
+        os.makedirs(image_dir)
+        make_synthetic_images(image_dir, args.frames, args.width, args.height)
+        jobs = [{'type': 'images', 'input': image_dir, 'output': os.path.join(tmp_dir, f'out_{i}.gif')} for i in range(args.count)]
+
+        start = time.perf_counter()
+        for job in jobs:
+            subprocess.run([sys.executable, script, 'images', '-i', job['input'], '-o', job['output']],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        baseline = time.perf_counter() - start
+        print(f"{'每任务一个进程':>14} {baseline:>10.2f} {args.count / baseline:>14.2f} {1:>8.2f}")
+
+        manifest = os.path.join(tmp_dir, 'manifest.jsonl')
+        with open(manifest, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(job) + '\n' for job in jobs)
+        for workers in args.workers:
+            start = time.perf_counter()
+            subprocess.run([sys.executable, script, 'batch', '-m', manifest, '-j', str(workers)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            elapsed = time.perf_counter() - start
+            print(f"{f'batch -j {workers}':>14} {elapsed:>10.2f} {args.count / elapsed:>14.2f} {baseline / elapsed:>8.2f}")
+
+
+def bench_append(args):
+    """对比目录中每新增一批图片后重新生成整个GIF与--append续写的耗时"""
+    from PIL import Image
+
+    print(f"初始图片: {args.frames}张 {args.width}x{args.height}，每次新增{args.batch}张，共{args.updates}次")
+    print(f"{'更新':>6} {'图片数':>8} {'重新生成(秒)':>12} {'续写(秒)':>10} {'加速比':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        staging = os.path.join(tmp_dir, 'staging')
+        live = os.path.join(tmp_dir, 'live')
+        os.makedirs(staging)
+        os.makedirs(live)
+        paths = make_synthetic_images(staging, args.frames + args.updates * args.batch, args.width, args.height)
+        full_file = os.path.join(tmp_dir, 'full.gif')
+        append_file = os.path.join(tmp_dir, 'append.gif')
+
+        def publish(batch):
+            for path in batch:
+                os.replace(path, os.path.join(live, os.path.basename(path)))
+
+        publish(paths[:args.frames])
+        with contextlib.redirect_stdout(io.StringIO()):
+            gif_maker.create_gif_from_directory(live, append_file, args.duration, append=True)
+        for update in range(args.updates):
+            start_index = args.frames + update * args.batch
+            publish(paths[start_index:start_index + args.batch])
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                gif_maker.create_gif_from_directory(live, full_file, args.duration)
+                full_time = time.perf_counter() - start
+                start = time.perf_counter()
+                gif_maker.create_gif_from_directory(live, append_file, args.duration, append=True)
+                append_time = time.perf_counter() - start
+            count = start_index + args.batch
+            print(f"{update + 1:>6} {count:>8} {full_time:>12.3f} {append_time:>10.3f} {full_time / append_time:>8.1f}")
+
+        with Image.open(full_file) as full, Image.open(append_file) as appended:
+            print(f"帧数: 重新生成 {full.n_frames}，续写 {appended.n_frames}；"
+                  f"文件大小: 重新生成 {os.path.getsize(full_file) / 1024:.1f}KB，续写 {os.path.getsize(append_file) / 1024:.1f}KB")
+
+
+def _legacy_transform(img, target_size, fill_mode):
+    """原有的调整大小方式：fill先缩放到比目标更大的中间图片再裁剪，center使用thumbnail"""
+    from PIL import Image
+
+    if fill_mode == 'center':
+        img = img.copy()
+        img.thumbnail(target_size, Image.Resampling.LANCZOS)
+        canvas = Image.new('RGBA', target_size, (255, 255, 255, 0))
+        canvas.paste(img, ((target_size[0] - img.width) // 2, (target_size[1] - img.height) // 2))
+        return canvas
+    img_ratio = img.width / img.height
+    if img_ratio > target_size[0] / target_size[1]:
+        new_width = int(target_size[1] * img_ratio)
+        img = img.resize((new_width, target_size[1]), Image.Resampling.LANCZOS)
+        left = (new_width - target_size[0]) // 2
+        return img.crop((left, 0, left + target_size[0], target_size[1]))
+    new_height = int(target_size[0] / img_ratio)
+    img = img.resize((target_size[0], new_height), Image.Resampling.LANCZOS)
+    top = (new_height - target_size[1]) // 2
+    return img.crop((0, top, target_size[0], top + target_size[1]))
+
+
+def bench_transform(args):
+    """对比原有调整大小方式与统一变换引擎（先确定裁剪框再缩放）在各重采样滤镜下的每帧CPU时间"""
+    from PIL import Image
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = make_synthetic_images(tmp_dir, 1, args.width, args.height)[0]
+        with Image.open(path) as img:
+            img.load()
+
+    print(f"源图片: {args.width}x{args.height}, 每个用例重复{args.repeat}次")
+    print(f"{'目标大小':>10} {'填充模式':>8} {'方式':>18} {'每帧CPU时间(毫秒)':>18} {'加速比':>8}")
+    for target in args.targets:
+        target_size = tuple(int(v) for v in target.split('x'))
+        for fill_mode in ('fill', 'center'):
+            cases = [('legacy lanczos', lambda: _legacy_transform(img, target_size, fill_mode))]
+            for resample in gif_maker.RESAMPLE_FILTERS:
+                cases.append((f'engine {resample}', lambda resample=resample: gif_maker.transform_image(img, target_size, True, fill_mode, resample)))
+            baseline = None
+            for name, func in cases:
+                start = time.process_time()
+                for _ in range(args.repeat):
+                    func()
+                per_frame = (time.process_time() - start) / args.repeat * 1000
+                baseline = baseline or per_frame
+                print(f"{target:>10} {fill_mode:>8} {name:>18} {per_frame:>18.2f} {baseline / per_frame:>8.2f}")
+
+
+def bench_videoframe(args):
+    """对比视频帧的调整大小阶段：lanczos和bilinear经过Image对象（Pillow缩放），area全程使用NumPy数组（cv2.resize）"""
+    import cv2
+    import numpy as np
+
+    # gif_maker只在处理视频时才导入cv2，这里直接调用内部函数，需要先导入
+    gif_maker._load_cv2()
+    target_size = (args.target_width, args.target_height)
+    print(f"视频分辨率: {args.width}x{args.height}, 目标大小: {target_size}, 帧数: {args.frames}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = os.path.join(tmp_dir, 'synthetic.mp4')
+        make_synthetic_video(video_path, args.width, args.height, args.frames / 30 + 1)
+        cap = cv2.VideoCapture(video_path)
+        frames = []
+        while len(frames) < args.frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+
+        print(f"{'填充模式':>8} {'方式':>16} {'每帧CPU时间(毫秒)':>18} {'加速比':>8}")
+        for fill_mode in ('fill', 'center'):
+            cases = [
+                # 优化阶段需要NumPy数组，因此Image路径的耗时包括np.asarray
+                ('pillow lanczos', lambda: [np.asarray(img) for img in gif_maker._iter_video_transformed(frames, target_size, True, fill_mode, 'lanczos')]),
+                ('pillow bilinear', lambda: [np.asarray(img) for img in gif_maker._iter_video_transformed(frames, target_size, True, fill_mode, 'bilinear')]),
+                ('numpy area', lambda: list(gif_maker._iter_video_transformed(frames, target_size, True, fill_mode, 'area'))),
+            ]
+            baseline = None
+            for name, func in cases:
+                start = time.process_time()
+                func()
+                per_frame = (time.process_time() - start) / len(frames) * 1000
+                baseline = baseline or per_frame
+                print(f"{fill_mode:>8} {name:>16} {per_frame:>18.2f} {baseline / per_frame:>8.2f}")
+
+        print(f"{'重采样滤镜':>10} {'整体耗时(秒)':>12}")
+        for resample in ('lanczos', 'area'):
+            sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+            start = time.perf_counter()
+            gif_maker.create_gif_from_video(video_path, os.path.join(tmp_dir, f'{resample}.gif'), fps=args.fps,
+                                            target_size=target_size, resample=resample)
+            elapsed = time.perf_counter() - start
+            sys.stdout = stdout
+            print(f"{resample:>10} {elapsed:>12.2f}")
+
+
+def bench_multi(args):
+    """对比每个尺寸单独调用create_gif_from_video与create_gifs_from_video一次解码生成全部尺寸的耗时"""
+    sizes = [_parse_size(text) for text in args.sizes]
+    print(f"视频分辨率: {args.width}x{args.height}, 时长: {args.seconds}秒, 输出{args.fps}fps, "
+          f"尺寸: {', '.join(f'{w}x{h}' for w, h in sizes)}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = os.path.join(tmp_dir, 'synthetic.mp4')
+        make_synthetic_video(video_path, args.width, args.height, args.seconds)
+        outputs = [{'output': os.path.join(tmp_dir, f'{w}x{h}.gif'), 'target_size': (w, h), 'fps': args.fps} for w, h in sizes]
+
+        print(f"{'方式':>10} {'耗时(秒)':>10} {'CPU时间(秒)':>12} {'解码耗时(秒)':>12} {'加速比':>8}")
+        baseline = None
+        for mode in ('separate', 'multi'):
+            progress = gif_maker.GifProgress()
+            start = time.perf_counter()
+            cpu_start = time.process_time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if mode == 'separate':
+                    for output in outputs:
+                        gif_maker.create_gif_from_video(video_path, output['output'], fps=args.fps, target_size=output['target_size'], progress=progress)
+                else:
+                    gif_maker.create_gifs_from_video(video_path, outputs, progress=progress)
+            elapsed = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+            baseline = baseline or elapsed
+            print(f"{mode:>10} {elapsed:>10.2f} {cpu:>12.2f} {progress.stage_times.get('解码', 0):>12.2f} {baseline / elapsed:>8.2f}")
+
+
+def bench_spool(args):
+    """对比帧缓冲与原有做法：extract_frames_from_video的峰值内存，以及global调色板模式的耗时"""
+    target_size = (args.target_width, args.target_height)
+    print(f"视频分辨率: {args.width}x{args.height}, 时长: {args.seconds}秒, 输出{args.fps}fps, 目标大小: {target_size}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = os.path.join(tmp_dir, 'synthetic.mp4')
+        make_synthetic_video(video_path, args.width, args.height, args.seconds)
+        spool_dir = os.path.join(tmp_dir, 'spool')
+        output_file = os.path.join(tmp_dir, 'output.gif')
+        cases = [
+            ('extract', 'memory', 'extract_frames_from_video', {}),
+            ('extract', 'spool', 'extract_frames_from_video', {'spool_dir': spool_dir}),
+            ('global', 'sample', 'create_gif_from_video', {'palette': 'global'}),
+            ('global', 'spool', 'create_gif_from_video', {'palette': 'global', 'spool_dir': spool_dir}),
+        ]
+        print(f"{'用例':>8} {'方式':>8} {'耗时(秒)':>10} {'峰值内存(MB)':>14} {'文件大小(KB)':>14}")
+        for name, mode, function, kwargs in cases:
+            call_args = [video_path, output_file] if function == 'create_gif_from_video' else [video_path]
+            record = run_suite_case(function, call_args, dict(kwargs, fps=args.fps, target_size=target_size),
+                                    output_file if function == 'create_gif_from_video' else None)
+            if record.get('error'):
+                print(f"{name:>8} {mode:>8} 出错: {record['error']}")
+                continue
+            size = f"{record['output_bytes'] / 1024:.1f}" if 'output_bytes' in record else '-'
+            peak = f"{record['peak_rss_mb']:.1f}" if record['peak_rss_mb'] is not None else "N/A"
+            print(f"{name:>8} {mode:>8} {record['elapsed']:>10.2f} {peak:>14} {size:>14}")
+
+
+def _legacy_fit_max_bytes(video_path, output_file, max_bytes, fps, target_size):
+    """原有做法：完整编码，超出大小上限时把尺寸缩小到0.85倍再重新编码，返回编码次数"""
+    attempts = 0
+    while True:
+        attempts += 1
+        gif_maker.create_gif_from_video(video_path, output_file, fps=fps, target_size=target_size)
+        if os.path.getsize(output_file) <= max_bytes or min(target_size) <= gif_maker.MIN_OUTPUT_SIZE:
+            return attempts
+        target_size = tuple(max(gif_maker.MIN_OUTPUT_SIZE, int(side * 0.85)) for side in target_size)
+
+
+def bench_encode(args):
+    """对比GifStreamWriter在当前线程中逐帧LZW编码与使用进程池并行编码的耗时，并检查输出是否完全相同"""
+    import hashlib
+    import numpy as np
+    from PIL import Image, ImageSequence
+
+    # 带噪声的自然画面：LZW编码的耗时与图像数据的熵有关，噪声越多越慢
+    rng = np.random.default_rng(0)
+    base = np.dstack([np.tile(np.linspace(0, 255, args.width, dtype=np.uint8), (args.height, 1))] * 3)
+    quantizer = gif_maker.GifFrameQuantizer('per-frame')
+    frames = []
+    for i in range(args.count):
+        noise = rng.integers(0, 48, (args.height, args.width, 3), dtype=np.uint8)
+        frames.append(quantizer.quantize(Image.fromarray(np.roll(base, i * 16, axis=1) + noise), (0, 0), args.duration, 0))
+
+    print(f"帧: {args.width}x{args.height}, {args.count}帧（已量化，只测试编码和写入），CPU核心数: {os.cpu_count()}")
+    print(f"{'编码进程数':>10} {'耗时(秒)':>10} {'加速比':>8} {'文件大小(KB)':>14} {'与逐帧编码相同':>14}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        baseline = digest = None
+        for workers in args.workers:
+            output_file = os.path.join(tmp_dir, f'encode_{workers}.gif')
+            start = time.perf_counter()
+            with gif_maker.GifStreamWriter(output_file, args.duration, encode_workers=workers) as writer:
+                for frame in frames:
+                    writer.write_quantized(*frame)
+            elapsed = time.perf_counter() - start
+            with open(output_file, 'rb') as f:
+                current = hashlib.sha256(f.read()).hexdigest()
+            if baseline is None:
+                baseline, digest, first_file = elapsed, current, output_file
+            print(f"{workers:>10} {elapsed:>10.2f} {baseline / elapsed:>8.2f} {os.path.getsize(output_file) / 1024:>14.1f} {'是' if current == digest else '否':>14}")
+
+        # 用Pillow解码第一个输出，逐帧与量化后的画面比较
+        with Image.open(first_file) as img:
+            decoded = [np.asarray(frame.convert('RGB')) for frame in ImageSequence.Iterator(img)]
+        matched = len(decoded) == len(frames) and all(
+            np.array_equal(pixels, np.asarray(frame[0].convert('RGB'))) for pixels, frame in zip(decoded, frames))
+        print(f"Pillow解码结果与量化后的帧{'一致' if matched else '不一致'}")
+
+
+def bench_formats(args):
+    """对比GIF（per-frame和global调色板）、动画WebP与APNG输出的耗时、编码耗时和文件大小"""
+    cases = [('gif', 'gif', 'per-frame'), ('gif global', 'gif', 'global'), ('webp', 'webp', 'per-frame'), ('apng', 'apng', 'per-frame')]
+    target_size = (args.target_width, args.target_height)
+    print(f"视频: {args.width}x{args.height}, {args.seconds}秒 -> {target_size[0]}x{target_size[1]}, {args.fps}fps；"
+          f"屏幕录制: {args.count}帧 {args.target_width}x{args.target_height}；WebP质量: {args.quality}")
+    print(f"{'数据集':>12} {'格式':>12} {'耗时(秒)':>10} {'编码耗时(秒)':>12} {'文件大小(KB)':>14} {'大小比例':>8}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = os.path.join(tmp_dir, 'synthetic.mp4')
+        make_synthetic_video(video_path, args.width, args.height, args.seconds)
+        image_dir = os.path.join(tmp_dir, 'screencast')
+        os.makedirs(image_dir)
+        for index, frame in enumerate(make_synthetic_screencast(args.count, args.target_width, args.target_height)):
+            frame.save(os.path.join(image_dir, f'{index:05d}.png'))
+
+        for dataset in ('video', 'screencast'):
+            baseline = None
+            for name, output_format, palette in cases:
+                output_file = os.path.join(tmp_dir, f"{dataset}_{name.replace(' ', '_')}.{output_format}")
+                progress = gif_maker.GifProgress()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if dataset == 'video':
+                        gif_maker.create_gif_from_video(video_path, output_file, fps=args.fps, target_size=target_size, palette=palette,
+                                                        progress=progress, output_format=output_format, quality=args.quality)
+                    else:
+                        gif_maker.create_gif_from_directory(image_dir, output_file, 1000 // args.fps, palette=palette,
+                                                            progress=progress, output_format=output_format, quality=args.quality)
+                elapsed = time.perf_counter() - start
+                size = os.path.getsize(output_file)
+                baseline = baseline or size
+                encode = progress.stage_times.get('编码', 0) + progress.stage_times.get('写入', 0)
+                print(f"{dataset:>12} {name:>12} {elapsed:>10.2f} {encode:>12.2f} {size / 1024:>14.1f} {size / baseline:>8.2f}")
+
+
+def bench_outputcache(args):
+    """对比不使用输出缓存、缓存未命中（生成并写入缓存）与命中时的耗时，并检查命中时的输出是否与生成的完全相同"""
+    import filecmp
+
+    print(f"视频: {args.width}x{args.height}, {args.seconds}秒，输出{args.fps}fps；图片: {args.count}张 {args.width}x{args.height}")
+    print(f"{'任务':>8} {'方式':>10} {'耗时(毫秒)':>12} {'文件大小(KB)':>14} {'输出相同':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = os.path.join(tmp_dir, 'synthetic.mp4')
+        make_synthetic_video(video_path, args.width, args.height, args.seconds)
+        image_dir = os.path.join(tmp_dir, 'images')
+        os.makedirs(image_dir)
+        make_synthetic_images(image_dir, args.count, args.width, args.height)
+        tasks = [
+            ('video', gif_maker.create_gif_from_video, video_path, {'fps': args.fps}),
+            ('images', gif_maker.create_gif_from_directory, image_dir, {}),
+        ]
+        for kind, function, source, kwargs in tasks:
+            cache = gif_maker.OutputCache(os.path.join(tmp_dir, f'cache_{kind}'))
+            baseline = os.path.join(tmp_dir, f'{kind}_plain.gif')
+            cases = [('无缓存', baseline, None), ('未命中', os.path.join(tmp_dir, f'{kind}_miss.gif'), cache)]
+            cases += [('命中', os.path.join(tmp_dir, f'{kind}_hit{index}.gif'), cache) for index in range(args.repeat)]
+            for mode, output_file, output_cache in cases:
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    function(source, output_file, output_cache=output_cache, **kwargs)
+                elapsed = time.perf_counter() - start
+                same = '是' if filecmp.cmp(baseline, output_file, shallow=False) else '否'
+                print(f"{kind:>8} {mode:>10} {elapsed * 1000:>12.1f} {os.path.getsize(output_file) / 1024:>14.1f} {same:>8}")
+
+
+def bench_segments(args):
+    """对比逐段调用create_gif_from_video与一遍读取所有片段（--segments和--split-segments）的解码和总耗时，并检查每段单独输出的结果是否相同"""
+    import filecmp
+
+    segments = gif_maker.resolve_segments(args.segments)
+    target_size = (args.target_width, args.target_height)
+    print(f"视频: {args.width}x{args.height}, {args.seconds}秒，片段: {args.segments}，输出{args.fps}fps, 目标大小: {target_size}")
+    print(f"{'方式':>16} {'输出文件数':>10} {'帧数':>6} {'解码(秒)':>10} {'总耗时(秒)':>10} {'与逐段调用相同':>14}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = os.path.join(tmp_dir, 'synthetic.mp4')
+        make_synthetic_video(video_path, args.width, args.height, args.seconds)
+        separate = [os.path.join(tmp_dir, f'separate_{index}.gif') for index in range(len(segments))]
+        split = [os.path.join(tmp_dir, f'split_{index}.gif') for index in range(len(segments))]
+        joined = os.path.join(tmp_dir, 'joined.gif')
+
+        def run(name, call, outputs, compare=None):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                progresses = call()
+            elapsed = time.perf_counter() - start
+            frames = sum(progress.frames for progress in progresses)
+            decode = sum(progress.stage_times.get('解码', 0) for progress in progresses)
+            same = '-' if compare is None else ('是' if all(filecmp.cmp(a, b, shallow=False) for a, b in zip(outputs, compare)) else '否')
+            print(f"{name:>16} {len(outputs):>10} {frames:>6} {decode:>10.2f} {elapsed:>10.2f} {same:>14}")
+
+        def call_separate():
+            # 每次调用都重新打开视频并定位到片段开始处
+            progresses = []
+            for (start, end), output_file in zip(segments, separate):
+                progresses.append(gif_maker.GifProgress())
+                gif_maker.create_gif_from_video(video_path, output_file, start, end, args.fps, target_size=target_size, progress=progresses[-1])
+            return progresses
+
+        def call_split():
+            progress = gif_maker.GifProgress()
+            outputs = [{'output': output_file, 'fps': args.fps, 'target_size': target_size, 'segments': [segment]} for segment, output_file in zip(segments, split)]
+            gif_maker.create_gifs_from_video(video_path, outputs, progress=progress)
+            return [progress]
+
+        def call_joined():
+            progress = gif_maker.GifProgress()
+            gif_maker.create_gif_from_video(video_path, joined, fps=args.fps, target_size=target_size, progress=progress, segments=segments)
+            return [progress]
+
+        run('逐段调用', call_separate, separate)
+        run('--split-segments', call_split, split, separate)
+        run('--segments', call_joined, [joined])
+
+
+def _percentile(values, q):
+    """返回values的q分位数（0-1，取最接近的秩）"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def bench_serve(args):
+    """对比每个请求启动一个gif_maker.py进程与serve渲染服务生成小GIF的延迟，以及相同并发请求的合并"""
+    import threading
+    import urllib.request
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gif_maker.py')
+    print(f"请求: 每种方式{args.requests}个，图片任务{args.frames}张 {args.width}x{args.height}，"
+          f"视频任务{args.width}x{args.height} 1秒；服务使用{args.workers}个工作进程")
+    print(f"{'任务':>8} {'执行方式':>14} {'p50(毫秒)':>10} {'p99(毫秒)':>10} {'平均(毫秒)':>10}")
+
+    def report(kind, mode, latencies):
+        latencies = [value * 1000 for value in latencies]
+        print(f"{kind:>8} {mode:>14} {_percentile(latencies, 0.5):>10.1f} {_percentile(latencies, 0.99):>10.1f} {sum(latencies) / len(latencies):>10.1f}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_dir = os.path.join(tmp_dir, 'images')
+        os.makedirs(image_dir)
+        make_synthetic_images(image_dir, args.frames, args.width, args.height)
+        video_path = os.path.join(tmp_dir, 'small.mp4')
+        make_synthetic_video(video_path, args.width, args.height, 1)
+        jobs = {
+            'images': {'type': 'images', 'input': image_dir, 'output': os.path.join(tmp_dir, 'images.gif')},
+            'video': {'type': 'video', 'input': video_path, 'output': os.path.join(tmp_dir, 'video.gif')},
+        }
+
+        for kind, job in jobs.items():
+            latencies = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, script, job['type'], '-i', job['input'], '-o', job['output']],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+                latencies.append(time.perf_counter() - start)
+            report(kind, '每请求一个进程', latencies)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            server = gif_maker.create_render_server(port=0, workers=args.workers)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f'http://127.0.0.1:{server.server_address[1]}/render'
+
+            def post(job):
+                request = urllib.request.Request(url, data=json.dumps(job).encode('utf-8'), method='POST')
+                with urllib.request.urlopen(request) as response:
+                    return json.loads(response.read())
+
+            try:
+                results = {}
+                for kind, job in jobs.items():
+                    latencies = []
+                    for _ in range(args.requests):
+                        start = time.perf_counter()
+                        post(job)
+                        latencies.append(time.perf_counter() - start)
+                    results[kind] = latencies
+
+                # 同时发出多个相同的视频请求
+                burst = []
+                threads = [threading.Thread(target=lambda: burst.append(post(jobs['video']))) for _ in range(args.burst)]
+                renders = server.service.stats['renders']
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                renders = server.service.stats['renders'] - renders
+            finally:
+                server.shutdown()
+                server.server_close()
+                server.service.close()
+        for kind, latencies in results.items():
+            report(kind, 'serve', latencies)
+        print(f"{args.burst}个同时到达的相同请求: 实际渲染{renders}次，合并{sum(1 for record in burst if record['coalesced'])}个，"
+              f"成功{sum(1 for record in burst if record['success'])}个")
+
+
+def bench_maxbytes(args):
+    """对比反复缩小重试与--max-bytes先估算再编码的耗时、完整编码次数和估算误差"""
+    target_size = (args.width, args.height)
+    print(f"视频分辨率: {args.width}x{args.height}, 时长: {args.seconds}秒, 输出{args.fps}fps")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = os.path.join(tmp_dir, 'synthetic.mp4')
+        make_synthetic_video(video_path, args.width, args.height, args.seconds)
+        output_file = os.path.join(tmp_dir, 'output.gif')
+
+        print(f"{'大小上限(KB)':>12} {'方式':>10} {'编码次数':>8} {'耗时(秒)':>10} {'文件大小(KB)':>14} {'估算误差':>8}")
+        for max_bytes in args.max_bytes:
+            for mode in ('retry', 'max-bytes'):
+                log = io.StringIO()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(log):
+                    if mode == 'retry':
+                        attempts = _legacy_fit_max_bytes(video_path, output_file, max_bytes, args.fps, target_size)
+                    else:
+                        gif_maker.create_gif_from_video(video_path, output_file, fps=args.fps, target_size=target_size, max_bytes=max_bytes)
+                        attempts = log.getvalue().count('成功创建GIF')
+                elapsed = time.perf_counter() - start
+                errors = re.findall(r'误差: ([+-][\d.]+%)', log.getvalue())
+                size = os.path.getsize(output_file) if os.path.exists(output_file) else 0
+                print(f"{max_bytes / 1024:>12.0f} {mode:>10} {attempts:>8} {elapsed:>10.2f} {size / 1024:>14.1f} {errors[-1] if errors else '-':>8}")
+
+
+# suite结果JSON的格式版本
+SUITE_FORMAT_VERSION = 1
+
+# compare检查的指标
+SUITE_METRICS = ('elapsed', 'cpu', 'peak_rss_mb')
+# 等待suite用例子进程回传结果时，每隔该时长（秒）检查一次子进程是否已经退出
+SUITE_POLL_SECONDS = 1.0
+
+
+def _time_command(cmd, repeat):
+    """运行命令repeat次，返回最短和中位耗时（秒）"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def bench_startup(args):
+    """对比启动时导入cv2（旧行为）与按需导入时images子命令的冷启动耗时"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gif_maker.py')
+    # 旧版在导入gif_maker时就导入cv2和asyncio，先导入它们再运行脚本即可模拟
+    eager = ("import sys, runpy, cv2, asyncio; sys.argv = sys.argv[1:]; "
+             "runpy.run_path(sys.argv[0], run_name='__main__')")
+    loaded = subprocess.run([sys.executable, '-c', "import sys, gif_maker; print('cv2' in sys.modules)"],
+                            capture_output=True, text=True, check=True).stdout.strip()
+    print(f"导入gif_maker后cv2已加载: {loaded}")
+    print(f"{'命令':>16} {'方式':>8} {'最短(毫秒)':>10} {'中位(毫秒)':>10}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_dir = os.path.join(tmp_dir, 'images')
+        os.makedirs(image_dir)
+        make_synthetic_images(image_dir, args.frames, args.width, args.height)
+        output_file = os.path.join(tmp_dir, 'out.gif')
+        commands = [
+            ('--help', ['--help']),
+            ('images', ['images', '-i', image_dir, '-o', output_file]),
+        ]
+        for name, command_args in commands:
+            results = {}
+            for mode, prefix in (('eager', [sys.executable, '-c', eager, script]), ('lazy', [sys.executable, script])):
+                results[mode] = _time_command(prefix + command_args, args.repeat)
+                best, median = results[mode]
+                print(f"{name:>16} {mode:>8} {best * 1000:>10.1f} {median * 1000:>10.1f}")
+            saved = results['eager'][1] - results['lazy'][1]
+            print(f"{name:>16} {'节省':>8} {'':>10} {saved * 1000:>10.1f}")
+
+
+def _parse_size(text):
+    """把'宽x高'解析为(宽, 高)"""
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def _run_suite_case(function, call_args, call_kwargs, output_file, queue):
+    """子进程入口：调用gif_maker中的一个函数并回传耗时、CPU时间、峰值内存和输出大小，出错时回传错误信息"""
+    try:
+        sys.stdout = open(os.devnull, 'w')
+        rss_start = peak_rss_mb()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        result = getattr(gif_maker, function)(*call_args, **call_kwargs)
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        record = {
+            'elapsed': elapsed,
+            'cpu': cpu,
+            'peak_rss_mb': peak_rss_mb(),
+            'rss_start_mb': rss_start,
+            'success': bool(result),
+        }
+        if isinstance(result, list):
+            record['frames'] = len(result)
+        elif output_file and os.path.exists(output_file):
+            record['output_bytes'] = os.path.getsize(output_file)
+    except BaseException as e:
+        record = _failed_suite_record(f"{type(e).__name__}: {e}")
+    queue.put(record)
+
+
+def _failed_suite_record(error):
+    """返回出错的suite用例的测量结果，各项指标为None"""
+    return {'elapsed': None, 'cpu': None, 'peak_rss_mb': None, 'success': False, 'error': error}
+
+
+def run_suite_case(function, call_args, call_kwargs, output_file=None):
+    """
+    在新启动（spawn）的子进程中运行一个suite用例，峰值内存不受父进程已占用内存的影响
+
+    返回:
+        dict: 用例的测量结果，用例出错或子进程异常退出时success为False，error为错误信息，各项指标为None
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    proc = context.Process(target=_run_suite_case, args=(function, call_args, call_kwargs, output_file, queue))
+    proc.start()
+    try:
+        while True:
+            try:
+                return queue.get(timeout=SUITE_POLL_SECONDS)
+            except queue_module.Empty:
+                if proc.is_alive():
+                    continue
+            # 子进程已经退出：结果可能刚好在退出前写入，再取一次
+            try:
+                return queue.get(timeout=SUITE_POLL_SECONDS)
+            except queue_module.Empty:
+                return _failed_suite_record(f"子进程异常退出，退出码 {proc.exitcode}")
+    finally:
+        proc.join()
+
+
+def _suite_cases(args, tmp_dir):
+    """
+    生成合成数据集并列出suite的全部用例
+
+    生成:
+        tuple: (用例名称, 函数名, 位置参数, 关键字参数, 输出文件路径, 参数说明)
+    """
+    target_size = _parse_size(args.target)
+    for size in args.image_sizes:
+        width, height = _parse_size(size)
+        dataset = f'images_{width}x{height}x{args.image_count}'
+        image_dir = os.path.join(tmp_dir, dataset)
+        os.makedirs(image_dir)
+        paths = make_synthetic_images(image_dir, args.image_count, width, height)
+        params = {'width': width, 'height': height, 'frames': args.image_count}
+        output_file = os.path.join(tmp_dir, f'{dataset}.gif')
+        yield f'create_gif/{dataset}', 'create_gif', (paths, output_file), {}, output_file, params
+        for variant, keep_aspect_ratio, fill_mode in (('fill', True, 'fill'), ('center', True, 'center'), ('stretch', False, 'fill')):
+            yield (f'create_gif_with_resize[{variant}]/{dataset}', 'create_gif_with_resize', (paths, output_file),
+                   {'target_size': target_size, 'keep_aspect_ratio': keep_aspect_ratio, 'fill_mode': fill_mode, 'workers': args.workers},
+                   output_file, dict(params, target=args.target, fill_mode=variant, workers=args.workers))
+
+    for size in args.video_sizes:
+        width, height = _parse_size(size)
+        for seconds in args.video_seconds:
+            dataset = f'video_{width}x{height}x{seconds:g}s'
+            video_path = os.path.join(tmp_dir, f'{dataset}.mp4')
+            make_synthetic_video(video_path, width, height, seconds)
+            params = {'width': width, 'height': height, 'seconds': seconds, 'fps': args.fps, 'target': args.target}
+            output_file = os.path.join(tmp_dir, f'{dataset}.gif')
+            yield (f'extract_frames_from_video/{dataset}', 'extract_frames_from_video', (video_path,),
+                   {'fps': args.fps, 'target_size': target_size}, None, params)
+            yield (f'create_gif_from_video/{dataset}', 'create_gif_from_video', (video_path, output_file),
+                   {'fps': args.fps, 'target_size': target_size}, output_file, params)
+
+
+def _git_commit():
+    """返回当前代码的git提交号，不在git仓库中时返回None"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(args):
+    """在合成图片和视频上测试各个入口函数的耗时和峰值内存，并把结果写入JSON文件"""
+    results = []
+    print(f"{'用例':<52} {'耗时(秒)':>10} {'CPU(秒)':>10} {'峰值内存(MB)':>14}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, function, call_args, call_kwargs, output_file, params in _suite_cases(args, tmp_dir):
+            if args.filter and not any(pattern in name for pattern in args.filter):
+                continue
+            runs = [run_suite_case(function, call_args, call_kwargs, output_file) for _ in range(args.repeat)]
+            failed = next((run for run in runs if run.get('error')), None)
+            if failed is not None:
+                results.append(dict(failed, name=name, function=function, params=params))
+                print(f"{name:<52} 出错: {failed['error']}")
+                continue
+            # 取耗时最短的一次，减少其他进程干扰
+            record = dict(min(runs, key=lambda run: run['elapsed']), name=name, function=function, params=params,
+                          runs=[run['elapsed'] for run in runs])
+            results.append(record)
+            peak = f"{record['peak_rss_mb']:.1f}" if record['peak_rss_mb'] is not None else "N/A"
+            print(f"{name:<52} {record['elapsed']:>10.2f} {record['cpu']:>10.2f} {peak:>14}")
+
+    report = {
+        'version': SUITE_FORMAT_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {args.output}")
+
+
+def bench_compare(args):
+    """
+    对比两次suite的结果，任一用例的指标比基准增加超过阈值时视为性能回退
+
+    返回:
+        int: 进程退出状态，有回退时为1
+    """
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = {record['name']: record for record in json.load(f)['results']}
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)['results']
+
+    regressions = 0
+    print(f"{'用例':<52} {'指标':>12} {'基准':>10} {'当前':>10} {'比例':>8}")
+    for record in current:
+        base = baseline.get(record['name'])
+        if base is None:
+            print(f"{record['name']:<52} {'(新用例)':>12}")
+            continue
+        if record.get('error'):
+            # 当前结果中出错的用例视为回退
+            regressions += 1
+            print(f"{record['name']:<52} {'出错':>12}  {record['error']}")
+            continue
+        for metric in args.metrics:
+            old, new = base.get(metric), record.get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            regressed = ratio > 1 + args.threshold
+            regressions += regressed
+            print(f"{record['name']:<52} {metric:>12} {old:>10.2f} {new:>10.2f} {ratio:>8.2f}{'  <- 回退' if regressed else ''}")
+    print(f"共 {regressions} 项指标超出阈值 {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GIF Maker性能基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True, help='测试项目')
+
+    mem_parser = subparsers.add_parser('memory', help='视频转GIF的峰值内存测试')
+    mem_parser.add_argument('--width', type=int, default=1280, help='合成视频宽度，默认1280')
+    mem_parser.add_argument('--height', type=int, default=720, help='合成视频高度，默认720')
+    mem_parser.add_argument('--seconds', type=float, nargs='+', default=[5, 20], help='合成视频时长列表（秒），默认5 20')
+    mem_parser.add_argument('--fps', type=float, default=10, help='输出fps，默认10')
+    mem_parser.add_argument('--target-width', type=int, help='输出宽度')
+    mem_parser.add_argument('--target-height', type=int, help='输出高度')
+
+    sampling_parser = subparsers.add_parser('sampling', help='视频抽帧的取出帧数和耗时测试')
+    sampling_parser.add_argument('--width', type=int, default=1280, help='合成视频宽度，默认1280')
+    sampling_parser.add_argument('--height', type=int, default=720, help='合成视频高度，默认720')
+    sampling_parser.add_argument('--seconds', type=float, default=20, help='合成视频时长（秒），默认20')
+    sampling_parser.add_argument('--source-fps', type=float, nargs='+', default=[60, 29.97], help='合成视频帧率列表，默认60 29.97')
+    sampling_parser.add_argument('--fps', type=float, default=10, help='输出fps，默认10')
+
+    resize_parser = subparsers.add_parser('resize', help='并行调整图片大小的耗时测试')
+    resize_parser.add_argument('--count', type=int, default=64, help='图片数量，默认64')
+    resize_parser.add_argument('--width', type=int, default=3840, help='图片宽度，默认3840')
+    resize_parser.add_argument('--height', type=int, default=2160, help='图片高度，默认2160')
+    resize_parser.add_argument('--target-width', type=int, default=640, help='目标宽度，默认640')
+    resize_parser.add_argument('--target-height', type=int, default=360, help='目标高度，默认360')
+    resize_parser.add_argument('--fill-mode', choices=['center', 'fill'], default='fill', help='填充模式，默认fill')
+    resize_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1], help='要测试的进程数列表')
+
+    palette_parser = subparsers.add_parser('palette', help='调色板模式的耗时和文件大小测试')
+    palette_parser.add_argument('--width', type=int, default=1280, help='合成视频宽度，默认1280')
+    palette_parser.add_argument('--height', type=int, default=720, help='合成视频高度，默认720')
+    palette_parser.add_argument('--seconds', type=float, default=10, help='合成视频时长（秒），默认10')
+    palette_parser.add_argument('--fps', type=float, default=10, help='输出fps，默认10')
+
+    delta_parser = subparsers.add_parser('delta', help='帧间差分优化的耗时和文件大小测试')
+    delta_parser.add_argument('--count', type=int, default=120, help='合成屏幕录制的帧数，默认120')
+    delta_parser.add_argument('--width', type=int, default=1280, help='合成屏幕录制宽度，默认1280')
+    delta_parser.add_argument('--height', type=int, default=720, help='合成屏幕录制高度，默认720')
+    delta_parser.add_argument('--duration', type=int, default=100, help='每帧持续时间（毫秒），默认100')
+
+    batch_parser = subparsers.add_parser('batch', help='批量任务的吞吐量测试')
+    batch_parser.add_argument('--count', type=int, default=50, help='任务数量，默认50')
+    batch_parser.add_argument('--frames', type=int, default=5, help='每个任务的图片数量，默认5')
+    batch_parser.add_argument('--width', type=int, default=320, help='图片宽度，默认320')
+    batch_parser.add_argument('--height', type=int, default=240, help='图片高度，默认240')
+    batch_parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1], help='要测试的batch进程数列表')
+
+    append_parser = subparsers.add_parser('append', help='增量更新GIF的耗时测试')
+    append_parser.add_argument('--frames', type=int, default=300, help='初始图片数量，默认300')
+    append_parser.add_argument('--batch', type=int, default=1, help='每次新增的图片数量，默认1')
+    append_parser.add_argument('--updates', type=int, default=5, help='更新次数，默认5')
+    append_parser.add_argument('--width', type=int, default=640, help='图片宽度，默认640')
+    append_parser.add_argument('--height', type=int, default=480, help='图片高度，默认480')
+    append_parser.add_argument('--duration', type=int, default=100, help='每帧持续时间（毫秒），默认100')
+
+    transform_parser = subparsers.add_parser('transform', help='调整大小的每帧CPU时间测试')
+    transform_parser.add_argument('--width', type=int, default=1920, help='源图片宽度，默认1920')
+    transform_parser.add_argument('--height', type=int, default=1080, help='源图片高度，默认1080')
+    transform_parser.add_argument('--targets', nargs='+', default=['480x270', '400x400', '270x480'], help='目标大小列表（宽x高），默认480x270 400x400 270x480')
+    transform_parser.add_argument('--repeat', type=int, default=20, help='每个用例的重复次数，默认20')
+
+    videoframe_parser = subparsers.add_parser('videoframe', help='视频帧调整大小阶段的耗时测试')
+    videoframe_parser.add_argument('--width', type=int, default=1920, help='合成视频宽度，默认1920')
+    videoframe_parser.add_argument('--height', type=int, default=1080, help='合成视频高度，默认1080')
+    videoframe_parser.add_argument('--frames', type=int, default=60, help='测试的帧数，默认60')
+    videoframe_parser.add_argument('--target-width', type=int, default=480, help='目标宽度，默认480')
+    videoframe_parser.add_argument('--target-height', type=int, default=270, help='目标高度，默认270')
+    videoframe_parser.add_argument('--fps', type=float, default=10, help='整体耗时测试的输出fps，默认10')
+
+    select_parser = subparsers.add_parser('select', help='adaptive帧选择的帧数、耗时和文件大小测试')
+    select_parser.add_argument('--width', type=int, default=1280, help='合成视频宽度，默认1280')
+    select_parser.add_argument('--height', type=int, default=720, help='合成视频高度，默认720')
+    select_parser.add_argument('--seconds', type=float, default=30, help='合成视频时长（秒），默认30')
+    select_parser.add_argument('--still', type=float, default=2.0, help='每个静止片段的时长（秒），默认2')
+    select_parser.add_argument('--motion', type=float, default=1.0, help='每个运动片段的时长（秒），默认1')
+    select_parser.add_argument('--fps', type=float, default=10, help='输出fps，默认10')
+    select_parser.add_argument('--threshold', type=float, default=gif_maker.SELECT_DUPLICATE_THRESHOLD, help='重复帧阈值，默认与gif_maker相同')
+    select_parser.add_argument('--boost', type=int, nargs='+', default=[1, 3], help='要测试的scene_boost列表，默认1 3')
+
+    multi_parser = subparsers.add_parser('multi', help='一次解码生成多个尺寸的耗时测试')
+    multi_parser.add_argument('--width', type=int, default=1920, help='合成视频宽度，默认1920')
+    multi_parser.add_argument('--height', type=int, default=1080, help='合成视频高度，默认1080')
+    multi_parser.add_argument('--seconds', type=float, default=10, help='合成视频时长（秒），默认10')
+    multi_parser.add_argument('--fps', type=float, default=10, help='输出fps，默认10')
+    multi_parser.add_argument('--sizes', nargs='+', default=['160x90', '480x270', '960x540'], help='输出尺寸列表，格式为宽x高，默认160x90 480x270 960x540')
+
+    spool_parser = subparsers.add_parser('spool', help='帧缓冲的峰值内存和耗时测试')
+    spool_parser.add_argument('--width', type=int, default=1920, help='合成视频宽度，默认1920')
+    spool_parser.add_argument('--height', type=int, default=1080, help='合成视频高度，默认1080')
+    spool_parser.add_argument('--seconds', type=float, default=20, help='合成视频时长（秒），默认20')
+    spool_parser.add_argument('--fps', type=float, default=10, help='输出fps，默认10')
+    spool_parser.add_argument('--target-width', type=int, default=1280, help='目标宽度，默认1280')
+    spool_parser.add_argument('--target-height', type=int, default=720, help='目标高度，默认720')
+
+    encode_parser = subparsers.add_parser('encode', help='并行LZW编码的耗时测试')
+    encode_parser.add_argument('--width', type=int, default=1920, help='帧宽度，默认1920')
+    encode_parser.add_argument('--height', type=int, default=1080, help='帧高度，默认1080')
+    encode_parser.add_argument('--count', type=int, default=30, help='帧数，默认30')
+    encode_parser.add_argument('--duration', type=int, default=100, help='每帧延迟（毫秒），默认100')
+    encode_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='要测试的编码进程数列表，默认1 2 4')
+
+    formats_parser = subparsers.add_parser('formats', help='GIF、动画WebP和APNG的耗时和文件大小测试')
+    formats_parser.add_argument('--width', type=int, default=1280, help='合成视频宽度，默认1280')
+    formats_parser.add_argument('--height', type=int, default=720, help='合成视频高度，默认720')
+    formats_parser.add_argument('--seconds', type=float, default=10, help='合成视频时长（秒），默认10')
+    formats_parser.add_argument('--fps', type=int, default=10, help='输出fps，默认10')
+    formats_parser.add_argument('--target-width', type=int, default=640, help='输出宽度，默认640')
+    formats_parser.add_argument('--target-height', type=int, default=360, help='输出高度，默认360')
+    formats_parser.add_argument('--count', type=int, default=60, help='屏幕录制的帧数，默认60')
+    formats_parser.add_argument('--quality', type=int, default=gif_maker.WEBP_QUALITY, help='WebP质量，默认与gif_maker相同')
+
+    serve_parser = subparsers.add_parser('serve', help='渲染服务与每请求一个进程的延迟测试')
+    serve_parser.add_argument('--requests', type=int, default=20, help='每种方式的请求数，默认20')
+    serve_parser.add_argument('--frames', type=int, default=5, help='图片任务的图片数量，默认5')
+    serve_parser.add_argument('--width', type=int, default=160, help='图片和视频宽度，默认160')
+    serve_parser.add_argument('--height', type=int, default=90, help='图片和视频高度，默认90')
+    serve_parser.add_argument('--workers', type=int, default=2, help='服务的工作进程数，默认2')
+    serve_parser.add_argument('--burst', type=int, default=8, help='同时发出的相同请求数，默认8')
+
+    outputcache_parser = subparsers.add_parser('outputcache', help='输出缓存命中与未命中的耗时测试')
+    outputcache_parser.add_argument('--width', type=int, default=640, help='合成视频和图片宽度，默认640')
+    outputcache_parser.add_argument('--height', type=int, default=360, help='合成视频和图片高度，默认360')
+    outputcache_parser.add_argument('--seconds', type=float, default=5, help='合成视频时长（秒），默认5')
+    outputcache_parser.add_argument('--fps', type=float, default=10, help='输出fps，默认10')
+    outputcache_parser.add_argument('--count', type=int, default=30, help='图片数量，默认30')
+    outputcache_parser.add_argument('--repeat', type=int, default=3, help='命中的次数，默认3')
+
+    segments_parser = subparsers.add_parser('segments', help='多个时间片段一遍读取与逐段调用的耗时测试')
+    segments_parser.add_argument('--width', type=int, default=1280, help='合成视频宽度，默认1280')
+    segments_parser.add_argument('--height', type=int, default=720, help='合成视频高度，默认720')
+    segments_parser.add_argument('--seconds', type=float, default=60, help='合成视频时长（秒），默认60')
+    segments_parser.add_argument('--fps', type=float, default=10, help='输出fps，默认10')
+    segments_parser.add_argument('--target-width', type=int, default=320, help='输出宽度，默认320')
+    segments_parser.add_argument('--target-height', type=int, default=180, help='输出高度，默认180')
+    segments_parser.add_argument('--segments', default='0-2,10-12.5,40-43', help='时间片段，默认0-2,10-12.5,40-43')
+
+    maxbytes_parser = subparsers.add_parser('maxbytes', help='目标文件大小模式的耗时和估算误差测试')
+    maxbytes_parser.add_argument('--width', type=int, default=1280, help='合成视频宽度，默认1280')
+    maxbytes_parser.add_argument('--height', type=int, default=720, help='合成视频高度，默认720')
+    maxbytes_parser.add_argument('--seconds', type=float, default=10, help='合成视频时长（秒），默认10')
+    maxbytes_parser.add_argument('--fps', type=float, default=10, help='输出fps，默认10')
+    maxbytes_parser.add_argument('--max-bytes', type=int, nargs='+', default=[2000000, 500000, 200000], help='大小上限列表（字节），默认2000000 500000 200000')
+
+    startup_parser = subparsers.add_parser('startup', help='images子命令的冷启动耗时测试')
+    startup_parser.add_argument('--frames', type=int, default=3, help='图片数量，默认3')
+    startup_parser.add_argument('--width', type=int, default=64, help='图片宽度，默认64')
+    startup_parser.add_argument('--height', type=int, default=64, help='图片高度，默认64')
+    startup_parser.add_argument('--repeat', type=int, default=15, help='每种方式的运行次数，默认15')
+
+    suite_parser = subparsers.add_parser('suite', help='各入口函数的耗时和峰值内存测试，结果写入JSON')
+    suite_parser.add_argument('-o', '--output', default='benchmark_results.json', help='结果JSON文件路径，默认benchmark_results.json')
+    suite_parser.add_argument('--image-sizes', nargs='+', default=['640x360', '1920x1080'], help='合成图片的分辨率列表（宽x高），默认640x360 1920x1080')
+    suite_parser.add_argument('--image-count', type=int, default=30, help='每组合成图片的数量，默认30')
+    suite_parser.add_argument('--video-sizes', nargs='+', default=['640x360', '1280x720'], help='合成视频的分辨率列表（宽x高），默认640x360 1280x720')
+    suite_parser.add_argument('--video-seconds', type=float, nargs='+', default=[5, 20], help='合成视频的时长列表（秒），默认5 20')
+    suite_parser.add_argument('--fps', type=float, default=10, help='视频用例的输出fps，默认10')
+    suite_parser.add_argument('--target', default='480x270', help='调整大小的目标大小（宽x高），默认480x270')
+    suite_parser.add_argument('--workers', type=int, default=1, help='create_gif_with_resize的并行进程数，默认1')
+    suite_parser.add_argument('--repeat', type=int, default=1, help='每个用例的重复次数，取最快的一次，默认1')
+    suite_parser.add_argument('--filter', nargs='+', help='只运行名称包含其中任一字符串的用例')
+
+    compare_parser = subparsers.add_parser('compare', help='对比两次suite的结果')
+    compare_parser.add_argument('baseline', help='作为基准的suite结果JSON')
+    compare_parser.add_argument('current', help='要检查的suite结果JSON')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='视为回退的增加比例，默认0.1（10%%）')
+    compare_parser.add_argument('--metrics', nargs='+', choices=SUITE_METRICS, default=list(SUITE_METRICS), help='要检查的指标，默认全部')
+
+    args = parser.parse_args()
+    if args.command == 'memory':
+        bench_memory(args)
+    elif args.command == 'sampling':
+        bench_sampling(args)
+    elif args.command == 'resize':
+        bench_resize(args)
+    elif args.command == 'palette':
+        bench_palette(args)
+    elif args.command == 'delta':
+        bench_delta(args)
+    elif args.command == 'batch':
+        bench_batch(args)
+    elif args.command == 'append':
+        bench_append(args)
+    elif args.command == 'transform':
+        bench_transform(args)
+    elif args.command == 'videoframe':
+        bench_videoframe(args)
+    elif args.command == 'select':
+        bench_select(args)
+    elif args.command == 'multi':
+        bench_multi(args)
+    elif args.command == 'spool':
+        bench_spool(args)
+    elif args.command == 'encode':
+        bench_encode(args)
+    elif args.command == 'formats':
+        bench_formats(args)
+    elif args.command == 'serve':
+        bench_serve(args)
+    elif args.command == 'outputcache':
+        bench_outputcache(args)
+    elif args.command == 'segments':
+        bench_segments(args)
+    elif args.command == 'maxbytes':
+        bench_maxbytes(args)
+    elif args.command == 'startup':
+        bench_startup(args)
+    elif args.command == 'suite':
+        bench_suite(args)
+    elif args.command == 'compare':
+        sys.exit(bench_compare(args))
+
+
+if __name__ == "__main__":
+    main()
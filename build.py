@@ -11,6 +11,7 @@ import os
 import sys
 import shutil
 import platform
+import argparse
 import subprocess
 from pathlib import Path
 
@@ -22,6 +23,11 @@ TARGET_FILE = Path(ROOT_DIR, "gif_maker.py")
 DIST_DIR = Path(ROOT_DIR, "dist")
 # 构建目录
 BUILD_DIR = Path(ROOT_DIR, "build")
+# gif_maker.py用不到、但会被依赖库顺带打包的模块。--onefile的可执行文件每次启动都要解压全部内容，
+# 包越小启动越快
+EXCLUDED_MODULES = ["tkinter", "PIL.ImageTk", "PIL.ImageQt", "matplotlib", "IPython", "pytest"]
+# 精简版只支持从图片创建GIF，不包含OpenCV（连同其自带的FFmpeg等动态库）
+LITE_EXCLUDED_MODULES = ["cv2"]
 
 def check_target_file():
     """Check if target file exists"""
@@ -51,12 +57,18 @@ def install_dependencies():
         print(f"Error installing dependencies: {e}")
         sys.exit(1)
 
-def build_executable(target_platform=None, target_arch=None):
+def executable_name(target_platform, target_arch, lite=False):
+    """Name of the PyInstaller output for a platform and architecture"""
+    prefix = "gif-maker-lite" if lite else "gif-maker"
+    return f"{prefix}-{target_platform}-{target_arch}"
+
+def build_executable(target_platform=None, target_arch=None, lite=False):
     """Build executable file
     
     Args:
         target_platform: Target platform, can be 'windows', 'macos', 'linux' or None (current platform)
         target_arch: Target architecture, can be 'x86_64', 'arm64' or None (current architecture)
+        lite: Build the images-only variant without OpenCV
     """
     current_platform = platform.system().lower()
     current_arch = platform.machine().lower()
@@ -69,7 +81,8 @@ def build_executable(target_platform=None, target_arch=None):
     if target_arch is None:
         target_arch = current_arch
     
-    print(f"Building executable for {target_platform} ({target_arch})...")
+    variant = " (lite, images only)" if lite else ""
+    print(f"Building executable for {target_platform} ({target_arch}){variant}...")
     
     # Ensure output directory exists
     os.makedirs(DIST_DIR, exist_ok=True)
@@ -81,9 +94,11 @@ def build_executable(target_platform=None, target_arch=None):
         "PyInstaller",
         "--clean",
         "--onefile",
-        "--name", f"gif-maker-{target_platform}-{target_arch}",
-        str(TARGET_FILE)
+        "--name", executable_name(target_platform, target_arch, lite),
     ]
+    for module in EXCLUDED_MODULES + (LITE_EXCLUDED_MODULES if lite else []):
+        cmd += ["--exclude-module", module]
+    cmd.append(str(TARGET_FILE))
     
     # Add platform-specific options
     if target_platform == "windows" and current_platform != "windows":
@@ -101,8 +116,12 @@ def build_executable(target_platform=None, target_arch=None):
         else:
             sys.exit(1)
 
-def create_distribution_package():
-    """Create distribution package"""
+def create_distribution_package(lite=False):
+    """Create distribution package
+    
+    Args:
+        lite: Package the images-only variant without OpenCV
+    """
     print("Creating distribution package...")
     
     # Create distribution directory structure
@@ -136,12 +155,12 @@ def create_distribution_package():
             continue
             
         # Build executable
-        success = build_executable(target_platform, target_arch)
+        success = build_executable(target_platform, target_arch, lite)
         if not success:
             continue
         
         # Determine source file name and target directory
-        source_name = f"gif-maker-{target_platform}-{target_arch}"
+        source_name = executable_name(target_platform, target_arch, lite)
         if target_platform == "windows":
             source_name += ".exe"
             target_dir = dist_windows
@@ -155,6 +174,8 @@ def create_distribution_package():
         elif target_platform == "linux":
             target_dir = dist_linux
             target_name = "gif-maker"
+        if lite:
+            target_name = target_name.replace("gif-maker", "gif-maker-lite")
         
         # Copy file to target directory
         source_path = Path(ROOT_DIR, "dist", source_name)
@@ -197,14 +218,19 @@ def clean_up():
     print("Temporary files cleanup complete")
 
 def main():
+    parser = argparse.ArgumentParser(description="Package GIF Maker into a standalone executable")
+    parser.add_argument("--lite", action="store_true",
+                        help="Build the smaller, faster-starting images-only variant without OpenCV")
+    args = parser.parse_args()
+
     # 使用ASCII字符，避免Windows编码问题
     print("Starting to package GIF Maker...")
     
     # 执行打包步骤
     check_target_file()
     install_dependencies()
-    build_executable()
-    create_distribution_package()
+    build_executable(lite=args.lite)
+    create_distribution_package(args.lite)
     create_readme()
     clean_up()
     
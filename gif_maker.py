@@ -14,95 +14,2365 @@
 '''
 
 import os
+import sys
 import argparse
 import tempfile
 import shutil
+import stat
 import math
-from PIL import Image
+import struct
+import time
+import queue
+import threading
+import multiprocessing
+import concurrent.futures
+import collections
+import collections.abc
+from PIL import Image, ImageChops
 import glob
+import hashlib
+import io
+import json
+import contextlib
+import functools
+import importlib.util
 
-# 用于处理视频文件
+# 用于处理视频文件。导入cv2要花上百毫秒，只在处理视频时才由_load_cv2导入，
+# 这里只检查是否已安装，图片模式的启动不受影响
+cv2 = None
+OPENCV_AVAILABLE = importlib.util.find_spec('cv2') is not None
+
+def _load_cv2():
+    """
+    首次调用时导入cv2，之后直接返回
+
+    返回:
+        bool: cv2是否可用
+    """
+    global cv2, OPENCV_AVAILABLE
+    if cv2 is None and OPENCV_AVAILABLE:
+        try:
+            import cv2 as module
+        except ImportError as e:
+            OPENCV_AVAILABLE = False
+            print(f"警告: 无法导入opencv-python库: {e}")
+        else:
+            cv2 = module
+    return cv2 is not None
+
+# 用于统计进程的峰值内存
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    RESOURCE_AVAILABLE = False
+
+# 用于共享调色板的向量化颜色映射
 try:
-    import cv2
-    OPENCV_AVAILABLE = True
+    import numpy as np
+    NUMPY_AVAILABLE = True
 except ImportError:
-    OPENCV_AVAILABLE = False
-    print("警告: 未安装opencv-python库，视频处理功能将不可用。请使用 'pip install opencv-python' 安装。")
+    NUMPY_AVAILABLE = False
+
+def _normalize_frame(img):
+    """
+    将帧统一转换为RGB模式，只有确实含有透明像素时才保留为RGBA模式
+
+    参数:
+        img: Image对象
+
+    返回:
+        Image: RGB或RGBA模式的Image对象
+    """
+    if img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info:
+        img = img.convert('RGBA')
+        if _transparency_mask(img).getbbox():
+            return img
+    return img if img.mode == 'RGB' else img.convert('RGB')
+
+def _transparency_mask(img):
+    """返回RGBA图像的透明掩码，alpha小于128的像素视为全透明"""
+    return img.getchannel('A').point(lambda a: 255 if a < 128 else 0)
+
+def _fit_to_canvas(img, size):
+    """
+    把帧裁剪或扩展为画布大小，左上角对齐，超出画布的部分被裁掉，不足的部分为透明像素
+
+    动画中所有帧都按第一帧的大小输出，与Pillow保存GIF时的做法一致。
+
+    参数:
+        img: Image对象，或形状为(高, 宽, 3)的RGB、(高, 宽, 4)的RGBA uint8数组
+        size: 画布大小，格式为(宽, 高)
+
+    返回:
+        与img类型相同的帧，大小不变时直接返回img
+    """
+    width, height = size
+    if isinstance(img, Image.Image):
+        if img.size == size:
+            return img
+        if img.width < width or img.height < height:
+            img = img.convert('RGBA')
+        # 超出原图的区域由crop填充为0，RGBA模式下即为透明像素
+        return img.crop((0, 0, width, height))
+    if img.shape[:2] == (height, width):
+        return img
+    if img.shape[0] >= height and img.shape[1] >= width:
+        return img[:height, :width]
+    canvas = np.zeros((height, width, 4), dtype=np.uint8)
+    region = img[:height, :width]
+    canvas[:region.shape[0], :region.shape[1], :region.shape[2]] = region
+    if region.shape[2] == 3:
+        canvas[:region.shape[0], :region.shape[1], 3] = 255
+    return canvas
+
+def _quantize_frame(img, colors=256):
+    """
+    将RGB或RGBA模式的帧量化为GIF可用的调色板（P）模式
+
+    参数:
+        img: RGB或RGBA模式的Image对象
+        colors: 调色板最多包含的颜色数（2-256）
+
+    返回:
+        tuple: (调色板模式的Image对象, 透明色索引或None)
+    """
+    if img.mode == 'RGBA':
+        # 透明像素统一映射到索引255，其余像素量化为最多255种颜色
+        p_img = img.convert('RGB').quantize(colors=min(colors, 255))
+        p_img.paste(255, mask=_transparency_mask(img))
+        return p_img, 255
+    return img.quantize(colors=colors), None
+
+# 调色板模式：per-frame=每帧单独量化，global=所有帧共享一个调色板，adaptive=共享调色板并在画面变化较大时重建
+PALETTE_MODES = ('per-frame', 'global', 'adaptive')
+
+# 构建共享调色板时最多采样的帧数和像素数
+PALETTE_SAMPLE_FRAMES = 16
+PALETTE_SAMPLE_PIXELS = 250000
+
+# adaptive模式下，当前调色板的映射误差（RGB均方根距离）超过该值时重建调色板
+ADAPTIVE_PALETTE_MAX_ERROR = 20
+
+def _sample_evenly(items, count):
+    """从序列中均匀地取出最多count个元素"""
+    if len(items) <= count:
+        return list(items)
+    return [items[i * len(items) // count] for i in range(count)]
+
+class SharedPalette:
+    """
+    多帧共享的调色板
+
+    使用32x32x32的查找表（每个通道取高5位）把像素映射为调色板索引，查找表只在第一次使用时
+    计算一次，之后每个像素的映射都是一次数组索引，整帧映射由NumPy向量化完成。
+    索引255保留给透明像素，因此调色板最多包含255种颜色。
+    """
+
+    LUT_BITS = 5
+
+    def __init__(self, colors):
+        """
+        参数:
+            colors: 形状为(n, 3)的uint8数组，n不超过255
+        """
+        self.colors = np.ascontiguousarray(colors, dtype=np.uint8)[:255]
+        # 补齐到256色，索引255（透明色）为黑色
+        self.palette = self.colors.tobytes().ljust(256 * 3, b'\x00')
+        self._lut = None
+
+    @classmethod
+    def from_images(cls, images, colors=255):
+        """
+        从一组采样帧中用中位切分法构建调色板
+
+        参数:
+            images: Image对象列表，通常是均匀采样的若干帧
+            colors: 调色板颜色数，最多255
+
+        返回:
+            SharedPalette: 构建好的调色板
+        """
+        images = list(images)
+        per_image = max(1, PALETTE_SAMPLE_PIXELS // max(1, len(images)))
+        samples = []
+        for img in images:
+            arr = np.asarray(_normalize_frame(img))
+            if arr.shape[2] == 4:
+                arr = arr[arr[..., 3] >= 128][:, :3]
+            else:
+                arr = arr.reshape(-1, 3)
+            # 按固定步长抽取像素，避免对整帧做中位切分
+            step = max(1, len(arr) // per_image)
+            samples.append(arr[::step])
+        pixels = np.concatenate(samples) if samples else np.zeros((1, 3), np.uint8)
+        if len(pixels) == 0:
+            pixels = np.zeros((1, 3), np.uint8)
+        sample_img = Image.frombuffer('RGB', (len(pixels), 1), np.ascontiguousarray(pixels), 'raw', 'RGB', 0, 1)
+        quantized = sample_img.quantize(colors=min(colors, 255), method=Image.Quantize.MEDIANCUT)
+        used = sorted(index for _, index in quantized.getcolors(256))
+        palette = np.frombuffer(bytes(quantized.getpalette()), dtype=np.uint8).reshape(-1, 3)
+        return cls(palette[used])
+
+    @property
+    def lut(self):
+        """32x32x32查找表，按(r<<10 | g<<5 | b)展开为一维数组"""
+        if self._lut is None:
+            levels = (np.arange(1 << self.LUT_BITS, dtype=np.float32) + 0.5) * (256 >> self.LUT_BITS)
+            grid = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 3)
+            colors = self.colors.astype(np.float32)
+            color_norms = (colors ** 2).sum(axis=1)
+            lut = np.empty(len(grid), dtype=np.uint8)
+            # 分块计算平方距离 |c|^2 - 2c·p（省略与候选颜色无关的|p|^2），控制临时内存
+            for start in range(0, len(grid), 4096):
+                block = grid[start:start + 4096]
+                lut[start:start + 4096] = np.argmin(color_norms - 2 * block @ colors.T, axis=1)
+            self._lut = lut
+        return self._lut
+
+    def _lookup(self, rgb):
+        """把(..., 3)的uint8数组映射为调色板索引"""
+        shift = 8 - self.LUT_BITS
+        keys = (rgb[..., 0] >> shift).astype(np.uint16) << (2 * self.LUT_BITS)
+        keys |= (rgb[..., 1] >> shift).astype(np.uint16) << self.LUT_BITS
+        keys |= rgb[..., 2] >> shift
+        return self.lut[keys]
+
+    def error(self, img):
+        """
+        估计用该调色板表示一帧时的误差
+
+        参数:
+            img: RGB或RGBA模式的Image对象
+
+        返回:
+            float: 抽样像素与映射颜色之间的RGB均方根距离
+        """
+        arr = np.asarray(img)[::4, ::4]
+        if arr.shape[2] == 4:
+            arr = arr[arr[..., 3] >= 128]
+        rgb = arr[..., :3].reshape(-1, 3)
+        if len(rgb) == 0:
+            return 0.0
+        diff = rgb.astype(np.int32) - self.colors[self._lookup(rgb)]
+        return float(np.sqrt((diff ** 2).sum(axis=1).mean()))
+
+    def map(self, img):
+        """
+        把一帧映射到该调色板
+
+        参数:
+            img: RGB或RGBA模式的Image对象
+
+        返回:
+            tuple: (调色板模式的Image对象, 透明色索引或None)
+        """
+        arr = np.asarray(img)
+        indices = self._lookup(arr)
+        transparency = None
+        if img.mode == 'RGBA':
+            indices[arr[..., 3] < 128] = 255
+            transparency = 255
+        p_img = Image.frombuffer('P', img.size, np.ascontiguousarray(indices), 'raw', 'P', 0, 1)
+        p_img.putpalette(self.palette)
+        return p_img, transparency
+
+def resolve_palette_mode(palette):
+    """
+    检查调色板模式，NumPy不可用时回退为per-frame
+
+    参数:
+        palette: 调色板模式，见PALETTE_MODES
+
+    返回:
+        str: 实际使用的调色板模式
+    """
+    if palette not in PALETTE_MODES:
+        raise ValueError(f"不支持的调色板模式: {palette}，可选值: {', '.join(PALETTE_MODES)}")
+    if palette != 'per-frame' and not NUMPY_AVAILABLE:
+        print(f"警告: 未安装numpy库，无法使用{palette}调色板模式，改为per-frame。请使用 'pip install numpy' 安装。")
+        return 'per-frame'
+    return palette
+
+class GifFrameOptimizer:
+    """
+    GIF帧间优化：只输出相对当前画面发生变化的区域
+
+    有NumPy时，逐像素比较新帧与解码器当前显示的画面（由本类维护的画布模型），只输出变化区域的
+    外接矩形，矩形内未变化的像素标记为透明（处置方法1，保留下层画面），这样LZW编码的数据更少、
+    文件更小。需要把不透明像素变为透明时，把上一帧扩展为整幅画面并使用处置方法2（恢复为背景）。
+    没有NumPy时退回与Pillow一致的做法：不透明帧按差异外接矩形裁剪，含透明像素的帧整帧写入。
+
+    完全相同的连续帧会合并为一帧并累加延迟，因此每一帧要等下一帧到来（或调用flush()）后才会输出。
+    只保留一幅画布用于比较，内存占用与帧数无关。画布大小由第一帧决定，之后大小不同的帧先用
+    _fit_to_canvas裁剪或扩展为画布大小，输出的帧不会超出画布。
+
+    输出的每一帧为元组 (RGB或RGBA模式的Image对象, 偏移(x, y), 延迟毫秒, 处置方法)，
+    RGBA中alpha为0的像素在编码时使用透明色。
+    """
+
+    def __init__(self, delta=True, delta_threshold=0):
+        """
+        参数:
+            delta: 是否进行帧间差异优化，为False时每一帧都整帧输出（仍会合并相同的帧）
+            delta_threshold: 像素各通道与画布的差值都不超过该值时视为未变化，0表示必须完全相同。
+                画布只在像素被重新写入时更新，因此误差不会累积
+        """
+        self.delta = delta
+        self.delta_threshold = delta_threshold
+        # 等待输出的帧 [图像, 偏移, 延迟, 处置方法]
+        self._pending = None
+        # 画布模型：当前显示的RGB内容及不透明掩码（NumPy），或上一帧图像（无NumPy时）
+        self._canvas = None
+        self._canvas_opaque = None
+        self._previous = None
+        # 画布大小 (宽, 高)，由第一帧决定
+        self._size = None
+
+    def add(self, img, duration):
+        """
+        加入一帧
+
+        参数:
+            img: Image对象，或形状为(高, 宽, 3)的RGB、(高, 宽, 4)的RGBA uint8数组（直接使用，不再复制）
+            duration: 该帧的延迟时间（毫秒）
+
+        返回:
+            list: 已经可以量化的帧
+        """
+        if self._size is None:
+            self._size = img.size if isinstance(img, Image.Image) else (img.shape[1], img.shape[0])
+        else:
+            img = _fit_to_canvas(img, self._size)
+        if NUMPY_AVAILABLE and isinstance(img, np.ndarray):
+            if img.shape[2] == 4 and (img[..., 3] >= 128).all():
+                # 没有透明像素时按RGB处理，与_normalize_frame一致
+                img = img[..., :3]
+            return self._add_array(img, duration)
+        img = _normalize_frame(img)
+        if NUMPY_AVAILABLE:
+            return self._add_array(np.asarray(img), duration)
+        return self._add_image(img, duration)
+
+    def _start(self, img, duration, disposal):
+        """输出等待中的帧，并以img作为新的整帧开始"""
+        ready = self.flush()
+        self._pending = [img, (0, 0), duration, disposal]
+        return ready
+
+    def _add_array(self, cur, duration):
+        has_alpha = cur.shape[2] == 4
+        cur_rgb = cur[..., :3]
+        opaque = cur[..., 3] >= 128 if has_alpha else np.ones(cur.shape[:2], dtype=bool)
+        canvas = self._canvas
+
+        if canvas is None or not self.delta:
+            if canvas is not None:
+                if np.array_equal(canvas, cur_rgb) and np.array_equal(self._canvas_opaque, opaque):
+                    # 与上一帧完全相同，合并为一帧并累加延迟
+                    self._pending[2] += duration
+                    return []
+                if not opaque.all():
+                    # 新帧含透明像素时，上一帧显示后恢复为背景，避免露出旧画面
+                    self._pending[3] = 2
+            self._canvas = np.array(cur_rgb)
+            self._canvas_opaque = np.array(opaque)
+            if has_alpha:
+                img = Image.fromarray(np.dstack([cur_rgb, np.where(opaque, 255, 0).astype(np.uint8)]), 'RGBA')
+            else:
+                img = Image.fromarray(np.ascontiguousarray(cur_rgb), 'RGB')
+            return self._start(img, duration, 1)
+
+        canvas_opaque = self._canvas_opaque
+        if (canvas_opaque & ~opaque).any():
+            # 有像素要从不透明变为透明，只能把上一帧扩展为整幅画面并在显示后恢复为背景
+            alpha = np.where(canvas_opaque, 255, 0).astype(np.uint8)
+            self._pending = [Image.fromarray(np.dstack([canvas, alpha]), 'RGBA'), (0, 0), self._pending[2], 2]
+            canvas_opaque[:] = False
+
+        if self.delta_threshold > 0:
+            differs = (np.abs(cur_rgb.astype(np.int16) - canvas) > self.delta_threshold).any(axis=2)
+        else:
+            differs = (cur_rgb != canvas).any(axis=2)
+        changed = (opaque != canvas_opaque) | (opaque & differs)
+
+        rows = np.flatnonzero(changed.any(axis=1))
+        if len(rows) == 0:
+            # 与当前画面相同，合并为一帧并累加延迟
+            self._pending[2] += duration
+            return []
+        cols = np.flatnonzero(changed.any(axis=0))
+        top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+        region_changed = changed[top:bottom, left:right]
+        region = cur_rgb[top:bottom, left:right]
+        if region_changed.all():
+            delta_img = Image.fromarray(np.ascontiguousarray(region), 'RGB')
+        else:
+            # 矩形内未变化的像素使用透明色，保留下层画面
+            alpha = np.where(region_changed, 255, 0).astype(np.uint8)
+            delta_img = Image.fromarray(np.dstack([region, alpha]), 'RGBA')
+
+        canvas[changed] = cur_rgb[changed]
+        canvas_opaque[changed] = opaque[changed]
+
+        ready = self.flush()
+        self._pending = [delta_img, (int(left), int(top)), duration, 1]
+        return ready
+
+    def _add_image(self, img, duration):
+        previous = self._previous
+        self._previous = img
+        if previous is not None and previous.mode == img.mode and previous.size == img.size:
+            if img.mode == 'RGB':
+                bbox = ImageChops.difference(img, previous).getbbox()
+            else:
+                bbox = None if img.tobytes() == previous.tobytes() else (0, 0) + img.size
+            if bbox is None:
+                # 与上一帧完全相同，合并为一帧并累加延迟
+                self._pending[2] += duration
+                return []
+            if img.mode == 'RGB' and self.delta:
+                # 只保留发生变化的区域，其余部分沿用上一帧的内容
+                ready = self.flush()
+                self._pending = [img.crop(bbox), bbox[:2], duration, 0]
+                return ready
+        # 含透明像素的帧显示后恢复为背景，避免透明区域露出上一帧的内容
+        return self._start(img, duration, 2 if img.mode == 'RGBA' else 0)
+
+    def snapshot(self):
+        """
+        返回当前画布模型，用于以后用restore()继续追加帧
+
+        返回:
+            tuple: (RGB画布数组, 不透明掩码数组)，还没有加入过帧或没有NumPy时为(None, None)
+        """
+        return self._canvas, self._canvas_opaque
+
+    def restore(self, canvas, canvas_opaque, offset, duration, disposal):
+        """
+        从snapshot()保存的画布继续优化，用于向已经写好的GIF追加帧
+
+        文件中的最后一帧以图像为None的等待帧表示：新帧与它相同时仍会合并（累加延迟），
+        也可能被改为处置方法2，或者因为新帧需要透明像素而被替换为整幅画面（此时图像不再为None）。
+
+        参数:
+            canvas: 形状为(高, 宽, 3)的RGB画布数组
+            canvas_opaque: 形状为(高, 宽)的不透明掩码数组
+            offset: 最后一帧在画布上的位置，格式为(x, y)
+            duration: 最后一帧的延迟时间（毫秒）
+            disposal: 最后一帧的处置方法
+        """
+        self._canvas = np.array(canvas, dtype=np.uint8)
+        self._canvas_opaque = np.array(canvas_opaque, dtype=bool)
+        self._size = (self._canvas.shape[1], self._canvas.shape[0])
+        self._pending = [None, tuple(offset), duration, disposal]
+
+    def flush(self):
+        """
+        输出等待中的帧
+
+        返回:
+            list: 已经可以量化的帧
+        """
+        if self._pending is None:
+            return []
+        pending = tuple(self._pending)
+        self._pending = None
+        return [pending]
+
+    def iter_optimized(self, frames, duration):
+        """
+        逐帧优化的生成器
+
+        参数:
+            frames: Image对象或RGB/RGBA数组的可迭代对象
+            duration: 每一帧的延迟时间（毫秒），为None时frames的元素为(帧, 延迟毫秒)
+
+        生成:
+            tuple: 已经可以量化的帧
+        """
+        for item in frames:
+            if duration is None:
+                yield from self.add(*item)
+            else:
+                yield from self.add(item, duration)
+        yield from self.flush()
+        self._canvas = self._canvas_opaque = self._previous = self._size = None
+
+class GifFrameQuantizer:
+    """
+    把GifFrameOptimizer输出的帧量化为GIF可用的调色板模式
+
+    输出的每一帧为元组 (调色板模式的Image对象, 透明色索引或None, 偏移(x, y), 延迟毫秒, 处置方法)。
+    """
+
+    def __init__(self, palette='per-frame', shared_palette=None, colors=256):
+        """
+        参数:
+            palette: 调色板模式，见PALETTE_MODES
+            shared_palette: global模式使用的SharedPalette，为None时由第一帧构建
+            colors: 每个调色板最多包含的颜色数（2-256），颜色越少文件越小
+        """
+        if not 2 <= colors <= 256:
+            raise ValueError(f"调色板颜色数必须在2到256之间: {colors}")
+        self.palette = resolve_palette_mode(palette)
+        self.shared_palette = shared_palette
+        self.colors = colors
+        self.palette_builds = 0
+
+    def quantize(self, img, offset, duration, disposal):
+        """
+        量化一帧
+
+        参数:
+            img: RGB或RGBA模式的Image对象
+            offset: 该帧在画布上的位置，格式为(x, y)
+            duration: 该帧的延迟时间（毫秒）
+            disposal: GIF处置方法
+
+        返回:
+            tuple: 已经可以编码的帧
+        """
+        if self.palette == 'per-frame':
+            p_img, transparency = _quantize_frame(img, self.colors)
+        else:
+            if self.shared_palette is None or (
+                    self.palette == 'adaptive' and self.shared_palette.error(img) > ADAPTIVE_PALETTE_MAX_ERROR):
+                # 还没有共享调色板，或者画面变化太大（例如场景切换），由当前帧重新构建
+                self.shared_palette = SharedPalette.from_images([img], self.colors)
+                self.palette_builds += 1
+            p_img, transparency = self.shared_palette.map(img)
+        return p_img, transparency, offset, duration, disposal
+
+    def iter_quantized(self, frames):
+        """
+        逐帧量化的生成器
+
+        参数:
+            frames: GifFrameOptimizer输出的帧的可迭代对象
+
+        生成:
+            tuple: 已经可以编码的帧
+        """
+        for frame in frames:
+            yield self.quantize(*frame)
+
+def _output_file_mode(directory):
+    """
+    计算在directory中新建普通文件时得到的权限
+
+    mkstemp创建的临时文件权限为0600，替换为输出文件之前改为这个权限。为了不在多线程环境中
+    临时修改进程的umask，优先从/proc/self/status读取umask，读不到时在directory中新建一个
+    探测文件查看实际得到的权限。
+
+    参数:
+        directory: 输出文件所在的目录
+
+    返回:
+        int: 文件权限
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Umask:'):
+                    return 0o666 & ~int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    probe = os.path.join(directory or '.', '.gif-maker-mode-%d-%d.tmp' % (os.getpid(), threading.get_ident()))
+    fd = os.open(probe, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        return stat.S_IMODE(os.fstat(fd).st_mode)
+    finally:
+        os.close(fd)
+        os.unlink(probe)
+
+def _gif_frame_header(p_img, transparency, offset, delay, disposal=0, global_palette=None):
+    """
+    生成一个量化好的帧在LZW图像数据之前的部分（图形控制扩展、图像描述符和局部调色板）
+
+    参数与_encode_gif_frame相同
+
+    返回:
+        bytes: 编码后的数据
+    """
+    palette = p_img.getpalette() or []
+    num_colors = max(len(palette) // 3, (transparency or 0) + 1, 2)
+    table_bits = max(1, math.ceil(math.log2(num_colors)))
+    table_size = 1 << table_bits
+    palette = bytes(palette[:table_size * 3]).ljust(table_size * 3, b'\x00')
+    if palette == global_palette:
+        # 与全局调色板相同，不再写入局部调色板
+        palette = b''
+
+    packed = (disposal << 2) | (1 if transparency is not None else 0)
+    return (
+        # 图形控制扩展：延迟、处置方法和透明色
+        b'!\xf9\x04' + struct.pack('<BHBB', packed, delay, transparency or 0, 0)
+        # 图像描述符与局部调色板
+        + b',' + struct.pack('<HHHHB', offset[0], offset[1], p_img.width, p_img.height, 0x80 | (table_bits - 1) if palette else 0)
+        + palette
+    )
+
+def _encode_lzw(task):
+    """
+    把调色板索引编码为GIF的LZW图像数据（最小码长8，已分成子块），供进程池调用
+
+    参数:
+        task: (大小, 调色板索引的原始字节)，大小的格式为(宽, 高)
+
+    返回:
+        bytes: 以LZW最小码长开头、以块结束符结尾的图像数据
+    """
+    size, data = task
+    # 图像数据由Pillow的GIF编码器生成，它只依赖调色板索引，与调色板无关
+    return b'\x08' + Image.frombytes('P', size, data).tobytes('gif', 'P') + b'\x00'
+
+def _encode_gif_frame(p_img, transparency, offset, delay, disposal=0, global_palette=None):
+    """
+    把一个量化好的帧编码为GIF数据块（图形控制扩展、图像描述符、局部调色板和LZW图像数据）
+
+    参数:
+        p_img: 调色板模式的Image对象
+        transparency: 透明色索引，没有透明色时为None
+        offset: 该帧在画布上的位置，格式为(x, y)
+        delay: 该帧的延迟时间（1/100秒）
+        disposal: GIF处置方法
+        global_palette: 文件的全局调色板，与之相同时不写入局部调色板
+
+    返回:
+        bytes: 编码后的数据
+    """
+    return (
+        _gif_frame_header(p_img, transparency, offset, delay, disposal, global_palette)
+        # LZW最小码长固定为8，图像数据由Pillow的GIF编码器生成
+        + b'\x08' + p_img.tobytes('gif', 'P') + b'\x00'
+    )
+
+# 并行编码时每个进程预先提交的帧数，等待写入的帧占用的内存与该值成正比
+ENCODE_PREFETCH_PER_WORKER = 2
+# 交给进程池编码的最小帧像素数。把一帧传给工作进程再取回结果每帧要多花约0.2毫秒（64x64）到
+# 0.5毫秒（256x256），两个进程时要到约256x256的帧才能抵消；更小的帧（包括大部分只含变化区域的帧）在当前线程中编码
+ENCODE_PARALLEL_MIN_PIXELS = 256 * 256
+
+class GifStreamWriter:
+    """
+    逐帧写入GIF文件的流式编码器
+
+    每一帧在写入时立即完成优化、量化和LZW编码并落盘（分别由GifFrameOptimizer和GifFrameQuantizer完成），
+    内存占用与帧数无关。输出先写入同目录下的临时文件，close()时才原子地替换为目标文件，
+    失败时不会留下损坏的GIF。
+
+    传入resume（之前close()后state()返回的状态）时直接在原文件上续写：去掉文件结尾，追加新的帧后重新写入结尾，
+    耗时只与新增的帧数有关。中途失败时文件截断到最后一个完整的帧，仍然是有效的GIF。
+
+    LZW编码通常是最耗时的一步，而且各帧之间互不依赖。encode_workers大于1时，量化好的帧交给进程池编码
+    （Pillow的GIF编码器执行时不释放GIL，多线程无法并行），当前线程继续优化和量化后面的帧，
+    编码好的数据仍按顺序写入，输出与逐帧编码完全相同。进程间传递每一帧都有固定的开销，因此只有
+    不少于ENCODE_PARALLEL_MIN_PIXELS像素的帧才交给进程池，只有一个CPU核心时不使用进程池。
+
+    用法:
+        with GifStreamWriter('output.gif', duration=100) as writer:
+            for frame in frames:
+                writer.write(frame)
+    """
+
+    def __init__(self, output_file, duration=100, loop=0, palette='per-frame', shared_palette=None, delta=True, delta_threshold=0, colors=256, progress=None, resume=None, encode_workers=None):
+        """
+        参数:
+            output_file: 输出的GIF文件路径
+            duration: 默认的每一帧延迟时间，单位为毫秒
+            loop: 循环次数，0表示无限循环
+            palette: write()使用的调色板模式，见PALETTE_MODES
+            shared_palette: 预先构建的SharedPalette，会写入为全局调色板，
+                使用该调色板的帧不再携带局部调色板
+            delta: write()是否只写入相对上一帧变化的区域，见GifFrameOptimizer
+            delta_threshold: write()判断像素未变化时允许的最大通道差值，见GifFrameOptimizer
+            colors: write()量化时每个调色板最多包含的颜色数（2-256）
+            progress: GifProgress对象，逐帧记录优化、量化、编码（LZW）和写入各自的耗时，None表示不记录
+            resume: state()返回的状态，在output_file上续写，None表示新建文件。
+                续写时调色板沿用原文件的设置，shared_palette被忽略
+            encode_workers: LZW编码使用的进程数，None或1表示在当前线程中编码，0表示使用全部CPU核心。
+                只有一个CPU核心时忽略，始终在当前线程中编码
+        """
+        self.output_file = output_file
+        self.duration = duration
+        self.loop = loop
+        self.frame_count = 0
+        self.bytes_written = 0
+        self._size = None
+        self._global_palette = shared_palette.palette if shared_palette is not None else None
+        self._optimizer = GifFrameOptimizer(delta, delta_threshold)
+        self._quantizer = GifFrameQuantizer(palette, shared_palette, colors)
+        self._progress = progress
+        # 累计的时间（毫秒），用于把毫秒延迟无漂移地折算为GIF的1/100秒单位
+        self._elapsed_ms = 0
+        self._elapsed_cs = 0
+        # 最后写入的一帧 (文件位置, 偏移, 延迟毫秒, 延迟1/100秒, 处置方法)，续写时可能需要修改它
+        self._last_frame = None
+        # 最后一个完整的帧结束的文件位置
+        self._frames_end = 0
+        self._tmp_path = None
+        self._resumed_frame = False
+        self._encode_workers = resolve_workers(encode_workers) if (os.cpu_count() or 1) > 1 else 1
+        self._executor = None
+        # 已经提交到进程池、等待按顺序写入的帧：(Future, 帧头数据, 偏移, 延迟毫秒, 延迟1/100秒, 处置方法)
+        self._pending = collections.deque()
+
+        if resume is not None:
+            self._resume(resume)
+            return
+
+        # 确保输出目录存在
+        output_dir = os.path.dirname(output_file)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+            print(f"创建输出目录: {output_dir}")
+
+        fd, self._tmp_path = tempfile.mkstemp(
+            prefix='.' + os.path.basename(output_file) + '.',
+            suffix='.tmp',
+            dir=output_dir or '.'
+        )
+        self._fp = os.fdopen(fd, 'wb')
+
+    def _resume(self, state):
+        """打开已有的GIF文件，去掉文件结尾并恢复编码状态"""
+        self.frame_count = state['frame_count']
+        self._size = tuple(state['size'])
+        self._elapsed_ms = state['elapsed_ms']
+        self._elapsed_cs = state['elapsed_cs']
+        position, offset, duration, delay, disposal = state['last_frame']
+        self._last_frame = (position, tuple(offset), duration, delay, disposal)
+        if state.get('palette') is not None:
+            shared_palette = SharedPalette(state['palette'])
+            self._quantizer.shared_palette = shared_palette
+            self._global_palette = shared_palette.palette if state['global_palette'] else None
+        if state.get('canvas') is not None:
+            self._optimizer.restore(state['canvas'], state['canvas_opaque'], offset, duration, disposal)
+            # 优化器输出的第一帧对应文件中已有的最后一帧
+            self._resumed_frame = True
+        if os.stat(self.output_file).st_nlink > 1:
+            # 文件与输出缓存的条目共享数据（硬链接），先复制一份再就地修改
+            fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(self.output_file) + '.', suffix='.tmp', dir=os.path.dirname(self.output_file) or '.')
+            os.close(fd)
+            shutil.copyfile(self.output_file, tmp_path)
+            os.chmod(tmp_path, _output_file_mode(os.path.dirname(tmp_path)))
+            os.replace(tmp_path, self.output_file)
+        self._fp = open(self.output_file, 'r+b')
+        self._fp.seek(state['end'])
+        self._fp.truncate()
+        self.bytes_written = self._frames_end = state['end']
+
+    def state(self):
+        """
+        返回续写这个文件所需的状态，在close()成功之后调用
+
+        返回:
+            dict: 除canvas、canvas_opaque和palette为NumPy数组（或None）外，其余值都可以JSON序列化
+        """
+        canvas, canvas_opaque = self._optimizer.snapshot()
+        shared_palette = self._quantizer.shared_palette
+        return {
+            'size': list(self._size),
+            'frame_count': self.frame_count,
+            'end': self._frames_end,
+            'elapsed_ms': self._elapsed_ms,
+            'elapsed_cs': self._elapsed_cs,
+            'last_frame': [self._last_frame[0], list(self._last_frame[1])] + list(self._last_frame[2:]),
+            'global_palette': self._global_palette is not None,
+            'canvas': canvas,
+            'canvas_opaque': canvas_opaque,
+            'palette': shared_palette.colors if shared_palette is not None else None,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def _write(self, data):
+        self._fp.write(data)
+        self.bytes_written += len(data)
+
+    def _write_header(self, size):
+        self._size = size
+        # 文件头与逻辑屏幕描述符，有共享调色板时作为256色的全局调色板写入
+        flags = 0x70 if self._global_palette is None else 0xf7
+        self._write(b'GIF89a' + struct.pack('<HHBBB', size[0], size[1], flags, 0, 0))
+        if self._global_palette is not None:
+            self._write(self._global_palette)
+        # NETSCAPE2.0 循环扩展
+        self._write(b'!\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', self.loop) + b'\x00')
+
+    def _next_delay(self, duration):
+        """将毫秒延迟换算为1/100秒，并把舍入误差累积到后续帧"""
+        self._elapsed_ms += duration
+        total_cs = int(round(self._elapsed_ms / 10))
+        delay = total_cs - self._elapsed_cs
+        self._elapsed_cs = total_cs
+        return delay
+
+    def write(self, img, duration=None):
+        """
+        量化并写入一帧
+
+        为了合并相同的连续帧，每一帧会在下一帧到来（或close()）时才真正编码写入。
+
+        参数:
+            img: Image对象
+            duration: 该帧的延迟时间（毫秒），如果为None则使用默认值
+        """
+        if duration is None:
+            duration = self.duration
+        start = time.perf_counter()
+        frames = self._optimizer.add(img, duration)
+        if self._progress is not None:
+            self._progress.add_time('优化', time.perf_counter() - start, 1)
+        self._write_frames(frames)
+
+    def _write_frames(self, frames):
+        """量化并写入GifFrameOptimizer输出的帧"""
+        for frame in frames:
+            if self._resumed_frame:
+                self._resumed_frame = False
+                if frame[0] is None:
+                    self._patch_last_frame(frame[2], frame[3])
+                    continue
+                # 最后一帧被扩展为整幅画面，去掉文件中原来的数据后重新写入
+                self._rewind_last_frame()
+            start = time.perf_counter()
+            quantized = self._quantizer.quantize(*frame)
+            if self._progress is not None:
+                self._progress.add_time('量化', time.perf_counter() - start, 1)
+            self.write_quantized(*quantized)
+
+    def _rewind_last_frame(self):
+        """截掉文件中最后一帧的数据，并撤销它对延迟累计的影响"""
+        self._write_pending()
+        position, _, duration, delay, _ = self._last_frame
+        self._fp.seek(position)
+        self._fp.truncate()
+        self.bytes_written = self._frames_end = position
+        self._elapsed_ms -= duration
+        self._elapsed_cs -= delay
+        self.frame_count -= 1
+
+    def _patch_last_frame(self, duration, disposal):
+        """就地修改文件中最后一帧的延迟和处置方法"""
+        self._write_pending()
+        position, offset, old_duration, old_delay, old_disposal = self._last_frame
+        if duration == old_duration and disposal == old_disposal:
+            return
+        self._elapsed_ms -= old_duration
+        self._elapsed_cs -= old_delay
+        delay = self._next_delay(duration)
+        # 图形控制扩展：3字节的扩展头之后是标志字节和2字节的延迟，保留标志字节中的透明色标记
+        self._fp.seek(position + 3)
+        packed = (disposal << 2) | (self._fp.read(1)[0] & 1)
+        self._fp.seek(position + 3)
+        self._fp.write(struct.pack('<BH', packed, delay))
+        self._fp.seek(self._frames_end)
+        self._last_frame = (position, offset, duration, delay, disposal)
+
+    def write_quantized(self, p_img, transparency, offset, duration, disposal=0):
+        """
+        编码并写入一个已经由GifFrameQuantizer量化好的帧
+
+        参数:
+            p_img: 调色板模式的Image对象
+            transparency: 透明色索引，没有透明色时为None
+            offset: 该帧在画布上的位置，格式为(x, y)，第一帧必须为(0, 0)并覆盖整个画布，之后的帧不能超出画布
+            duration: 该帧的延迟时间（毫秒）
+            disposal: GIF处置方法，1=保留，2=恢复为背景
+        """
+        if self._size is None:
+            self._write_header(p_img.size)
+        elif offset[0] + p_img.width > self._size[0] or offset[1] + p_img.height > self._size[1]:
+            raise ValueError(f"帧 {p_img.size}（位置 {tuple(offset)}）超出了画布 {self._size}")
+        delay = self._next_delay(duration)
+        start = time.perf_counter()
+        if self._encode_workers > 1 and p_img.width * p_img.height >= ENCODE_PARALLEL_MIN_PIXELS:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self._encode_workers)
+            header = _gif_frame_header(p_img, transparency, offset, delay, disposal, self._global_palette)
+            future = self._executor.submit(_encode_lzw, (p_img.size, p_img.tobytes()))
+            self._pending.append((future, header, tuple(offset), duration, delay, disposal))
+            if self._progress is not None:
+                self._progress.add_time('编码', time.perf_counter() - start)
+            self._write_done()
+            return
+        data = _encode_gif_frame(p_img, transparency, offset, delay, disposal, self._global_palette)
+        if self._pending:
+            # 前面还有帧在进程池中编码，编码好的数据排在它们后面按顺序写入
+            future = concurrent.futures.Future()
+            future.set_result(b'')
+            self._pending.append((future, data, tuple(offset), duration, delay, disposal))
+            if self._progress is not None:
+                self._progress.add_time('编码', time.perf_counter() - start)
+            self._write_done()
+            return
+        self._write_frame(data, tuple(offset), duration, delay, disposal, time.perf_counter() - start)
+
+    def _write_encoded(self, future, header, offset, duration, delay, disposal):
+        """等待进程池编码完一帧并写入，编码耗时记为等待的时间"""
+        start = time.perf_counter()
+        data = header + future.result()
+        self._write_frame(data, offset, duration, delay, disposal, time.perf_counter() - start)
+
+    def _write_done(self):
+        """先写入已经编码好的帧，等待中的帧过多时等待最早的一帧"""
+        limit = self._encode_workers * ENCODE_PREFETCH_PER_WORKER
+        while self._pending and (len(self._pending) > limit or self._pending[0][0].done()):
+            self._write_encoded(*self._pending.popleft())
+
+    def _write_pending(self):
+        """按顺序写入所有已提交到进程池的帧"""
+        while self._pending:
+            self._write_encoded(*self._pending.popleft())
+
+    def _write_frame(self, data, offset, duration, delay, disposal, encode_seconds):
+        """写入一帧编码好的数据"""
+        start = time.perf_counter()
+        self._last_frame = (self.bytes_written, offset, duration, delay, disposal)
+        self._write(data)
+        self._frames_end = self.bytes_written
+        self.frame_count += 1
+        if self._progress is not None:
+            self._progress.add_time('编码', encode_seconds, 1)
+            self._progress.add_time('写入', time.perf_counter() - start, 1)
+            self._progress.frame_written(len(data))
+
+    def _shutdown_executor(self):
+        """关闭编码进程池，丢弃还没有写入的帧"""
+        if self._executor is None:
+            return
+        for item in self._pending:
+            item[0].cancel()
+        self._pending.clear()
+        self._executor.shutdown(cancel_futures=True)
+        self._executor = None
+
+    def close(self):
+        """写入剩余的帧和文件结尾，并将临时文件替换为目标文件"""
+        if self._fp is None:
+            return
+        try:
+            self._write_frames(self._optimizer.flush())
+            self._write_pending()
+        except BaseException:
+            self.abort()
+            raise
+        self._shutdown_executor()
+        if self.frame_count == 0:
+            self.abort()
+            return
+        self._write(b';')
+        self._fp.close()
+        self._fp = None
+        if self._tmp_path is None:
+            # 续写，已经直接写在目标文件上
+            return
+        os.chmod(self._tmp_path, _output_file_mode(os.path.dirname(self._tmp_path)))
+        os.replace(self._tmp_path, self.output_file)
+
+    def abort(self):
+        """放弃写入并删除临时文件，续写时把文件截断到最后一个完整的帧"""
+        self._shutdown_executor()
+        if self._fp is None:
+            return
+        if self._tmp_path is None:
+            self._fp.seek(self._frames_end)
+            self._fp.truncate()
+            self._fp.write(b';')
+        self._fp.close()
+        self._fp = None
+        if self._tmp_path is not None and os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+# 可以输出的动画格式：gif由GifStreamWriter逐帧写入，webp（动画WebP）和apng由Pillow编码（见AnimationWriter）
+OUTPUT_FORMATS = ('gif', 'webp', 'apng')
+# 未指定格式时根据输出文件的扩展名推断，其他扩展名按gif处理
+OUTPUT_FORMAT_EXTENSIONS = {'.gif': 'gif', '.webp': 'webp', '.png': 'apng', '.apng': 'apng'}
+# 动画WebP默认的有损压缩质量（0-100）
+WEBP_QUALITY = 80
+
+def resolve_output_format(output_format, output_file):
+    """
+    检查输出格式，为None时根据输出文件的扩展名推断
+
+    参数:
+        output_format: 输出格式，见OUTPUT_FORMATS，None表示根据扩展名推断
+        output_file: 输出文件路径
+
+    返回:
+        str: 输出格式
+    """
+    if output_format is None:
+        return OUTPUT_FORMAT_EXTENSIONS.get(os.path.splitext(output_file)[1].lower(), 'gif')
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {output_format}，可选值为 {', '.join(OUTPUT_FORMATS)}")
+    return output_format
+
+class AnimationWriter:
+    """
+    通过Pillow写入动画WebP或APNG，write()的用法与GifStreamWriter相同，可以直接替换
+
+    两种格式都保存真彩色（含半透明）的帧，不需要量化，帧间差分由Pillow的编码器完成。
+    Pillow只能一次编码整个动画，因此帧先保存在内存中，close()时才编码并写入，内存占用与帧数成正比。
+    所有帧都用_fit_to_canvas裁剪或扩展为第一帧的大小，连续相同的帧合并为一帧并累加延迟。与GifStreamWriter一样先写入同目录下的临时文件，成功后原子地替换目标文件。
+    """
+
+    def __init__(self, output_file, output_format, duration=100, loop=0, quality=None, progress=None):
+        """
+        参数:
+            output_file: 输出文件路径
+            output_format: 'webp'或'apng'
+            duration: 默认的每一帧延迟时间，单位为毫秒
+            loop: 循环次数，0表示无限循环
+            quality: WebP的有损压缩质量（0-100），None表示使用WEBP_QUALITY，APNG（无损）忽略该参数
+            progress: GifProgress对象，记录每一帧的转换和最后整体编码的耗时，None表示不记录
+        """
+        if output_format not in ('webp', 'apng'):
+            raise ValueError(f"AnimationWriter不支持的输出格式: {output_format}")
+        from PIL import features
+        if output_format == 'webp' and not features.check('webp'):
+            raise ValueError("当前安装的Pillow不支持WebP")
+        self.output_file = output_file
+        self.output_format = output_format
+        self.duration = duration
+        self.loop = loop
+        self.quality = WEBP_QUALITY if quality is None else quality
+        self.frame_count = 0
+        self.bytes_written = 0
+        self._progress = progress
+        self._frames = []
+        self._durations = []
+        self._last_source = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    @staticmethod
+    def _to_image(img):
+        """把Image对象或NumPy数组转换为RGB或RGBA模式的Image对象"""
+        if not isinstance(img, Image.Image):
+            img = Image.fromarray(img)
+        if img.mode in ('RGB', 'RGBA'):
+            return img
+        if img.mode in ('LA', 'PA') or 'transparency' in img.info:
+            return img.convert('RGBA')
+        return img.convert('RGB')
+
+    def write(self, img, duration=None):
+        """
+        添加一帧
+
+        参数:
+            img: Image对象，或者形状为(高, 宽, 3)的RGB、(高, 宽, 4)的RGBA NumPy数组
+            duration: 该帧的延迟时间（毫秒），如果为None则使用默认值
+        """
+        if duration is None:
+            duration = self.duration
+        start = time.perf_counter()
+        if self._frames and img is self._last_source:
+            # 视频中重复的帧是同一个对象
+            self._durations[-1] += duration
+            return
+        self._last_source = img
+        frame = self._to_image(img)
+        if self._frames:
+            # WebP和APNG的所有帧必须与第一帧大小相同
+            frame = _fit_to_canvas(frame, self._frames[0].size)
+        if self._frames and NUMPY_AVAILABLE and frame.mode == self._frames[-1].mode and frame.size == self._frames[-1].size \
+                and np.array_equal(np.asarray(frame), np.asarray(self._frames[-1])):
+            self._durations[-1] += duration
+            return
+        self._frames.append(frame)
+        self._durations.append(duration)
+        if self._progress is not None:
+            self._progress.add_time('编码', time.perf_counter() - start, 1)
+            self._progress.frame_written(0)
+
+    def close(self):
+        """编码所有帧，并原子地写入目标文件"""
+        if self._closed:
+            return
+        self._closed = True
+        frames, durations = self._frames, self._durations
+        self._frames, self._durations = [], []
+        if not frames:
+            return
+        if len({frame.mode for frame in frames}) > 1:
+            # 部分帧含有透明像素时统一为RGBA，APNG会把后面的帧转换为第一帧的模式
+            frames = [frame.convert('RGBA') for frame in frames]
+
+        output_dir = os.path.dirname(self.output_file)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+            print(f"创建输出目录: {output_dir}")
+        options = {'quality': self.quality} if self.output_format == 'webp' else {}
+        start = time.perf_counter()
+        fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(self.output_file) + '.', suffix='.tmp', dir=output_dir or '.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                frames[0].save(f, format='WEBP' if self.output_format == 'webp' else 'PNG', save_all=True, append_images=frames[1:],
+                               duration=durations, loop=self.loop, **options)
+                self.bytes_written = f.tell()
+            os.chmod(tmp_path, _output_file_mode(os.path.dirname(tmp_path)))
+            os.replace(tmp_path, self.output_file)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.frame_count = len(frames)
+        if self._progress is not None:
+            self._progress.add_time('编码', time.perf_counter() - start)
+
+    def abort(self):
+        """放弃写入，丢弃已经添加的帧"""
+        self._closed = True
+        self._frames, self._durations = [], []
+
+def open_frame_writer(output_file, output_format='gif', duration=100, loop=0, palette='per-frame', shared_palette=None, delta_threshold=0, colors=256, progress=None, encode_workers=None, quality=None):
+    """
+    按输出格式创建逐帧写入的编码器：gif为GifStreamWriter，webp和apng为AnimationWriter
+
+    参数与GifStreamWriter和AnimationWriter的同名参数相同，palette、shared_palette、delta_threshold、
+    colors和encode_workers只用于gif，quality只用于webp
+
+    返回:
+        GifStreamWriter或AnimationWriter: 两者都支持write(img, duration)、close()和with语句
+    """
+    if output_format == 'gif':
+        return GifStreamWriter(output_file, duration, loop, palette, shared_palette, delta_threshold=delta_threshold, colors=colors, progress=progress, encode_workers=encode_workers)
+    return AnimationWriter(output_file, output_format, duration, loop, quality, progress)
+
+class GifCancelled(Exception):
+    """GIF生成过程被GifProgress.cancel()取消"""
+
+# 度量输出（--stats、Prometheus）中使用的阶段标识，解码阶段包括打开文件
+METRIC_STAGE_IDS = {
+    '解码': 'decode',
+    '调整大小': 'resize',
+    '优化': 'optimize',
+    '量化': 'quantize',
+    '编码': 'encode',
+    '写入': 'write',
+    '估算': 'estimate',
+    '筛选': 'select',
+    '缓冲': 'spool',
+    '缓存': 'output_cache',
+}
+
+# Prometheus指标名的前缀
+PROMETHEUS_PREFIX = 'gif_maker'
+
+def peak_rss_bytes():
+    """返回当前进程的峰值常驻内存（字节），不支持的平台返回None"""
+    if not RESOURCE_AVAILABLE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux上单位为KB，macOS上单位为字节
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class GifProgress:
+    """
+    一次GIF生成过程的运行状态和度量，可以选择传给各个create_*函数
+
+    其他线程可以调用cancel()请求取消，生成过程在处理下一帧之前检查并抛出GifCancelled，
+    未完成的输出文件会被删除。
+
+    各阶段（见METRIC_STAGE_IDS）的耗时和帧数在处理过程中逐帧累加到stage_times和stage_frames，
+    frames和bytes随每一帧写入增长，成功结束时更新为输出文件的最终帧数和大小，失败时error为错误信息。
+    因此任务运行时就能从另一个线程看出它慢在哪个阶段（例如解码还是LZW编码）。
+
+    callback在事件发生时以callback(progress, event)的形式调用，event为'frame'（写入了一帧）、
+    'finish'（成功结束）或'error'（失败）。回调在执行生成任务的线程中调用，应当尽快返回。
+    """
+
+    def __init__(self, callback=None):
+        """
+        参数:
+            callback: 事件回调函数，None表示不回调
+        """
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self.callback = callback
+        self.frames = 0
+        self.bytes = 0
+        self.stage_times = {}
+        self.stage_frames = {}
+        self.error = None
+        self.success = None
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def cancel(self):
+        """请求取消，可以在任意线程中调用"""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check(self):
+        """已请求取消时抛出GifCancelled"""
+        if self._cancel_event.is_set():
+            raise GifCancelled("任务已取消")
+
+    def watch(self, items):
+        """逐个产出items中的元素，每个元素之前检查是否已请求取消"""
+        for item in items:
+            self.check()
+            yield item
+
+    def _notify(self, event):
+        if self.callback is not None:
+            self.callback(self, event)
+
+    def add_time(self, stage, seconds, frames=0):
+        """累加某个阶段的耗时（秒）和处理的帧数，可以在多个线程中同时调用"""
+        with self._lock:
+            self.stage_times[stage] = self.stage_times.get(stage, 0.0) + seconds
+            self.stage_frames[stage] = self.stage_frames.get(stage, 0) + frames
+
+    def frame_written(self, size):
+        """记录写入了一帧及其字节数"""
+        with self._lock:
+            self.frames += 1
+            self.bytes += size
+        self._notify('frame')
+
+    def finish(self, output_file, frames):
+        """记录成功生成的文件的帧数和大小，一次生成多个文件时output_file为路径列表，大小为各文件之和"""
+        paths = output_file if isinstance(output_file, (list, tuple)) else [output_file]
+        self.frames = frames
+        self.bytes = sum(os.path.getsize(path) for path in paths)
+        self.success = True
+        self.error = None
+        self.elapsed = time.perf_counter() - self.started
+        self._notify('finish')
+
+    def fail(self, message):
+        """记录失败及错误信息"""
+        self.success = False
+        self.error = message
+        self.elapsed = time.perf_counter() - self.started
+        self._notify('error')
+
+    def metrics(self):
+        """
+        以可以JSON序列化的字典返回当前的度量，运行中也可以调用
+
+        返回:
+            dict: success、error、frames、bytes、elapsed（秒）、peak_rss_bytes（整个进程的峰值内存，
+                不支持的平台为None）以及stages（阶段标识 -> {'seconds': 耗时, 'frames': 帧数}）
+        """
+        with self._lock:
+            stages = {
+                METRIC_STAGE_IDS.get(stage, stage): {'seconds': round(seconds, 6), 'frames': self.stage_frames.get(stage, 0)}
+                for stage, seconds in self.stage_times.items()
+            }
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        return {
+            'success': self.success,
+            'error': self.error,
+            'frames': self.frames,
+            'bytes': self.bytes,
+            'elapsed': round(elapsed, 6),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'stages': stages,
+        }
+
+def _prometheus_labels(labels):
+    """把标签字典格式化为Prometheus文本格式的{k="v",...}"""
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+def format_prometheus(entries):
+    """
+    把一个或多个任务的度量格式化为Prometheus文本格式
+
+    参数:
+        entries: (标签字典, GifProgress.metrics()的返回值) 的列表，标签用于区分不同的任务，例如{'output': 'a.gif'}
+
+    返回:
+        str: Prometheus文本格式的指标
+    """
+    gauges = (
+        ('success', '1表示GIF生成成功，0表示失败', lambda m: [({}, 1 if m['success'] else 0)]),
+        ('frames', '写入GIF的帧数', lambda m: [({}, m['frames'])]),
+        ('output_bytes', '输出文件大小（字节）', lambda m: [({}, m['bytes'])]),
+        ('elapsed_seconds', '生成耗时（秒）', lambda m: [({}, m['elapsed'])]),
+        ('peak_rss_bytes', '进程峰值常驻内存（字节）', lambda m: [({}, m['peak_rss_bytes'])] if m['peak_rss_bytes'] is not None else []),
+        ('stage_seconds', '各阶段累计耗时（秒）', lambda m: [({'stage': stage}, value['seconds']) for stage, value in m['stages'].items()]),
+        ('stage_frames', '各阶段处理的帧数', lambda m: [({'stage': stage}, value['frames']) for stage, value in m['stages'].items()]),
+    )
+    lines = []
+    for name, help_text, samples in gauges:
+        lines.append(f'# HELP {PROMETHEUS_PREFIX}_{name} {help_text}')
+        lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name} gauge')
+        for labels, metrics in entries:
+            for extra, value in samples(metrics):
+                lines.append(f'{PROMETHEUS_PREFIX}_{name}{_prometheus_labels(dict(labels, **extra))} {value}')
+    return '\n'.join(lines) + '\n'
+
+def write_prometheus(path, entries):
+    """
+    把度量以Prometheus文本格式写入文件（例如node_exporter的textfile目录）
+
+    先写入同目录下的临时文件再原子地替换，采集方不会读到写了一半的文件。
+
+    参数:
+        path: 输出文件路径
+        entries: 见format_prometheus
+    """
+    output_dir = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=output_dir or '.')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(format_prometheus(entries))
+        os.chmod(tmp_path, _output_file_mode(os.path.dirname(tmp_path)))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _report_failure(message, progress=None):
+    """打印错误信息，同时记录到progress中，返回False"""
+    print(message)
+    if progress is not None:
+        progress.fail(message)
+    return False
+
+def write_gif_frames(frames, output_file, duration=100, loop=0, palette='per-frame', delta_threshold=0, progress=None, shared_palette=None, encode_workers=None, output_format='gif', quality=None):
+    """
+    从任意可迭代对象（包括生成器）中逐帧读取并写入GIF（或动画WebP、APNG）
+
+    参数:
+        frames: Image对象的可迭代对象
+        output_file: 输出的GIF文件路径
+        duration: 每一帧的延迟时间，单位为毫秒
+        loop: 循环次数，0表示无限循环
+        palette: 调色板模式，见PALETTE_MODES。global模式下frames为列表等序列时从均匀采样的帧构建调色板，
+            为生成器时由第一帧构建
+        delta_threshold: 帧间优化时像素视为未变化的最大通道差值，0表示必须完全相同
+        progress: GifProgress对象，用于取消和记录各阶段耗时，None表示不可取消
+        shared_palette: 预先构建好的SharedPalette，global模式下指定时不再从frames采样
+        encode_workers: LZW编码使用的进程数，None或1表示在当前线程中编码，0表示使用全部CPU核心，见GifStreamWriter
+        output_format: 输出格式，见OUTPUT_FORMATS
+        quality: 动画WebP的有损压缩质量（0-100），None表示使用WEBP_QUALITY
+
+    返回:
+        int: 写入的帧数，为0时不会生成输出文件
+    """
+    if output_format == 'gif' and shared_palette is None and palette == 'global' and NUMPY_AVAILABLE and isinstance(frames, collections.abc.Sequence) and frames:
+        samples = _sample_evenly(frames, PALETTE_SAMPLE_FRAMES)
+        start = time.perf_counter()
+        shared_palette = SharedPalette.from_images(samples)
+        if progress is not None:
+            progress.add_time('量化', time.perf_counter() - start)
+    if progress is not None:
+        frames = progress.watch(frames)
+    with open_frame_writer(output_file, output_format, duration, loop, palette, shared_palette, delta_threshold, progress=progress, encode_workers=encode_workers, quality=quality) as writer:
+        for frame in frames:
+            writer.write(frame)
+    return writer.frame_count
+
+class PipelineStage:
+    """
+    流水线中的一个阶段
 
-def resize_images(image_list, target_size=None, keep_aspect_ratio=True, fill_mode='fill'):
+    func接收上一阶段输出的迭代器，返回本阶段输出的迭代器（第一个阶段收到的是空迭代器）。
+    运行过程中可以从items、busy_time和throughput读取本阶段的吞吐量统计，
+    busy_time不包括等待上游数据和等待下游队列空位的时间。
     """
-    将图片列表中的所有图片调整为统一大小
-    
+
+    def __init__(self, name, func, record=True):
+        """
+        参数:
+            name: 阶段名称
+            func: 阶段处理函数
+            record: 是否把本阶段的耗时记入run_pipeline的progress，阶段内部自行记录时为False
+        """
+        self.name = name
+        self.func = func
+        self.record = record
+        self.items = 0
+        self.busy_time = 0.0
+        self.wait_time = 0.0
+
+    @property
+    def throughput(self):
+        """本阶段单独运行时每秒能处理的帧数"""
+        return self.items / self.busy_time if self.busy_time > 0 else float('inf')
+
+# 流水线相邻阶段之间的队列长度，决定了同时在内存中的帧数上限
+PIPELINE_QUEUE_SIZE = 4
+
+_PIPELINE_END = object()
+
+class _PipelineAborted(Exception):
+    """其他阶段出错时用于结束当前阶段的内部异常"""
+
+def _pipeline_get(q, stop, stage):
+    """从队列中逐个取出数据直到结束标记，并统计等待时间"""
+    while True:
+        start = time.perf_counter()
+        while True:
+            if stop.is_set():
+                raise _PipelineAborted()
+            try:
+                item = q.get(timeout=0.1)
+                break
+            except queue.Empty:
+                pass
+        stage.wait_time += time.perf_counter() - start
+        if item is _PIPELINE_END:
+            return
+        yield item
+
+def _pipeline_put(q, item, stop, stage):
+    """向队列放入数据，下游出错时放弃，并统计等待时间"""
+    start = time.perf_counter()
+    while True:
+        if stop.is_set():
+            raise _PipelineAborted()
+        try:
+            q.put(item, timeout=0.1)
+            break
+        except queue.Full:
+            pass
+    stage.wait_time += time.perf_counter() - start
+
+def run_pipeline(stages, queue_size=PIPELINE_QUEUE_SIZE, progress=None):
+    """
+    在各自的线程中并发运行流水线的各个阶段
+
+    相邻阶段之间通过有界队列连接，上游过快时会被阻塞，同时在内存中的数据量有上限。
+    最后一个阶段的输出会被丢弃。任何一个阶段出错时，其余阶段都会停止，异常在调用方线程中重新抛出。
+
+    参数:
+        stages: PipelineStage列表，按数据流动顺序排列
+        queue_size: 相邻阶段之间的队列长度
+        progress: GifProgress对象，各阶段每输出一项就记录一次耗时，None表示不记录
+
+    返回:
+        list: 传入的stages，其中已填好吞吐量统计
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages[1:]]
+    stop = threading.Event()
+    errors = []
+
+    def run_stage(index, stage):
+        in_queue = queues[index - 1] if index > 0 else None
+        out_queue = queues[index] if index < len(queues) else None
+        record = progress is not None and stage.record
+        # 上一次记录耗时的时间点，以及当时已累计的等待时间
+        mark = time.perf_counter()
+        waited = 0.0
+
+        def account(items):
+            nonlocal mark, waited
+            now = time.perf_counter()
+            busy = now - mark - (stage.wait_time - waited)
+            stage.busy_time += busy
+            stage.items += items
+            if record:
+                progress.add_time(stage.name, busy, items)
+            mark, waited = now, stage.wait_time
+
+        try:
+            inputs = _pipeline_get(in_queue, stop, stage) if in_queue is not None else iter(())
+            for item in stage.func(inputs):
+                account(1)
+                if out_queue is not None:
+                    _pipeline_put(out_queue, item, stop, stage)
+            if out_queue is not None:
+                _pipeline_put(out_queue, _PIPELINE_END, stop, stage)
+        except _PipelineAborted:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            account(0)
+
+    threads = [
+        threading.Thread(target=run_stage, args=(index, stage), name=f'pipeline-{stage.name}', daemon=True)
+        for index, stage in enumerate(stages)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return stages
+
+def print_pipeline_stats(stages):
+    """打印流水线各阶段的吞吐量，并指出瓶颈阶段"""
+    print("流水线各阶段吞吐量:")
+    for stage in stages:
+        print(f"  {stage.name}: {stage.items} 帧, 耗时 {stage.busy_time:.2f}秒, {stage.throughput:.1f} 帧/秒")
+    bottleneck = min(stages, key=lambda stage: stage.throughput)
+    print(f"瓶颈阶段: {bottleneck.name}")
+
+def read_image_header(img_path):
+    """
+    只读取图片的文件头，不解码像素数据，读取后立即关闭文件
+
+    返回:
+        tuple: (大小, 模式)
+    """
+    with Image.open(img_path) as img:
+        return img.size, img.mode
+
+def load_image(img_path):
+    """
+    解码一张图片并关闭文件，返回的Image对象不再占用文件句柄
+
+    返回:
+        Image: 已解码的Image对象
+    """
+    with open(img_path, 'rb') as f:
+        img = Image.open(f)
+        img.load()
+    return img
+
+class LazyImageList(collections.abc.Sequence):
+    """
+    按需解码的图片序列
+
+    创建时只读取每个图片文件的文件头（大小和模式），提前发现无法读取的文件并跳过；
+    每次取出元素时才解码对应的图片，解码后立即关闭文件。逐个迭代时同时打开的文件数
+    和占用的内存与图片总数无关。
+    """
+
+    def __init__(self, image_list, progress=None):
+        """
+        参数:
+            image_list: 图片文件路径或Image对象的列表，无法读取的文件和不支持的类型会被跳过
+            progress: GifProgress对象，打开文件和解码的耗时记入“解码”阶段，None表示不记录
+        """
+        self.items = []
+        self.sizes = []
+        self.modes = []
+        self.progress = progress
+        start = time.perf_counter()
+        for item in image_list:
+            if isinstance(item, str):
+                try:
+                    size, mode = read_image_header(item)
+                except Exception as e:
+                    print(f"警告: 忽略无法读取的图片 {item}: {e}")
+                    continue
+            elif isinstance(item, Image.Image):
+                size, mode = item.size, item.mode
+            else:
+                print(f"警告: 忽略不支持的项目类型: {type(item)}")
+                continue
+            self.items.append(item)
+            self.sizes.append(size)
+            self.modes.append(mode)
+        if progress is not None:
+            progress.add_time('解码', time.perf_counter() - start)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        item = self.items[index]
+        if not isinstance(item, str):
+            return item
+        start = time.perf_counter()
+        img = load_image(item)
+        if self.progress is not None:
+            self.progress.add_time('解码', time.perf_counter() - start, 1)
+        return img
+
+    @property
+    def paths(self):
+        """序列中的图片文件路径"""
+        return [item for item in self.items if isinstance(item, str)]
+
+# 调整大小时可选的重采样滤镜：lanczos质量最好（默认），bilinear更快，area按区域取平均，缩小时最快
+RESAMPLE_FILTERS = {
+    'lanczos': Image.Resampling.LANCZOS,
+    'bilinear': Image.Resampling.BILINEAR,
+    'area': Image.Resampling.BOX,
+}
+
+# 缩小倍数较大时先按整数倍快速缩小，再对不超过目标大小该倍数的图片做精确重采样，
+# 与Image.thumbnail的默认值相同，结果与直接重采样几乎没有差别
+RESAMPLE_REDUCING_GAP = 2.0
+
+def resolve_resample(resample):
+    """
+    检查重采样滤镜名称
+
+    返回:
+        str: 重采样滤镜名称，见RESAMPLE_FILTERS
+    """
+    if resample not in RESAMPLE_FILTERS:
+        raise ValueError(f"不支持的重采样滤镜: {resample}，可选值为 {', '.join(RESAMPLE_FILTERS)}")
+    return resample
+
+def plan_transform(src_size, target_size, keep_aspect_ratio=True, fill_mode='fill'):
+    """
+    计算调整大小的方案
+
+    先在源图片上确定需要保留的区域，之后只对这部分像素做一次重采样，
+    不需要先缩放到比目标更大的中间图片再裁剪。
+
+    参数:
+        src_size: 源图片大小，格式为(宽, 高)
+        target_size: 目标大小，格式为(宽, 高)
+        keep_aspect_ratio: 是否保持原始宽高比
+        fill_mode: 填充模式，'center'或'fill'
+
+    返回:
+        tuple: (裁剪框, 缩放后的大小, 画布位置)。裁剪框为源图片坐标中的(左, 上, 右, 下)，可以是小数；
+            画布位置为缩放结果在目标大小的透明画布上的左上角坐标，为None表示缩放结果就是最终画面。
+            fill_mode无效时返回None
+    """
+    src_width, src_height = src_size
+    target_width, target_height = target_size
+    full_box = (0, 0, src_width, src_height)
+    if not keep_aspect_ratio:
+        # 不保持宽高比，直接调整到目标大小
+        return full_box, (target_width, target_height), None
+    if fill_mode == 'fill':
+        # 以较大的缩放比例填满画面，只保留源图片中央与目标宽高比相同的区域
+        scale = max(target_width / src_width, target_height / src_height)
+        crop_width = min(src_width, target_width / scale)
+        crop_height = min(src_height, target_height / scale)
+        # 宽高比相同时浮点误差可能得到极小的负数，Pillow不接受超出源图片的裁剪框
+        left = max(0.0, (src_width - crop_width) / 2)
+        top = max(0.0, (src_height - crop_height) / 2)
+        return (left, top, left + crop_width, top + crop_height), (target_width, target_height), None
+    if fill_mode == 'center':
+        # 以较小的缩放比例完整放入画面（只缩小不放大），居中放置
+        scale = min(target_width / src_width, target_height / src_height, 1)
+        width = max(1, round(src_width * scale))
+        height = max(1, round(src_height * scale))
+        return full_box, (width, height), ((target_width - width) // 2, (target_height - height) // 2)
+    return None
+
+def _render_transform(img, plan, target_size, resample='lanczos', origin=(0, 0)):
+    """
+    按plan_transform的方案调整图片大小
+
+    参数:
+        img: Image对象，可以只是源图片中包含裁剪框的一部分
+        plan: plan_transform的返回值
+        target_size: 目标大小，格式为(宽, 高)
+        resample: 重采样滤镜，见RESAMPLE_FILTERS
+        origin: img左上角在源图片中的坐标
+
+    返回:
+        Image: 调整大小后的Image对象
+    """
+    box, size, offset = plan
+    box = (box[0] - origin[0], box[1] - origin[1], box[2] - origin[0], box[3] - origin[1])
+    if img.mode in ('1', 'P', 'PA'):
+        # 调色板图片只能按最近邻缩放，先转换为真彩色
+        img = img.convert('RGBA' if img.mode == 'PA' or 'transparency' in img.info else 'RGB')
+    if size != img.size or box != (0, 0, img.width, img.height):
+        img = img.resize(size, RESAMPLE_FILTERS[resample], box=box, reducing_gap=RESAMPLE_REDUCING_GAP)
+    elif offset is None:
+        img = img.copy()
+    if offset is None:
+        return img
+    # 创建一个新的透明背景图像，将调整后的图像粘贴到中心位置
+    canvas = Image.new("RGBA", target_size, (255, 255, 255, 0))
+    canvas.paste(img, offset)
+    return canvas
+
+def transform_image(img, target_size, keep_aspect_ratio=True, fill_mode='fill', resample='lanczos'):
+    """
+    将单张图片调整为目标大小
+
+    参数:
+        img: Image对象，不会被修改
+        target_size: 目标大小，格式为(宽, 高)
+        keep_aspect_ratio: 是否保持原始宽高比
+        fill_mode: 填充模式，'center'或'fill'
+        resample: 重采样滤镜，见RESAMPLE_FILTERS
+
+    返回:
+        Image: 调整大小后的Image对象，fill_mode无效时返回None
+    """
+    plan = plan_transform(img.size, target_size, keep_aspect_ratio, fill_mode)
+    if plan is None:
+        return None
+    box, size, _ = plan
+    # 尚未解码的JPEG可以在解码时直接按1/2、1/4或1/8缩小，draft对其他图片不起作用
+    scale_x = size[0] / (box[2] - box[0]) * RESAMPLE_REDUCING_GAP
+    scale_y = size[1] / (box[3] - box[1]) * RESAMPLE_REDUCING_GAP
+    if scale_x < 1 and scale_y < 1:
+        src_size = img.size
+        if img.draft(img.mode, (math.ceil(src_size[0] * scale_x), math.ceil(src_size[1] * scale_y))) and img.size != src_size:
+            plan = plan_transform(img.size, target_size, keep_aspect_ratio, fill_mode)
+    return _render_transform(img, plan, target_size, resample)
+
+def _load_resized_image(img_path, target_size, keep_aspect_ratio=True, fill_mode='fill', resample='lanczos'):
+    """
+    打开并调整一张图片的大小，读取完成后立即关闭文件
+
+    返回:
+        Image: 调整大小后的RGB、RGBA或其他非调色板模式的Image对象，填充模式无效时返回None
+    """
+    with Image.open(img_path) as img:
+        return transform_image(img, target_size, keep_aspect_ratio, fill_mode, resample)
+
+def _resize_image_file(task):
+    """
+    进程池的工作函数：打开并调整一张图片的大小
+
+    只把结果的原始像素数据传回主进程，避免对Image对象整体序列化。
+
+    参数:
+        task: (图片路径, 目标大小, 是否保持宽高比, 填充模式, 重采样滤镜)
+
+    返回:
+        tuple: (模式, 大小, 像素数据)，出错时为(None, None, 错误信息)
+    """
+    try:
+        img = _load_resized_image(*task)
+        if img is None:
+            return None, None, None
+        return img.mode, img.size, img.tobytes()
+    except Exception as e:
+        return None, None, str(e)
+
+def resolve_workers(workers):
+    """
+    解析并行进程数
+
+    参数:
+        workers: 进程数，None或1表示不并行，0或负数表示使用全部CPU核心
+
+    返回:
+        int: 实际使用的进程数
+    """
+    if workers is None:
+        return 1
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+# 帧缓存格式版本，缩放逻辑或存储格式变化时递增，使旧缓存失效
+FRAME_CACHE_VERSION = 2
+
+# 帧缓存的默认大小上限（字节）
+FRAME_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# 可以按原样存入帧缓存的图片模式，读取时由数组的通道数还原
+_FRAME_CACHE_MODES = ('L', 'LA', 'RGB', 'RGBA')
+
+class FrameCache:
+    """
+    调整大小后的帧的磁盘缓存
+
+    缓存键由图片文件内容的哈希、目标大小、是否保持宽高比、填充模式和重采样滤镜组成，因此修改帧延迟、
+    输出文件名或调色板等参数后重新生成GIF时，不需要再次解码和缩放图片。每一帧以未压缩的
+    .npy格式保存，读取时通过内存映射直接使用。缓存总大小超过上限时，按最近使用时间淘汰
+    最久未使用的条目（命中时会更新文件的修改时间）。
+    """
+
+    def __init__(self, cache_dir, max_bytes=FRAME_CACHE_MAX_BYTES):
+        """
+        参数:
+            cache_dir: 缓存目录，不存在时自动创建
+            max_bytes: 缓存总大小上限（字节）
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def file_digest(img_path):
+        """计算图片文件内容的SHA-1哈希"""
+        digest = hashlib.sha1()
+        with open(img_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def key(self, img_path, target_size, keep_aspect_ratio=True, fill_mode='fill', resample='lanczos'):
+        """
+        计算一张图片在给定缩放参数下的缓存键
+
+        返回:
+            str: 缓存键，可作为文件名
+        """
+        params = f"{FRAME_CACHE_VERSION}|{target_size}|{bool(keep_aspect_ratio)}|{fill_mode}|{resample}"
+        return hashlib.sha1(f"{self.file_digest(img_path)}|{params}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npy')
+
+    def get(self, key):
+        """
+        读取缓存的帧
+
+        返回:
+            Image: 缓存命中时返回Image对象，否则返回None
+        """
+        path = self._path(key)
+        try:
+            array = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return Image.fromarray(array)
+
+    def put(self, key, img):
+        """
+        把调整大小后的帧写入缓存，写入过程中的文件不会被读取到
+
+        参数:
+            key: 缓存键
+            img: Image对象
+        """
+        if img.mode not in _FRAME_CACHE_MODES:
+            has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+            img = img.convert('RGBA' if has_alpha else 'RGB')
+        fd, temp_path = tempfile.mkstemp(suffix='.npy.tmp', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.asarray(img))
+            os.chmod(temp_path, _output_file_mode(self.cache_dir))
+            os.replace(temp_path, self._path(key))
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def prune(self):
+        """
+        淘汰最久未使用的条目，直到缓存总大小不超过上限
+
+        返回:
+            int: 淘汰的条目数
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npy') and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+def open_frame_cache(cache_dir, max_bytes=FRAME_CACHE_MAX_BYTES):
+    """
+    创建帧缓存，未指定缓存目录或未安装numpy时返回None
+
+    参数:
+        cache_dir: 缓存目录，None表示不使用缓存
+        max_bytes: 缓存总大小上限（字节）
+
+    返回:
+        FrameCache: 帧缓存对象或None
+    """
+    if cache_dir is None:
+        return None
+    if not NUMPY_AVAILABLE:
+        print("警告: 帧缓存需要numpy库，本次不使用缓存。请使用 'pip install numpy' 安装。")
+        return None
+    return FrameCache(cache_dir, max_bytes)
+
+# 输出缓存格式版本，渲染逻辑变化导致相同参数的输出不同时递增，使旧缓存失效
+OUTPUT_CACHE_VERSION = 1
+
+# 输出缓存的默认大小上限（字节）
+OUTPUT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# 不影响输出内容、不计入输出缓存键的参数
+OUTPUT_CACHE_IGNORED = ('input_dir', 'video_path', 'output_file', 'workers', 'cache', 'progress', 'encode_workers', 'output_cache')
+
+def _link_or_copy(src, dst):
+    """把src原子地放到dst：优先创建硬链接，跨文件系统等无法链接时复制"""
+    directory = os.path.dirname(dst) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(dst) + '.', suffix='.tmp', dir=directory)
+    os.close(fd)
+    try:
+        os.remove(tmp_path)
+        try:
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copyfile(src, tmp_path)
+            os.chmod(tmp_path, _output_file_mode(os.path.dirname(tmp_path)))
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class OutputCache:
+    """
+    生成结果（整个输出文件）的磁盘缓存
+
+    缓存键由输入文件的身份（真实路径、大小和修改时间）以及所有影响输出内容的参数组成，
+    输出文件名、进程数等不影响内容的参数不计入（见OUTPUT_CACHE_IGNORED）。用相同的输入和参数再次生成时，
+    直接把缓存的文件硬链接（无法链接时复制）到输出路径，不再解码和编码。
+
+    条目与帧数记录都先写入临时文件再原子地替换，多个进程可以同时使用同一个缓存目录；
+    输出文件总是整体替换而不会就地修改，因此与缓存条目共享数据是安全的。缓存总大小超过上限时，
+    按最近使用时间淘汰最久未使用的条目（命中时会更新文件的修改时间）。
+    """
+
+    def __init__(self, cache_dir, max_bytes=OUTPUT_CACHE_MAX_BYTES):
+        """
+        参数:
+            cache_dir: 缓存目录，不存在时自动创建
+            max_bytes: 缓存总大小上限（字节）
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def file_identity(path):
+        """返回输入文件的身份：真实路径、大小和修改时间（纳秒）"""
+        stat = os.stat(path)
+        return [os.path.realpath(path), stat.st_size, stat.st_mtime_ns]
+
+    def key(self, input_paths, params):
+        """
+        计算一次生成的缓存键
+
+        参数:
+            input_paths: 输入文件路径列表
+            params: 影响输出内容的参数字典，值必须可以JSON序列化
+
+        返回:
+            str: 缓存键，可作为文件名
+        """
+        data = {
+            'version': OUTPUT_CACHE_VERSION,
+            'inputs': [self.file_identity(path) for path in input_paths],
+            'params': params,
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.out')
+
+    def get(self, key, output_file):
+        """
+        缓存命中时把缓存的文件放到output_file
+
+        返回:
+            int: 命中时返回输出的帧数，否则返回None
+        """
+        path = self._path(key)
+        try:
+            with open(path + '.json', 'r', encoding='utf-8') as f:
+                frames = json.load(f)['frames']
+            _link_or_copy(path, output_file)
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return frames
+
+    def put(self, key, output_file, frames):
+        """
+        把生成好的输出文件加入缓存，然后淘汰超出上限的条目
+
+        参数:
+            key: 缓存键
+            output_file: 已经生成的输出文件
+            frames: 输出的帧数
+        """
+        fd, temp_path = tempfile.mkstemp(suffix='.json.tmp', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'frames': frames}, f)
+            os.chmod(temp_path, _output_file_mode(os.path.dirname(temp_path)))
+            os.replace(temp_path, self._path(key) + '.json')
+        except Exception:
+            os.remove(temp_path)
+            raise
+        _link_or_copy(output_file, self._path(key))
+        self.prune()
+
+    def prune(self):
+        """
+        淘汰最久未使用的条目，直到缓存总大小不超过上限
+
+        返回:
+            int: 淘汰的条目数
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.out') and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                os.remove(path + '.json')
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def render(self, func, options, input_paths):
+        """
+        带缓存地调用一个create_*函数：命中时直接放置缓存的文件，否则调用func生成并加入缓存
+
+        参数:
+            func: 生成函数，以关键字参数options调用，返回是否成功
+            options: func的全部参数，其中output_cache必须为None，
+                不在OUTPUT_CACHE_IGNORED中的参数都计入缓存键
+            input_paths: 输入文件路径列表
+
+        返回:
+            bool: 是否成功
+        """
+        output_file, progress = options['output_file'], options['progress']
+        params = {name: value for name, value in options.items() if name not in OUTPUT_CACHE_IGNORED}
+        try:
+            # 格式由扩展名推断时，输出文件名会影响内容
+            params['output_format'] = resolve_output_format(params.get('output_format'), output_file)
+            # 使用帧缓冲时调色板来自全部输出帧，与目录本身无关
+            if 'spool_dir' in params:
+                params['spool_dir'] = params['spool_dir'] is not None
+            start = time.perf_counter()
+            key = self.key(input_paths, params)
+            frames = self.get(key, output_file)
+        except (OSError, ValueError, TypeError) as e:
+            # 输入文件不存在等情况交给func报告
+            print(f"警告: 无法使用输出缓存: {e}")
+            return func(**options)
+        if progress is not None:
+            progress.add_time('缓存', time.perf_counter() - start)
+        if frames is not None:
+            print(f"命中输出缓存，已生成: {output_file}（共 {frames} 帧）")
+            if progress is not None:
+                progress.finish(output_file, frames)
+            return True
+
+        # 需要生成后的帧数写入缓存，没有传入progress时使用一个临时的
+        if progress is None:
+            options = dict(options, progress=GifProgress())
+        if not func(**options):
+            return False
+        start = time.perf_counter()
+        try:
+            self.put(key, output_file, options['progress'].frames)
+        except OSError as e:
+            print(f"警告: 无法写入输出缓存: {e}")
+        if progress is not None:
+            progress.add_time('缓存', time.perf_counter() - start)
+        return True
+
+def open_output_cache(cache_dir, max_bytes=OUTPUT_CACHE_MAX_BYTES):
+    """
+    创建输出缓存，未指定缓存目录时返回None
+
+    参数:
+        cache_dir: 缓存目录，None表示不使用缓存
+        max_bytes: 缓存总大小上限（字节）
+
+    返回:
+        OutputCache: 输出缓存对象或None
+    """
+    if cache_dir is None:
+        return None
+    return OutputCache(cache_dir, max_bytes)
+
+# 帧缓冲文件的默认大小上限（字节）
+FRAME_SPOOL_MAX_BYTES = 16 * 1024 * 1024 * 1024
+
+# 读取帧缓冲时每次映射的文件区域大小（字节）。读完的区域在其中的帧都被释放后解除映射，
+# 顺序读取整个文件时进程的常驻内存不会随文件大小增长
+FRAME_SPOOL_WINDOW_BYTES = 64 * 1024 * 1024
+
+class FrameSpoolFull(Exception):
+    """帧缓冲文件超出了大小上限"""
+
+class FrameSpool(collections.abc.Sequence):
+    """
+    内存映射的原始帧缓冲文件，用于需要多次读取全部帧的处理（例如先从所有帧构建调色板再编码）
+
+    每一帧以固定步长（一帧未压缩的字节数）依次写入一个临时文件，读取时通过只读的内存映射随机访问，
+    不需要重新解码视频，也不需要在内存中保存所有帧：写入直接经过文件描述符，读取时每次只映射
+    FRAME_SPOOL_WINDOW_BYTES大小的区域，文件内容由操作系统的页缓存管理，总大小可以超过物理内存。内存中只有一个很小的索引
+    （每一帧所在的槽位和延迟），连续重复的同一个对象（输出fps高于源视频时）只写入一次。
+
+    临时文件创建后即从目录中删除（Windows上在关闭时删除），调用close()、对象被回收或进程异常退出后
+    都不会残留。所有帧的形状必须与第一帧相同。
+    """
+
+    def __init__(self, spool_dir=None, max_bytes=FRAME_SPOOL_MAX_BYTES):
+        """
+        参数:
+            spool_dir: 临时文件所在的目录，不存在时自动创建，None表示使用系统临时目录
+            max_bytes: 文件大小上限（字节），写入超出上限的帧时抛出FrameSpoolFull
+        """
+        self.spool_dir = spool_dir
+        self.max_bytes = max_bytes
+        self.durations = []
+        self._slots = []
+        self._count = 0
+        self._shape = None
+        self._file = None
+        # 当前映射的区域 (第一个槽位, 内存映射数组)
+        self._window = None
+        self._last = None
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __getitem__(self, index):
+        """返回一帧的只读数组（内存映射的视图，不复制）"""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        slot = self._slots[index]
+        per_window = max(1, FRAME_SPOOL_WINDOW_BYTES // math.prod(self._shape))
+        first = slot - slot % per_window
+        if self._window is None or self._window[0] != first or slot - first >= len(self._window[1]):
+            # 之前返回的视图仍然引用原来的映射，它们都被释放后原来的映射才会解除
+            count = min(per_window, self._count - first)
+            mapped = np.memmap(self._file, dtype=np.uint8, mode='r', offset=first * math.prod(self._shape), shape=(count,) + self._shape)
+            self._window = (first, mapped)
+        return self._window[1][slot - first]
+
+    @property
+    def nbytes(self):
+        """已写入的帧占用的字节数"""
+        return self._count * math.prod(self._shape) if self._shape else 0
+
+    def append(self, frame, duration=None):
+        """
+        写入一帧
+
+        参数:
+            frame: Image对象或uint8数组
+            duration: 该帧的延迟时间（毫秒），不需要时为None
+        """
+        if frame is self._last:
+            self._slots.append(self._slots[-1])
+            self.durations.append(duration)
+            return
+        arr = np.asarray(frame, dtype=np.uint8)
+        if self._shape is None:
+            self._shape = arr.shape
+            if self.spool_dir:
+                os.makedirs(self.spool_dir, exist_ok=True)
+            self._file = tempfile.TemporaryFile(prefix='gif_maker_spool_', dir=self.spool_dir, buffering=0)
+        elif arr.shape != self._shape:
+            raise ValueError(f"帧的形状 {arr.shape} 与第一帧 {self._shape} 不同")
+        stride = arr.nbytes
+        if (self._count + 1) * stride > self.max_bytes:
+            raise FrameSpoolFull(f"帧缓冲文件超出大小上限 {self.max_bytes // (1024 * 1024)} MB")
+        self._file.seek(self._count * stride)
+        self._file.write(np.ascontiguousarray(arr).data)
+        self._slots.append(self._count)
+        self.durations.append(duration)
+        self._count += 1
+        self._last = frame
+
+    def close(self):
+        """关闭并删除临时文件"""
+        self._window = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+class SpooledImageList(collections.abc.Sequence):
+    """以Image对象的形式逐帧读取FrameSpool的序列，取出时才创建Image对象"""
+
+    def __init__(self, spool):
+        """
+        参数:
+            spool: 已写入帧的FrameSpool，由本对象负责关闭
+        """
+        self.spool = spool
+
+    def __len__(self):
+        return len(self.spool)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return Image.fromarray(self.spool[index])
+
+    def close(self):
+        """关闭并删除帧缓冲文件"""
+        self.spool.close()
+
+# 并行调整大小时每个进程最多预先提交的图片数，决定了同时在内存中的帧数上限
+RESIZE_PREFETCH_PER_WORKER = 2
+
+def iter_resized_images(image_list, target_size=None, keep_aspect_ratio=True, fill_mode='fill', workers=None, cache=None, progress=None, resample='lanczos'):
+    """
+    按顺序逐张产出调整大小后的图片
+
+    每张图片在即将被使用前才解码，多进程时也只预先提交有限数量的图片，
+    因此同时打开的文件数和占用的内存与图片总数无关。
+
     参数:
         image_list: 图片文件路径列表
         target_size: 目标大小，格式为(宽, 高)。如果为None，则使用第一张图片的大小
         keep_aspect_ratio: 是否保持原始宽高比
-        fill_mode: 填充模式，可选值：
-            - 'center': 居中放置，周围可能有透明区域
-            - 'fill': 缩放并裁剪，确保填满整个画面
-    
+        fill_mode: 填充模式，见resize_images
+        workers: 并行处理的进程数，None或1表示在当前进程中逐张处理，0表示使用全部CPU核心
+        cache: FrameCache对象，命中缓存的图片不再解码和缩放，None表示不使用缓存
+        progress: GifProgress对象，用于取消和统计调整大小（包括解码）的耗时，None表示不可取消
+        resample: 重采样滤镜，见RESAMPLE_FILTERS
+
     返回:
-        list: 调整大小后的Image对象列表
+        generator: 调整大小后的Image对象，无法处理的图片会被跳过
     """
     if not image_list:
-        return []
+        return
+    resample = resolve_resample(resample)
     
-    # 如果没有指定目标大小，使用第一张图片的大小
+    # 如果没有指定目标大小，使用第一张图片的大小（只读取文件头）
     if target_size is None:
-        first_img = Image.open(image_list[0])
-        target_size = first_img.size
+        target_size = read_image_header(image_list[0])[0]
+    target_size = tuple(target_size)
     
-    resized_images = []
-    for img_path in image_list:
+    workers = min(resolve_workers(workers), len(image_list))
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    # 等待产出的图片：(路径, 缓存键, 缓存命中的帧, 子进程的Future)
+    pending = collections.deque()
+    hits = 0
+    stored = 0
+    
+    def resolve(img_path, key, cached, future):
+        nonlocal stored
+        if cached is not None:
+            return cached
+        start = time.perf_counter()
+        img = None
         try:
-            img = Image.open(img_path)
-            
-            if keep_aspect_ratio:
-                if fill_mode == 'center':
-                    # 保持宽高比的调整大小，居中放置
-                    img.thumbnail(target_size, Image.Resampling.LANCZOS)
-                    # 创建一个新的透明背景图像
-                    new_img = Image.new("RGBA", target_size, (255, 255, 255, 0))
-                    # 将调整后的图像粘贴到中心位置
-                    paste_x = (target_size[0] - img.width) // 2
-                    paste_y = (target_size[1] - img.height) // 2
-                    new_img.paste(img, (paste_x, paste_y))
-                    resized_images.append(new_img)
-                elif fill_mode == 'fill':
-                    # 保持宽高比但确保填满整个画面（可能会裁剪部分内容）
-                    # 计算宽高比
-                    target_ratio = target_size[0] / target_size[1]
-                    img_ratio = img.width / img.height
-                    
-                    if img_ratio > target_ratio:
-                        # 图片较宽，以高度为准进行缩放，然后裁剪宽度
-                        new_height = target_size[1]
-                        new_width = int(new_height * img_ratio)
-                        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                        # 裁剪中心部分
-                        left = (new_width - target_size[0]) // 2
-                        img = img.crop((left, 0, left + target_size[0], new_height))
-                    else:
-                        # 图片较高，以宽度为准进行缩放，然后裁剪高度
-                        new_width = target_size[0]
-                        new_height = int(new_width / img_ratio)
-                        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                        # 裁剪中心部分
-                        top = (new_height - target_size[1]) // 2
-                        img = img.crop((0, top, new_width, top + target_size[1]))
-                    
-                    resized_images.append(img)
+            if future is not None:
+                mode, size, data = future.result()
+                if mode is not None:
+                    # frombuffer直接引用传回的像素数据，不再额外拷贝
+                    img = Image.frombuffer(mode, size, data, 'raw', mode, 0, 1)
+                elif data is not None:
+                    print(f"调整图片 {img_path} 大小时出错: {data}")
             else:
-                # 不保持宽高比，直接调整到目标大小
-                resized_img = img.resize(target_size, Image.Resampling.LANCZOS)
-                resized_images.append(resized_img)
-                
+                img = _load_resized_image(img_path, target_size, keep_aspect_ratio, fill_mode, resample)
         except Exception as e:
             print(f"调整图片 {img_path} 大小时出错: {e}")
+        if img is not None and key is not None:
+            try:
+                cache.put(key, img)
+                stored += 1
+            except OSError as e:
+                print(f"警告: 写入帧缓存失败: {e}")
+        if progress is not None:
+            progress.add_time('调整大小', time.perf_counter() - start, 1 if img is not None else 0)
+        return img
+    
+    try:
+        for img_path in (progress.watch(image_list) if progress is not None else image_list):
+            key = cached = future = None
+            if cache is not None:
+                try:
+                    key = cache.key(img_path, target_size, keep_aspect_ratio, fill_mode, resample)
+                    cached = cache.get(key)
+                except OSError as e:
+                    print(f"读取图片 {img_path} 时出错: {e}")
+                    continue
+                hits += cached is not None
+            if cached is None and executor is not None:
+                # 解码和缩放在子进程中并行完成，按提交顺序取回结果
+                future = executor.submit(_resize_image_file, (img_path, target_size, keep_aspect_ratio, fill_mode, resample))
+            pending.append((img_path, key, cached, future))
+            if len(pending) > workers * RESIZE_PREFETCH_PER_WORKER:
+                img = resolve(*pending.popleft())
+                if img is not None:
+                    yield img
+        while pending:
+            img = resolve(*pending.popleft())
+            if img is not None:
+                yield img
+    finally:
+        if executor is not None:
+            # 提前结束（出错、取消或调用方不再迭代）时丢弃尚未开始的任务
+            executor.shutdown(wait=False, cancel_futures=True)
+        if cache is not None:
+            # 提前结束时已经写入的帧同样计入大小上限
+            try:
+                cache.prune()
+            except OSError as e:
+                print(f"警告: 清理帧缓存失败: {e}")
+            print(f"帧缓存: 命中 {hits} 张，新缓存 {stored} 张")
+
+def resize_images(image_list, target_size=None, keep_aspect_ratio=True, fill_mode='fill', workers=None, cache=None, progress=None, resample='lanczos'):
+    """
+    将图片列表中的所有图片调整为统一大小
+    
+    参数:
+        image_list: 图片文件路径列表
+        target_size: 目标大小，格式为(宽, 高)。如果为None，则使用第一张图片的大小
+        keep_aspect_ratio: 是否保持原始宽高比
+        fill_mode: 填充模式，可选值：
+            - 'center': 居中放置，周围可能有透明区域
+            - 'fill': 缩放并裁剪，确保填满整个画面
+        workers: 并行处理的进程数，None或1表示在当前进程中逐张处理，0表示使用全部CPU核心
+        cache: FrameCache对象，命中缓存的图片不再解码和缩放，None表示不使用缓存
+        progress: GifProgress对象，用于取消，None表示不可取消
+        resample: 重采样滤镜，见RESAMPLE_FILTERS
     
-    return resized_images
+    返回:
+        list: 调整大小后的Image对象列表，顺序与image_list一致
+    """
+    return list(iter_resized_images(image_list, target_size, keep_aspect_ratio, fill_mode, workers, cache, progress, resample))
 
-def create_gif_with_resize(image_list, output_file, duration=100, target_size=None, keep_aspect_ratio=True, fill_mode='fill'):
+def create_gif_with_resize(image_list, output_file, duration=100, target_size=None, keep_aspect_ratio=True, fill_mode='fill', workers=None, palette='per-frame', delta_threshold=0, cache=None, progress=None, resample='lanczos', encode_workers=None, output_format=None, quality=None):
     """
     将多张图片调整为统一大小后合并成一张GIF动态图片
     
@@ -112,96 +2382,91 @@ def create_gif_with_resize(image_list, output_file, duration=100, target_size=No
         duration: 每一帧的延迟时间，单位为毫秒
         target_size: 目标大小，格式为(宽, 高)。如果为None，则使用第一张图片的大小
         keep_aspect_ratio: 是否保持原始宽高比
+        workers: 并行调整大小的进程数，None或1表示不并行，0表示使用全部CPU核心
+        palette: 调色板模式，见PALETTE_MODES
+        delta_threshold: 帧间优化时像素视为未变化的最大通道差值，0表示必须完全相同
+        cache: FrameCache对象，用于复用之前调整过大小的帧，None表示不使用缓存
+        progress: GifProgress对象，用于取消以及获取帧数、文件大小和各阶段耗时
+        resample: 重采样滤镜，见RESAMPLE_FILTERS
+        encode_workers: LZW编码使用的进程数，None或1表示在当前线程中编码，0表示使用全部CPU核心，见GifStreamWriter
+        output_format: 输出格式，见OUTPUT_FORMATS，None表示根据output_file的扩展名推断（.webp、.png/.apng，其他为gif）。
+            webp和apng保存真彩色帧，palette和delta_threshold不起作用，见AnimationWriter
+        quality: 动画WebP的有损压缩质量（0-100），None表示使用WEBP_QUALITY
     
     返回:
         bool: 是否成功创建GIF
     """
     try:
-        # 调整所有图片大小
-        resized_images = resize_images(image_list, target_size, keep_aspect_ratio, fill_mode)
-        
-        if not resized_images:
-            print("错误: 没有有效的图片可以处理")
-            return False
+        output_format = resolve_output_format(output_format, output_file)
+        if not image_list:
+            return _report_failure("错误: 没有有效的图片可以处理", progress)
+        if target_size is None:
+            target_size = read_image_header(image_list[0])[0]
         
-        # 确保输出目录存在
-        output_dir = os.path.dirname(output_file)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            print(f"创建输出目录: {output_dir}")
+        # global模式先用均匀采样的图片构建调色板，之后逐张调整大小并写入
+        palette = resolve_palette_mode(palette)
+        shared_palette = None
+        if palette == 'global' and output_format == 'gif':
+            samples = resize_images(_sample_evenly(image_list, PALETTE_SAMPLE_FRAMES), target_size, keep_aspect_ratio, fill_mode, workers, cache, progress=progress, resample=resample)
+            if samples:
+                start = time.perf_counter()
+                shared_palette = SharedPalette.from_images(samples)
+                if progress is not None:
+                    progress.add_time('量化', time.perf_counter() - start)
         
-        # 保存为GIF
-        resized_images[0].save(
-            output_file,
-            format='GIF',
-            append_images=resized_images[1:],
-            save_all=True,
-            duration=duration,  # 毫秒
-            loop=0  # 0表示无限循环
-        )
+        resized_images = iter_resized_images(image_list, target_size, keep_aspect_ratio, fill_mode, workers, cache, progress, resample)
+        frame_count = write_gif_frames(resized_images, output_file, duration, palette=palette, delta_threshold=delta_threshold, progress=progress, shared_palette=shared_palette, encode_workers=encode_workers, output_format=output_format, quality=quality)
+        if not frame_count:
+            return _report_failure("错误: 没有有效的图片可以处理", progress)
+        if progress is not None:
+            progress.finish(output_file, frame_count)
         
         print(f"成功创建GIF: {output_file}")
         return True
     
     except Exception as e:
-        print(f"创建GIF时出错: {e}")
-        return False
+        return _report_failure(f"创建GIF时出错: {e}", progress)
 
-def create_gif(image_list, output_file, duration=100):
+def create_gif(image_list, output_file, duration=100, palette='per-frame', delta_threshold=0, progress=None, encode_workers=None, output_format=None, quality=None):
     """
     将多张图片合并成一张GIF动态图片
     
     参数:
-        image_list: 图片文件路径列表，或者已经打开的Image对象列表
+        image_list: 图片文件路径列表，或者已经打开的Image对象列表，也可以是LazyImageList
         output_file: 输出的GIF文件路径
         duration: 每一帧的延迟时间，单位为毫秒
+        palette: 调色板模式，见PALETTE_MODES
+        delta_threshold: 帧间优化时像素视为未变化的最大通道差值，0表示必须完全相同
+        progress: GifProgress对象，用于取消以及获取帧数、文件大小和各阶段耗时
+        encode_workers: LZW编码使用的进程数，None或1表示在当前线程中编码，0表示使用全部CPU核心，见GifStreamWriter
+        output_format: 输出格式，见OUTPUT_FORMATS，None表示根据output_file的扩展名推断（.webp、.png/.apng，其他为gif）。
+            webp和apng保存真彩色帧，palette和delta_threshold不起作用，见AnimationWriter
+        quality: 动画WebP的有损压缩质量（0-100），None表示使用WEBP_QUALITY
     
     返回:
         bool: 是否成功创建GIF
     """
-    try:
-        # 检查image_list是文件路径还是Image对象
-        frames = []
-        for item in image_list:
-            if isinstance(item, str):
-                # 如果是文件路径，打开图片
-                img = Image.open(item)
-                frames.append(img)
-            elif isinstance(item, Image.Image):
-                # 如果已经是Image对象，直接添加
-                frames.append(item)
-            else:
-                print(f"警告: 忽略不支持的项目类型: {type(item)}")
-        
-        # 确保至少有一张图片
-        if not frames:
-            print("错误: 没有有效的图片可以处理")
-            return False
-        
-        # 确保输出目录存在
-        output_dir = os.path.dirname(output_file)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            print(f"创建输出目录: {output_dir}")
+    try:
+        output_format = resolve_output_format(output_format, output_file)
+        # 先只读取文件头检查所有图片，每一帧在写入前才解码
+        frames = image_list if isinstance(image_list, LazyImageList) else LazyImageList(image_list, progress)
+        
+        # 确保至少有一张图片
+        if not frames:
+            return _report_failure("错误: 没有有效的图片可以处理", progress)
         
         # 保存为GIF
-        frames[0].save(
-            output_file,
-            format='GIF',
-            append_images=frames[1:],
-            save_all=True,
-            duration=duration,  # 毫秒
-            loop=0  # 0表示无限循环
-        )
+        frame_count = write_gif_frames(frames, output_file, duration, palette=palette, delta_threshold=delta_threshold, progress=progress, encode_workers=encode_workers, output_format=output_format, quality=quality)
+        if progress is not None:
+            progress.finish(output_file, frame_count)
         
         print(f"成功创建GIF: {output_file}")
         return True
     
     except Exception as e:
-        print(f"创建GIF时出错: {e}")
-        return False
+        return _report_failure(f"创建GIF时出错: {e}", progress)
 
-def create_gif_from_directory(input_dir, output_file, duration=100, pattern="*.png", resize=False, target_size=None, keep_aspect_ratio=True, fill_mode='fill'):
+def create_gif_from_directory(input_dir, output_file, duration=100, pattern="*.png", resize=False, target_size=None, keep_aspect_ratio=True, fill_mode='fill', workers=None, palette='per-frame', delta_threshold=0, cache=None, progress=None, resample='lanczos', append=False, encode_workers=None, output_format=None, quality=None, output_cache=None):
     """
     从指定目录读取所有图片并创建GIF
     
@@ -210,152 +2475,1247 @@ def create_gif_from_directory(input_dir, output_file, duration=100, pattern="*.p
         output_file: 输出的GIF文件路径
         duration: 每一帧的延迟时间，单位为毫秒
         pattern: 文件匹配模式，默认为"*.png"
+        workers: 调整大小时使用的并行进程数，None或1表示不并行，0表示使用全部CPU核心
+        palette: 调色板模式，见PALETTE_MODES
+        delta_threshold: 帧间优化时像素视为未变化的最大通道差值，0表示必须完全相同
+        cache: FrameCache对象，调整大小时复用之前缓存的帧，None表示不使用缓存
+        progress: GifProgress对象，用于取消以及获取帧数、文件大小和各阶段耗时
+        resample: 调整大小时的重采样滤镜，见RESAMPLE_FILTERS
+        append: 是否增量更新，只把上次之后新增的图片追加到已有的GIF，见append_gif_from_directory，只支持gif格式，
+            不使用output_cache
+        encode_workers: LZW编码使用的进程数，None或1表示在当前线程中编码，0表示使用全部CPU核心，见GifStreamWriter
+        output_format: 输出格式，见OUTPUT_FORMATS，None表示根据output_file的扩展名推断（.webp、.png/.apng，其他为gif）。
+            webp和apng保存真彩色帧，palette和delta_threshold不起作用，见AnimationWriter
+        quality: 动画WebP的有损压缩质量（0-100），None表示使用WEBP_QUALITY
+        output_cache: OutputCache对象，图片和参数与之前某次生成相同时直接使用缓存的文件，None表示不使用
     
     返回:
         bool: 是否成功创建GIF
     """
+    try:
+        output_format = resolve_output_format(output_format, output_file)
+    except ValueError as e:
+        return _report_failure(f"错误: {e}", progress)
+    if output_cache is not None and not append:
+        # 缓存键包含每张匹配图片的身份，新增、删除或修改图片后不会命中
+        options = dict(input_dir=input_dir, output_file=output_file, duration=duration, pattern=pattern, resize=resize,
+                       target_size=target_size, keep_aspect_ratio=keep_aspect_ratio, fill_mode=fill_mode, workers=workers,
+                       palette=palette, delta_threshold=delta_threshold, cache=cache, progress=progress, resample=resample,
+                       append=append, encode_workers=encode_workers, output_format=output_format, quality=quality,
+                       output_cache=None)
+        return output_cache.render(create_gif_from_directory, options, sorted(glob.glob(os.path.join(input_dir, pattern))))
+    if append:
+        if output_format != 'gif':
+            return _report_failure("错误: 续写模式只支持GIF格式", progress)
+        return append_gif_from_directory(input_dir, output_file, duration, pattern, resize, target_size, keep_aspect_ratio, fill_mode, workers, palette, delta_threshold, cache, progress, resample, encode_workers)
+
     # 获取目录中所有匹配的图片
     image_paths = sorted(glob.glob(os.path.join(input_dir, pattern)))
     
     if not image_paths:
-        print(f"错误: 在目录 {input_dir} 中没有找到匹配 {pattern} 的图片")
-        return False
+        return _report_failure(f"错误: 在目录 {input_dir} 中没有找到匹配 {pattern} 的图片", progress)
     
     print(f"找到 {len(image_paths)} 张图片")
     
+    # 开始处理之前先读取所有文件头，跳过无法读取的文件
+    images = LazyImageList(image_paths, progress)
+    if not images:
+        return _report_failure(f"错误: 目录 {input_dir} 中没有可以读取的图片", progress)
+    
     # 根据是否需要调整大小选择不同的处理函数
     if resize:
-        return create_gif_with_resize(image_paths, output_file, duration, target_size, keep_aspect_ratio, fill_mode)
+        return create_gif_with_resize(images.paths, output_file, duration, target_size, keep_aspect_ratio, fill_mode, workers, palette, delta_threshold, cache, progress, resample, encode_workers, output_format, quality)
     else:
-        return create_gif(image_paths, output_file, duration)
+        return create_gif(images, output_file, duration, palette, delta_threshold, progress, encode_workers, output_format, quality)
+
+# 续写模式在输出文件旁保存的状态文件的后缀及格式版本
+APPEND_STATE_SUFFIX = '.state.npz'
+APPEND_STATE_VERSION = 1
+# 状态文件中以NumPy数组保存的项，其余项以JSON保存
+APPEND_STATE_ARRAYS = ('canvas', 'canvas_opaque', 'palette')
+
+def _file_signature(path):
+    """返回文件的(大小, 修改时间)，用于判断文件是否被改动过"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
 
-def extract_frames_from_video(video_path, start_time=0, end_time=None, fps=10, target_size=None, keep_aspect_ratio=True, fill_mode='fill'):
+def load_append_state(path):
     """
-    从视频文件中提取帧并返回图像列表
-    
+    读取续写状态文件
+
+    参数:
+        path: 状态文件路径
+
+    返回:
+        dict: 状态，文件不存在、无法读取或版本不符时为None
+    """
+    if not NUMPY_AVAILABLE or not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            state = json.loads(data['meta'].item())
+            for key in APPEND_STATE_ARRAYS:
+                state[key] = data[key] if key in data.files else None
+    except (OSError, ValueError, KeyError) as e:
+        print(f"警告: 无法读取续写状态文件 {path}: {e}")
+        return None
+    if state.get('version') != APPEND_STATE_VERSION:
+        return None
+    return state
+
+def save_append_state(path, state):
+    """
+    原子地写入续写状态文件
+
+    参数:
+        path: 状态文件路径
+        state: 状态，APPEND_STATE_ARRAYS中的项为NumPy数组或None，其余项必须可以JSON序列化
+    """
+    arrays = {key: state[key] for key in APPEND_STATE_ARRAYS if state.get(key) is not None}
+    meta = {key: value for key, value in state.items() if key not in APPEND_STATE_ARRAYS}
+    meta['version'] = APPEND_STATE_VERSION
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+        os.chmod(tmp_path, _output_file_mode(os.path.dirname(tmp_path)))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _check_append_state(state, output_file, settings, image_paths):
+    """
+    检查状态文件能否用于续写
+
+    返回:
+        str: 不能续写的原因，可以续写时为None
+    """
+    if state is None:
+        return "没有可用的续写状态"
+    if state['settings'] != settings:
+        return "生成设置与上次不同"
+    if not os.path.exists(output_file) or _file_signature(output_file) != state['gif']:
+        return "GIF文件不存在或已被修改"
+    frames = state['frames']
+    if len(frames) > len(image_paths):
+        return "有图片被删除"
+    for (name, size, mtime), path in zip(frames, image_paths):
+        if name != os.path.basename(path) or [size, mtime] != _file_signature(path):
+            return f"图片 {name} 已被修改、删除，或者有新图片排在它前面"
+    return None
+
+def append_gif_from_directory(input_dir, output_file, duration=100, pattern="*.png", resize=False, target_size=None, keep_aspect_ratio=True, fill_mode='fill', workers=None, palette='per-frame', delta_threshold=0, cache=None, progress=None, resample='lanczos', encode_workers=None):
+    """
+    增量更新从目录创建的GIF，只处理上次更新之后新增的图片
+
+    适用于不断有新图片写入的目录（例如延时摄影）。输出文件旁保存一个状态文件（输出文件名加APPEND_STATE_SUFFIX），
+    记录已经写入的图片、调色板和最后的画布。再次调用时，如果设置、已有图片和GIF文件都没有变化，
+    新图片直接追加到GIF的末尾（只重写文件结尾和新的图像块），耗时只与新增的图片数有关；
+    否则重新生成整个GIF。图片按文件名排序，新图片的文件名必须排在已有图片之后。
+    global模式的调色板只由第一次生成时的图片构建，画面会逐渐变化时建议使用adaptive模式。
+
+    参数与create_gif_from_directory相同
+
+    返回:
+        bool: 是否成功创建或更新GIF
+    """
+    if not NUMPY_AVAILABLE:
+        return _report_failure("错误: 续写模式需要numpy库", progress)
+    image_paths = sorted(glob.glob(os.path.join(input_dir, pattern)))
+    if not image_paths:
+        return _report_failure(f"错误: 在目录 {input_dir} 中没有找到匹配 {pattern} 的图片", progress)
+
+    try:
+        palette = resolve_palette_mode(palette)
+        settings = {
+            'input_dir': os.path.abspath(input_dir),
+            'duration': duration,
+            'resize': bool(resize),
+            'target_size': list(target_size) if target_size else None,
+            'keep_aspect_ratio': keep_aspect_ratio,
+            'fill_mode': fill_mode,
+            'palette': palette,
+            'delta_threshold': delta_threshold,
+            'resample': resolve_resample(resample),
+        }
+        state_path = output_file + APPEND_STATE_SUFFIX
+        state = load_append_state(state_path)
+        reason = _check_append_state(state, output_file, settings, image_paths)
+        if reason is None:
+            done = state['frames']
+            new_paths = image_paths[len(done):]
+            if not new_paths:
+                print(f"没有新的图片，GIF无需更新: {output_file}")
+                if progress is not None:
+                    progress.finish(output_file, state['frame_count'])
+                return True
+            print(f"找到 {len(new_paths)} 张新图片，追加到已有的 {len(done)} 张之后")
+        else:
+            print(f"{reason}，重新生成整个GIF")
+            state, done, new_paths = None, [], image_paths
+            print(f"找到 {len(new_paths)} 张图片")
+
+        images = LazyImageList(new_paths, progress)
+        if not images:
+            if state is not None:
+                # 新图片可能还没有写完，下次再处理
+                print("新图片暂时都无法读取，GIF保持不变")
+                if progress is not None:
+                    progress.finish(output_file, state['frame_count'])
+                return True
+            return _report_failure(f"错误: 目录 {input_dir} 中没有可以读取的图片", progress)
+        # 末尾无法读取的图片可能还没有写完，不记入状态，下次重试
+        readable = set(images.paths)
+        last = max(i for i, path in enumerate(new_paths) if path in readable)
+        new_paths = new_paths[:last + 1]
+
+        if resize:
+            if state is not None:
+                target_size = tuple(state['size'])
+            elif target_size is None:
+                target_size = read_image_header(images.paths[0])[0]
+            frames = iter_resized_images(images.paths, target_size, keep_aspect_ratio, fill_mode, workers, cache, progress, resample)
+        else:
+            frames = images
+
+        shared_palette = None
+        if palette == 'global' and state is None:
+            if resize:
+                samples = resize_images(_sample_evenly(images.paths, PALETTE_SAMPLE_FRAMES), target_size, keep_aspect_ratio, fill_mode, workers, cache, progress=progress, resample=resample)
+            else:
+                samples = _sample_evenly(images, PALETTE_SAMPLE_FRAMES)
+            if samples:
+                start = time.perf_counter()
+                shared_palette = SharedPalette.from_images(samples)
+                if progress is not None:
+                    progress.add_time('量化', time.perf_counter() - start)
+        if progress is not None:
+            frames = progress.watch(frames)
+
+        with GifStreamWriter(output_file, duration, palette=palette, shared_palette=shared_palette, delta_threshold=delta_threshold, progress=progress, resume=state, encode_workers=encode_workers) as writer:
+            for frame in frames:
+                writer.write(frame)
+        if not writer.frame_count:
+            return _report_failure("错误: 没有有效的图片可以处理", progress)
+
+        new_state = writer.state()
+        new_state['settings'] = settings
+        new_state['frames'] = done + [[os.path.basename(path)] + _file_signature(path) for path in new_paths]
+        new_state['gif'] = _file_signature(output_file)
+        save_append_state(state_path, new_state)
+        if progress is not None:
+            progress.finish(output_file, writer.frame_count)
+
+        print(f"成功{'更新' if state is not None else '创建'}GIF: {output_file}（共 {writer.frame_count} 帧）")
+        return True
+
+    except Exception as e:
+        return _report_failure(f"创建GIF时出错: {e}", progress)
+
+# 相邻两个目标帧之间相隔超过该时长（秒）时，改为直接定位（seek）而不是逐帧跳过
+SEEK_MIN_GAP_SECONDS = 5
+
+def resolve_segments(segments):
+    """
+    检查并排序视频的时间片段
+
+    参数:
+        segments: 片段列表[(开始秒, 结束秒), ...]，或者逗号分隔的字符串，例如"0-2,10-12.5,40-43"；None表示不分片段
+
+    返回:
+        list: 按开始时间排序的(开始秒, 结束秒)列表，segments为None时返回None
+    """
+    if segments is None:
+        return None
+    if isinstance(segments, str):
+        items = []
+        for item in segments.split(','):
+            start, sep, end = item.strip().partition('-')
+            try:
+                items.append((float(start), float(end)))
+            except ValueError:
+                raise ValueError(f"无效的时间片段: {item.strip()}，格式为开始秒-结束秒，多个片段用逗号分隔") from None
+    else:
+        items = [(float(start), float(end)) for start, end in segments]
+    if not items:
+        raise ValueError("没有指定时间片段")
+    items.sort()
+    for start, end in items:
+        if start < 0 or end <= start:
+            raise ValueError(f"无效的时间片段: {start:g}-{end:g}，结束时间必须大于开始时间")
+    for (_, end), (start, next_end) in zip(items, items[1:]):
+        if start < end:
+            raise ValueError(f"时间片段重叠: {start:g}-{next_end:g} 与之前的片段")
+    return items
+
+def segment_output_path(output_file, index):
+    """返回每个片段单独输出时第index个（从0开始）片段的文件路径，例如clip.gif的第一个片段为clip_1.gif"""
+    root, ext = os.path.splitext(output_file)
+    return f"{root}_{index + 1}{ext}"
+
+def sample_frame_indices(video_fps, total_frames, start_time=0, end_time=None, fps=10):
+    """
+    根据精确的目标时间戳计算需要提取的源视频帧序号
+
+    第k个输出帧对应的时间点为 start_time + k / fps，取该时刻正在显示的源帧。
+    与按整数间隔抽帧不同，这种方式不会随时间累积漂移（例如从29.97fps抽取10fps）。
+    当输出fps高于源视频fps时，同一源帧会重复出现，以保持输出的时间轴准确。
+
+    参数:
+        video_fps: 源视频帧率
+        total_frames: 源视频总帧数
+        start_time: 开始时间（秒）
+        end_time: 结束时间（秒），如果为None则到视频结束
+        fps: 每秒提取的帧数
+
+    返回:
+        list: 按时间顺序排列的源帧序号列表
+    """
+    video_duration = total_frames / video_fps
+    if end_time is None or end_time > video_duration:
+        end_time = video_duration
+
+    indices = []
+    k = 0
+    while True:
+        timestamp = start_time + k / fps
+        if timestamp >= end_time:
+            break
+        # 加上一个很小的量，避免浮点误差把恰好落在帧边界上的时间点算到前一帧
+        index = int(math.floor(timestamp * video_fps + 1e-6))
+        if index >= total_frames:
+            break
+        indices.append(index)
+        k += 1
+    return indices
+
+def iter_video_source_frames(video_path, start_time=0, end_time=None, fps=10, segments=None):
+    """
+    按目标时间戳从视频中读取原始帧的生成器（不做颜色转换和缩放）
+
+    不需要的帧通过 cap.grab() 跳过，不做颜色转换和拷贝；间隔较大时直接定位到目标帧。
+    无法打开视频时抛出ValueError（见iter_video_source_frame_groups），解码过程中的异常同样直接抛出给调用方。
+
     参数:
         video_path: 视频文件路径
         start_time: 开始时间（秒）
         end_time: 结束时间（秒），如果为None则提取到视频结束
         fps: 每秒提取的帧数
-        target_size: 目标大小，格式为(宽, 高)
-        keep_aspect_ratio: 是否保持原始宽高比
-    
-    返回:
-        list: 提取的帧（Image对象）列表
+        segments: resolve_segments返回的时间片段列表，指定时依次提取各片段的帧（忽略start_time和end_time）
+
+    生成:
+        numpy.ndarray: OpenCV的BGR帧。输出fps高于源视频时，同一个数组会被连续生成多次
     """
-    if not OPENCV_AVAILABLE:
-        print("错误: 未安装opencv-python库，无法处理视频文件。请使用 'pip install opencv-python' 安装。")
-        return []
+    for frame, (count,) in iter_video_source_frame_groups(video_path, start_time, end_time, [fps], [segments]):
+        for _ in range(count):
+            yield frame
+
+def iter_video_source_frame_groups(video_path, start_time=0, end_time=None, fps_list=(10,), segments_list=None):
+    """
+    一次解码同时为多个输出帧率读取原始帧的生成器
+
+    各帧率需要的源帧序号合并后按顺序只读取一次，跳过和定位的方式与iter_video_source_frames相同。
+    各输出可以只提取视频中的若干片段：所有片段的帧在同一个VideoCapture中一遍顺序读出，
+    片段之间的间隔同样用grab()跳过（间隔较大时定位），不会为每个片段重新打开文件和定位。
+
+    参数:
+        video_path: 视频文件路径
+        start_time: 开始时间（秒）
+        end_time: 结束时间（秒），如果为None则提取到视频结束
+        fps_list: 各输出每秒提取的帧数
+        segments_list: 与fps_list对应的各输出的时间片段列表（见resolve_segments），
+            None或其中的None表示该输出提取start_time到end_time
+
+    生成:
+        tuple: (OpenCV的BGR帧, 各输出中该帧连续出现的次数列表)，次数为0表示该输出不需要这一帧
+
+    异常:
+        ValueError: 未安装opencv-python，或者无法打开视频文件、获取帧率和总帧数（在读取第一帧时抛出）
+    """
+    if not _load_cv2():
+        raise ValueError("未安装opencv-python库，无法处理视频文件。请使用 'pip install opencv-python' 安装。")
     
+    # 打开视频文件
+    cap = cv2.VideoCapture(video_path)
     try:
-        # 打开视频文件
-        cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
-            print(f"错误: 无法打开视频文件 {video_path}")
-            return []
+            raise ValueError(f"无法打开视频文件 {video_path}")
         
         # 获取视频信息
         video_fps = cap.get(cv2.CAP_PROP_FPS)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        video_duration = total_frames / video_fps if video_fps > 0 else 0
+        if video_fps <= 0 or total_frames <= 0:
+            raise ValueError(f"无法获取视频 {video_path} 的帧率或总帧数")
+        video_duration = total_frames / video_fps
         
         # 如果未指定结束时间，则使用视频总时长
         if end_time is None or end_time > video_duration:
             end_time = video_duration
         
-        # 计算需要提取的帧
-        start_frame = int(start_time * video_fps)
-        end_frame = int(end_time * video_fps)
-        
-        # 计算提取间隔（每隔多少帧提取一帧）
-        if fps >= video_fps:
-            # 如果请求的fps大于等于视频fps，则提取所有帧
-            interval = 1
-        else:
-            # 否则按比例提取
-            interval = int(video_fps / fps)
+        # 计算需要提取的帧，输出fps高于源视频时同一源帧在一个输出中出现多次；
+        # 每个片段从自己的开始时间起按fps取时间点，相邻片段共用的源帧在该输出中计入两次
+        if segments_list is None:
+            segments_list = [None] * len(fps_list)
+        counters = []
+        for fps, segments in zip(fps_list, segments_list):
+            counter = collections.Counter()
+            for segment_start, segment_end in segments or [(start_time, end_time)]:
+                counter.update(sample_frame_indices(video_fps, total_frames, segment_start, segment_end, fps))
+            counters.append(counter)
+        indices = sorted(set().union(*counters))
+        seek_gap = max(1, int(SEEK_MIN_GAP_SECONDS * video_fps))
         
         print(f"视频信息: {video_duration:.2f}秒, {video_fps:.2f}fps, 总帧数: {total_frames}")
-        print(f"提取设置: {start_time}秒 到 {end_time}秒, 输出{fps}fps, 提取间隔: {interval}帧")
-        
-        # 设置起始位置
-        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        if any(segments_list):
+            ranges = sorted(set(segment for segments in segments_list for segment in segments or [(start_time, end_time)]))
+            print(f"提取片段: {', '.join(f'{start:g}-{end:g}秒' for start, end in ranges)}, 输出{', '.join(str(fps) for fps in fps_list)}fps")
+        else:
+            print(f"提取设置: {start_time}秒 到 {end_time}秒, 输出{', '.join(str(fps) for fps in fps_list)}fps, 平均间隔: {video_fps / max(fps_list):.2f}帧")
         
-        frames = []
-        frame_count = 0
+        position = 0  # 下一次grab()/read()将返回的帧序号
         extracted_count = 0
+        retrieved_count = 0
+        skipped_count = 0
         
-        while True:
+        for index in indices:
+            if index - position > seek_gap:
+                # 间隔较大，直接定位到目标帧（由解码器从最近的关键帧开始解码）
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                position = index
+            else:
+                # 间隔较小，只grab不解码到像素，跳过不需要的帧
+                while position < index and cap.grab():
+                    position += 1
+                    skipped_count += 1
+                if position < index:
+                    break
+            
             ret, frame = cap.read()
-            if not ret or frame_count > (end_frame - start_frame):
+            if not ret:
                 break
+            position += 1
+            retrieved_count += 1
             
-            # 按间隔提取帧
-            if frame_count % interval == 0:
-                # 转换BGR到RGB（OpenCV使用BGR，PIL使用RGB）
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                pil_img = Image.fromarray(rgb_frame)
-                
-                # 如果需要调整大小
-                if target_size:
-                    if keep_aspect_ratio:
-                        if fill_mode == 'center':
-                            # 保持宽高比，居中放置
-                            pil_img.thumbnail(target_size, Image.Resampling.LANCZOS)
-                            # 创建新的透明背景
-                            new_img = Image.new("RGBA", target_size, (255, 255, 255, 0))
-                            # 居中粘贴
-                            paste_x = (target_size[0] - pil_img.width) // 2
-                            paste_y = (target_size[1] - pil_img.height) // 2
-                            new_img.paste(pil_img, (paste_x, paste_y))
-                            pil_img = new_img
-                        elif fill_mode == 'fill':
-                            # 保持宽高比但确保填满整个画面
-                            # 计算宽高比
-                            target_ratio = target_size[0] / target_size[1]
-                            img_ratio = pil_img.width / pil_img.height
-                            
-                            if img_ratio > target_ratio:
-                                # 图片较宽，以高度为准进行缩放，然后裁剪宽度
-                                new_height = target_size[1]
-                                new_width = int(new_height * img_ratio)
-                                pil_img = pil_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                                # 裁剪中心部分
-                                left = (new_width - target_size[0]) // 2
-                                pil_img = pil_img.crop((left, 0, left + target_size[0], new_height))
-                            else:
-                                # 图片较高，以宽度为准进行缩放，然后裁剪高度
-                                new_width = target_size[0]
-                                new_height = int(new_width / img_ratio)
-                                pil_img = pil_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                                # 裁剪中心部分
-                                top = (new_height - target_size[1]) // 2
-                                pil_img = pil_img.crop((0, top, new_width, top + target_size[1]))
-                    else:
-                        # 直接调整大小
-                        pil_img = pil_img.resize(target_size, Image.Resampling.LANCZOS)
-                
-                frames.append(pil_img)
-                extracted_count += 1
-                
-                # 显示进度
-                if extracted_count % 10 == 0:
-                    print(f"已提取 {extracted_count} 帧...")
+            counts = [counter[index] for counter in counters]
+            # 显示进度（按需要帧数最多的输出计数）
+            reported = extracted_count // 10
+            extracted_count += max(counts)
+            yield frame, counts
             
-            frame_count += 1
+            if extracted_count // 10 > reported:
+                print(f"已提取 {extracted_count // 10 * 10} 帧...")
         
+        print(f"共提取 {extracted_count} 帧（读取 {retrieved_count} 帧，跳过 {skipped_count} 帧）")
+    finally:
         cap.release()
-        print(f"共提取 {len(frames)} 帧")
-        return frames
+
+# 视频帧选择模式：fixed按固定帧率抽帧；adaptive丢弃与上一个保留帧几乎相同的帧，
+# 把它们的时长并入上一帧的延迟，并可以在画面变化剧烈处保留额外的帧
+FRAME_SELECT_MODES = ['fixed', 'adaptive']
+# 计算帧间差异用的灰度缩略图宽度（像素），缩小时的区域平均同时抑制了压缩噪点
+SELECT_THUMBNAIL_WIDTH = 64
+# 缩略图上的最大像素差（0-255）不超过该值时视为重复帧
+SELECT_DUPLICATE_THRESHOLD = 4
+# 缩略图上的平均像素差（0-255）达到该值时视为场景变化或剧烈运动，保留scene_boost额外抽取的帧
+SELECT_SCENE_THRESHOLD = 20
+
+def resolve_select_mode(select):
+    """
+    检查帧选择模式，adaptive模式需要numpy
+
+    返回:
+        str: 帧选择模式，见FRAME_SELECT_MODES
+    """
+    if select not in FRAME_SELECT_MODES:
+        raise ValueError(f"不支持的帧选择模式: {select}，可选值为 {', '.join(FRAME_SELECT_MODES)}")
+    if select != 'fixed' and not NUMPY_AVAILABLE:
+        print("警告: 未安装numpy库，帧选择模式回退为fixed")
+        return 'fixed'
+    return select
+
+def _select_thumbnail(frame):
+    """把BGR帧缩小为SELECT_THUMBNAIL_WIDTH宽的灰度缩略图"""
+    height = max(1, round(frame.shape[0] * SELECT_THUMBNAIL_WIDTH / frame.shape[1]))
+    thumbnail = cv2.resize(frame, (SELECT_THUMBNAIL_WIDTH, height), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+
+def select_video_frames(frames, duration, threshold=SELECT_DUPLICATE_THRESHOLD, boost=1):
+    """
+    自适应帧选择的生成器：丢弃近似重复的帧，把它们的时长并入上一个保留的帧
+
+    每个候选帧与上一个保留的帧比较灰度缩略图（而不是与前一个候选帧比较，缓慢的变化累积起来也能被发现）。
+    最大像素差不超过threshold时视为重复帧。boost大于1时候选帧按boost倍帧率抽取，
+    其中落在原帧率时间点上的帧按上述规则选择，额外的帧只有平均像素差达到SELECT_SCENE_THRESHOLD
+    （场景切换或剧烈运动）时才保留，静止和缓慢变化的片段不会因此增加帧数。
+
+    参数:
+        frames: iter_video_source_frames按fps * boost抽取的BGR帧的可迭代对象
+        duration: 每个候选帧的时长（毫秒），即输出帧延迟除以boost
+        threshold: 视为重复帧的最大像素差（0-255）
+        boost: 候选帧相对输出帧率的倍数
+
+    生成:
+        tuple: (BGR帧, 延迟毫秒)
+    """
+    kept = None  # [帧, 缩略图, 延迟]
+    last_frame = None
+    candidates = selected = duplicates = extras = 0
+    for index, frame in enumerate(frames):
+        candidates += 1
+        if kept is not None and frame is last_frame:
+            # 输出帧率高于源视频时同一帧会重复出现
+            kept[2] += duration
+            duplicates += 1
+            continue
+        last_frame = frame
+        thumbnail = _select_thumbnail(frame)
+        if kept is not None:
+            diff = cv2.absdiff(thumbnail, kept[1])
+            on_grid = index % boost == 0
+            if diff.max() <= threshold:
+                kept[2] += duration
+                duplicates += 1
+                continue
+            if not on_grid and diff.mean() < SELECT_SCENE_THRESHOLD:
+                kept[2] += duration
+                continue
+            extras += not on_grid
+            yield kept[0], kept[2]
+        kept = [frame, thumbnail, duration]
+        selected += 1
+    if kept is not None:
+        yield kept[0], kept[2]
+        print(f"自适应选帧: 候选 {candidates} 帧，保留 {selected} 帧"
+              f"（合并重复帧 {duplicates} 帧，场景变化处的额外帧 {extras} 帧）")
+
+def _map_timed(convert, items):
+    """
+    对(帧, 延迟)序列中的帧调用convert，保留对应的延迟
+
+    参数:
+        convert: 一进一出的生成器函数，参数为帧的可迭代对象
+        items: (帧, 延迟毫秒)的可迭代对象
+
+    生成:
+        tuple: (转换后的帧, 延迟毫秒)
+    """
+    durations = collections.deque()
+
+    def frames():
+        for frame, duration in items:
+            durations.append(duration)
+            yield frame
+
+    for out in convert(frames()):
+        yield out, durations.popleft()
+
+def _transform_video_frame(frame, plan, target_size=None, resample='lanczos', buffers=None):
+    """
+    按plan_transform的方案调整一个OpenCV的BGR帧的大小，视频帧的缩放都经过这里
+
+    裁剪框先四舍五入为整像素，两种后端都只对这个区域（NumPy视图，不复制）做颜色转换和缩放。
+    resample为'area'时使用cv2.resize（缩小时INTER_AREA按区域取平均，与Pillow的BOX相同，放大时INTER_LINEAR），
+    缩小之后才交换颜色通道，全程不经过Image对象；lanczos和bilinear缩小时cv2不做抗锯齿，交给Pillow缩放。
+
+    只有缩放的中间结果写入buffers中复用的缓冲区，返回的数组每帧新分配：它会经过流水线的队列交给下游线程，
+    AnimationWriter和大小估算还会一直保留它（RGBA数组转换的Image对象与数组共享内存），复用输出缓冲区
+    需要一组与流水线中同时存在的帧数一样多的缓冲区，并由所有保留帧的地方自己复制，而分配一个输出大小的
+    数组只占缩放耗时的千分之一以下。
+
+    参数:
+        frame: OpenCV的BGR帧
+        plan: plan_transform的返回值，为None时不调整大小
+        target_size: 目标大小，格式为(宽, 高)
+        resample: 重采样滤镜，见RESAMPLE_FILTERS
+        buffers: 在连续的帧之间复用的缓冲区字典，None表示不复用
+
+    返回:
+        resample为'area'时为形状(高, 宽, 3)的RGB数组，center模式下为(高, 宽, 4)的RGBA数组；
+        其他滤镜为Image对象
+    """
+    use_cv2 = resample == 'area'
+    if plan is None:
+        # 转换BGR到RGB（OpenCV使用BGR，PIL使用RGB）
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return rgb if use_cv2 else Image.fromarray(rgb)
+    box, size, offset = plan
+    x0, y0, x1, y1 = (int(round(v)) for v in box)
+    region = frame[y0:y1, x0:x1]
+    if not use_cv2:
+        pil_img = Image.fromarray(cv2.cvtColor(region, cv2.COLOR_BGR2RGB))
+        return _render_transform(pil_img, ((0, 0) + pil_img.size, size, offset), target_size, resample)
+
+    buffers = {} if buffers is None else buffers
+    resized = buffers.get('resized')
+    if resized is None or resized.shape[:2] != (size[1], size[0]):
+        resized = buffers['resized'] = np.empty((size[1], size[0], 3), dtype=np.uint8)
+    interpolation = cv2.INTER_AREA if size[0] < x1 - x0 or size[1] < y1 - y0 else cv2.INTER_LINEAR
+    cv2.resize(region, size, dst=resized, interpolation=interpolation)
+    if offset is None:
+        return cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+    # 居中放置在透明画布上：交换颜色通道和填充alpha一次完成，直接写入画布中的对应区域
+    x, y = offset
+    out = np.zeros((target_size[1], target_size[0], 4), dtype=np.uint8)
+    cv2.cvtColor(resized, cv2.COLOR_BGR2RGBA, dst=out[y:y + size[1], x:x + size[0]])
+    return out
+
+def _video_frame_to_image(frame, target_size=None, keep_aspect_ratio=True, fill_mode='fill', resample='lanczos'):
+    """
+    将OpenCV的BGR帧转换为Image对象，并按需调整大小（见_transform_video_frame）
+
+    参数:
+        frame: OpenCV的BGR帧
+        target_size: 目标大小，格式为(宽, 高)，为None时不调整大小
+        keep_aspect_ratio: 是否保持原始宽高比
+        fill_mode: 填充模式，'center'或'fill'
+        resample: 重采样滤镜，见RESAMPLE_FILTERS
+
+    返回:
+        Image: 转换后的Image对象，fill_mode无效时返回None
+    """
+    plan = None
+    if target_size:
+        plan = plan_transform((frame.shape[1], frame.shape[0]), target_size, keep_aspect_ratio, fill_mode)
+        if plan is None:
+            return None
+    img = _transform_video_frame(frame, plan, target_size, resample)
+    return img if isinstance(img, Image.Image) else Image.fromarray(img)
+
+def _iter_video_transformed(frames, target_size=None, keep_aspect_ratio=True, fill_mode='fill', resample='lanczos'):
+    """
+    把原始BGR帧逐个交给_transform_video_frame调整大小，源帧大小不变时只计算一次方案，连续重复的同一帧只转换一次
+
+    参数:
+        frames: OpenCV的BGR帧的可迭代对象
+        target_size: 目标大小，格式为(宽, 高)，为None时不调整大小
+        keep_aspect_ratio: 是否保持原始宽高比
+        fill_mode: 填充模式，'center'或'fill'
+        resample: 重采样滤镜，见RESAMPLE_FILTERS
+
+    生成:
+        _transform_video_frame的返回值（RGB/RGBA数组或Image对象），重复的帧生成同一个对象
+    """
+    last_frame = None
+    out = None
+    shape = None
+    plan = None
+    buffers = {}
+    for frame in frames:
+        if frame is last_frame:
+            yield out
+            continue
+        last_frame = frame
+        if target_size and frame.shape != shape:
+            shape = frame.shape
+            plan = plan_transform((shape[1], shape[0]), target_size, keep_aspect_ratio, fill_mode)
+            if plan is None:
+                raise ValueError(f"不支持的填充模式: {fill_mode}")
+        out = _transform_video_frame(frame, plan, target_size, resample, buffers)
+        yield out
+
+def _iter_video_images(frames, target_size=None, keep_aspect_ratio=True, fill_mode='fill', resample='lanczos'):
+    """把原始帧逐个转换为Image对象，连续重复的同一帧只转换一次（生成同一个Image对象）"""
+    last = None
+    pil_img = None
+    for out in _iter_video_transformed(frames, target_size, keep_aspect_ratio, fill_mode, resample):
+        if out is not last:
+            pil_img = out if isinstance(out, Image.Image) else Image.fromarray(out)
+            last = out
+        yield pil_img
+
+def iter_video_frames(video_path, start_time=0, end_time=None, fps=10, target_size=None, keep_aspect_ratio=True, fill_mode='fill', resample='lanczos', segments=None):
+    """
+    逐帧从视频文件中提取帧的生成器
+
+    每次只解码并处理一帧，调用方处理完后即可释放，内存占用与视频长度无关。
+    打开失败时不产生任何帧；解码过程中的异常会直接抛出给调用方。
+
+    参数:
+        video_path: 视频文件路径
+        start_time: 开始时间（秒）
+        end_time: 结束时间（秒），如果为None则提取到视频结束
+        fps: 每秒提取的帧数
+        target_size: 目标大小，格式为(宽, 高)
+        keep_aspect_ratio: 是否保持原始宽高比
+        fill_mode: 填充模式，'center'或'fill'
+        resample: 重采样滤镜，见RESAMPLE_FILTERS
+        segments: 时间片段列表或字符串（见resolve_segments），指定时依次提取各片段的帧（忽略start_time和end_time）
+
+    生成:
+        Image: 提取的帧。输出fps高于源视频时，同一个Image对象会被连续生成多次
+    """
+    frames = iter_video_source_frames(video_path, start_time, end_time, fps, resolve_segments(segments))
+    return _iter_video_images(frames, target_size, keep_aspect_ratio, fill_mode, resolve_resample(resample))
+
+def extract_frames_from_video(video_path, start_time=0, end_time=None, fps=10, target_size=None, keep_aspect_ratio=True, fill_mode='fill', resample='lanczos', spool_dir=None, spool_max_bytes=FRAME_SPOOL_MAX_BYTES, segments=None):
+    """
+    从视频文件中提取帧并返回图像列表
+
+    注意：不指定spool_dir时该函数会把所有帧保存在内存中，长视频请使用 iter_video_frames 逐帧处理，
+    或者指定spool_dir把帧写入磁盘上的帧缓冲（FrameSpool）。
+    
+    参数:
+        video_path: 视频文件路径
+        start_time: 开始时间（秒）
+        end_time: 结束时间（秒），如果为None则提取到视频结束
+        fps: 每秒提取的帧数
+        target_size: 目标大小，格式为(宽, 高)
+        keep_aspect_ratio: 是否保持原始宽高比
+        fill_mode: 填充模式，'center'或'fill'
+        resample: 重采样滤镜，见RESAMPLE_FILTERS
+        spool_dir: 帧缓冲文件所在的目录，None表示把帧保存在内存中
+        spool_max_bytes: 帧缓冲文件的大小上限（字节）
+        segments: 时间片段列表或字符串（见resolve_segments），指定时依次提取各片段的帧并连接在一起（忽略start_time和end_time）
     
+    返回:
+        list: 提取的帧（Image对象）列表。指定spool_dir时为按需从帧缓冲读取帧的SpooledImageList，
+            可以随机访问，用完后调用close()（或等待对象被回收）删除帧缓冲文件
+    """
+    try:
+        frames = iter_video_frames(video_path, start_time, end_time, fps, target_size, keep_aspect_ratio, fill_mode, resample, segments)
+        if spool_dir is None or not NUMPY_AVAILABLE:
+            if spool_dir is not None:
+                print("警告: 帧缓冲需要numpy库，所有帧将保存在内存中。请使用 'pip install numpy' 安装。")
+            return list(frames)
+        spool = FrameSpool(spool_dir, spool_max_bytes)
+        try:
+            for img in frames:
+                spool.append(img)
+        except BaseException:
+            spool.close()
+            raise
+        return SpooledImageList(spool)
     except Exception as e:
         print(f"提取视频帧时出错: {e}")
         return []
 
-def create_gif_from_video(video_path, output_file, start_time=0, end_time=None, fps=10, duration=None, target_size=None, keep_aspect_ratio=True, fill_mode='fill'):
+def sample_video_images(video_path, start_time=0, end_time=None, count=PALETTE_SAMPLE_FRAMES, target_size=None, keep_aspect_ratio=True, fill_mode='fill', resample='lanczos'):
+    """
+    在时间范围内均匀地抽取若干帧，用于在正式处理前分析整段视频（例如构建共享调色板）
+
+    参数:
+        video_path: 视频文件路径
+        start_time: 开始时间（秒）
+        end_time: 结束时间（秒），如果为None则到视频结束
+        count: 抽取的帧数
+        target_size: 目标大小，格式为(宽, 高)
+        keep_aspect_ratio: 是否保持原始宽高比
+        fill_mode: 填充模式，'center'或'fill'
+        resample: 重采样滤镜，见RESAMPLE_FILTERS
+
+    返回:
+        list: 抽取的帧（Image对象）列表，无法读取视频时为空列表
+    """
+    return [_video_frame_to_image(frame, target_size, keep_aspect_ratio, fill_mode, resample)
+            for frame in iter_video_sample_frames(video_path, start_time, end_time, count)]
+
+def iter_video_sample_frames(video_path, start_time=0, end_time=None, count=PALETTE_SAMPLE_FRAMES, segments=None):
+    """
+    在时间范围内均匀地定位并读取若干原始帧的生成器（不做颜色转换和缩放），无法读取视频时不产生任何帧
+
+    参数:
+        video_path: 视频文件路径
+        start_time: 开始时间（秒）
+        end_time: 结束时间（秒），如果为None则到视频结束
+        count: 抽取的帧数
+        segments: resolve_segments返回的时间片段列表，指定时在各片段连接起来的时间轴上均匀抽取（忽略start_time和end_time）
+
+    生成:
+        numpy.ndarray: OpenCV的BGR帧
+    """
+    if not _load_cv2():
+        return
+    cap = cv2.VideoCapture(video_path)
+    try:
+        video_fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if not cap.isOpened() or video_fps <= 0 or total_frames <= 0:
+            return
+        video_duration = total_frames / video_fps
+        ranges = []
+        for segment_start, segment_end in segments or [(start_time, end_time)]:
+            if segment_end is None or segment_end > video_duration:
+                segment_end = video_duration
+            if segment_end > segment_start:
+                ranges.append((segment_start, segment_end - segment_start))
+        total = sum(length for _, length in ranges)
+        for i in range(count if ranges else 0):
+            # 把连接后时间轴上的位置换算为所在片段中的时间点
+            offset = total * (i + 0.5) / count
+            for segment_start, length in ranges:
+                if offset < length:
+                    break
+                offset -= length
+            timestamp = segment_start + min(offset, length)
+            cap.set(cv2.CAP_PROP_POS_FRAMES, min(total_frames - 1, int(timestamp * video_fps)))
+            ret, frame = cap.read()
+            if ret:
+                yield frame
+    finally:
+        cap.release()
+
+# --max-bytes模式依次尝试的参数：(尺寸比例, fps比例, 调色板颜色数上限, delta_threshold下限)，越靠后文件越小。
+# 先用几乎看不出差别的手段（忽略解码噪声、减少颜色），再逐步降低分辨率和帧率
+MAX_BYTES_LADDER = (
+    (1.0, 1.0, 256, 0),
+    (1.0, 1.0, 256, 4),
+    (1.0, 1.0, 128, 4),
+    (0.85, 1.0, 128, 4),
+    (0.85, 0.75, 128, 8),
+    (0.7, 0.75, 128, 8),
+    (0.7, 0.75, 64, 8),
+    (0.7, 0.5, 64, 8),
+    (0.6, 0.5, 64, 8),
+    (0.5, 0.5, 64, 8),
+    (0.4, 0.5, 64, 12),
+    (0.4, 0.33, 64, 12),
+    (0.3, 0.33, 32, 12),
+    (0.25, 0.33, 32, 12),
+    (0.2, 0.25, 32, 16),
+    (0.15, 0.25, 32, 16),
+)
+
+# 估算大小时在时间范围内均匀抽取的窗口数，以及每个窗口中计入差异帧平均大小的连续输出帧数
+SIZE_ESTIMATE_WINDOWS = 4
+SIZE_ESTIMATE_WINDOW_FRAMES = 5
+
+# delta_threshold大于0时，长时间编码的画布上积累了许多接近阈值的旧像素，整帧之后最初的差异帧明显偏小。
+# 每个窗口在整帧之后先经过这么长时间（秒）的预热帧，预热帧只更新画布，不量化也不计入大小
+SIZE_ESTIMATE_WARMUP_SECONDS = 0.75
+
+# 选择参数时预留的余量：估算大小不超过目标大小的该比例
+MAX_BYTES_SAFETY = 0.9
+
+# 实际大小超出目标时，按实际与估算的比例修正后重新选择参数，最多完整编码的次数
+MAX_BYTES_ATTEMPTS = 3
+
+# 降级时输出的最小边长（像素）和最低帧率
+MIN_OUTPUT_SIZE = 16
+MIN_OUTPUT_FPS = 1
+
+class GifSizeEstimator:
+    """
+    在完整编码之前估算视频转换为GIF后的文件大小
+
+    在时间范围内均匀抽取SIZE_ESTIMATE_WINDOWS个窗口，每个窗口是按目标fps连续的若干个输出帧，
+    用与正式编码相同的帧间优化、量化和LZW编码得到每个窗口第一帧（整帧）和后续帧（差异帧）的字节数，
+    按总帧数外推：估算大小 = 整帧平均大小 + (总帧数 - 1) × 差异帧平均大小，
+    整帧与计入大小的差异帧之间隔着SIZE_ESTIMATE_WARMUP_SECONDS的预热帧。
+    每个源帧只解码一次，缩放后缓存在内存中供各组参数复用，因此尝试多组参数的开销只是少量帧的编码。
+    """
+
+    def __init__(self, video_path, start_time=0, end_time=None, fps=10, duration=None, target_size=None, keep_aspect_ratio=True, fill_mode='fill', palette='per-frame', delta_threshold=0, colors=256):
+        """
+        参数与create_gif_from_video相同，表示MAX_BYTES_LADDER第一级（不降级）时的设置
+        """
+        if not _load_cv2() or not NUMPY_AVAILABLE:
+            raise RuntimeError("估算GIF大小需要opencv-python和numpy库")
+        self.video_path = video_path
+        self.start_time = start_time
+        self.end_time = end_time
+        self.fps = fps
+        self.duration = duration if duration is not None else 1000 / fps
+        self.target_size = target_size
+        self.keep_aspect_ratio = keep_aspect_ratio
+        self.fill_mode = fill_mode
+        self.palette = resolve_palette_mode(palette)
+        self.delta_threshold = delta_threshold
+        self.colors = colors
+        self._cap = cv2.VideoCapture(video_path)
+        self.video_fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self.total_frames = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if not self._cap.isOpened() or self.video_fps <= 0 or self.total_frames <= 0:
+            self.close()
+            raise ValueError(f"无法打开视频文件 {video_path} 或获取其帧率和总帧数")
+        width = int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.base_size = tuple(target_size) if target_size else (width, height)
+        # 源帧序号 -> 缩放到base_size的RGB或RGBA数组
+        self._frames = {}
+        self._estimates = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """释放视频文件和缓存的帧"""
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+        self._frames = {}
+
+    def settings(self, level):
+        """
+        计算MAX_BYTES_LADDER中某一级对应的编码参数
+
+        参数:
+            level: MAX_BYTES_LADDER中的序号
+
+        返回:
+            dict: target_size、fps、duration、colors和delta_threshold，
+                可以直接作为create_gif_from_video的关键字参数
+        """
+        scale, fps_scale, colors, delta_threshold = MAX_BYTES_LADDER[level]
+        target_size = self.target_size
+        if scale < 1:
+            target_size = tuple(max(MIN_OUTPUT_SIZE, int(round(side * scale))) for side in self.base_size)
+        fps = max(min(self.fps, MIN_OUTPUT_FPS), self.fps * fps_scale)
+        return {
+            'target_size': target_size,
+            'fps': fps,
+            # 降低帧率时按比例延长每一帧的延迟，保持播放速度不变
+            'duration': self.duration * self.fps / fps,
+            'colors': min(self.colors, colors),
+            'delta_threshold': max(self.delta_threshold, delta_threshold),
+        }
+
+    def _read_frames(self, indices):
+        """解码还没有缓存的源帧并缩放到base_size"""
+        missing = sorted(set(indices) - set(self._frames))
+        position = None
+        for index in missing:
+            if position is None or not 0 <= index - position <= self.video_fps:
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                position = index
+            while position < index and self._cap.grab():
+                position += 1
+            ret, frame = self._cap.read()
+            if not ret:
+                position = None
+                continue
+            position += 1
+            self._frames[index] = next(_iter_video_transformed([frame], self.target_size, self.keep_aspect_ratio, self.fill_mode, 'area'))
+
+    def _windows(self, fps, warmup):
+        """返回(总帧数, 各窗口的源帧序号列表)，每个窗口依次为整帧、warmup个预热帧和计入大小的差异帧"""
+        indices = sample_frame_indices(self.video_fps, self.total_frames, self.start_time, self.end_time, fps)
+        count = len(indices)
+        width = min(1 + warmup + SIZE_ESTIMATE_WINDOW_FRAMES, count)
+        windows = []
+        for i in range(min(SIZE_ESTIMATE_WINDOWS, count)):
+            first = min(count - width, max(0, int((i + 0.5) * count / SIZE_ESTIMATE_WINDOWS) - width // 2))
+            windows.append(indices[first:first + width])
+        return count, windows
+
+    def estimate(self, level):
+        """
+        估算MAX_BYTES_LADDER中某一级参数下的GIF文件大小
+
+        参数:
+            level: MAX_BYTES_LADDER中的序号
+
+        返回:
+            int: 估算的字节数，时间范围内没有帧时为0
+        """
+        if level in self._estimates:
+            return self._estimates[level]
+        settings = self.settings(level)
+        warmup = math.ceil(SIZE_ESTIMATE_WARMUP_SECONDS * settings['fps']) if settings['delta_threshold'] > 0 else 0
+        count, windows = self._windows(settings['fps'], warmup)
+        self._read_frames([index for window in windows for index in window])
+
+        size = settings['target_size'] or self.base_size
+        def scaled(index):
+            arr = self._frames[index]
+            if (arr.shape[1], arr.shape[0]) == tuple(size):
+                return arr
+            return cv2.resize(arr, tuple(size), interpolation=cv2.INTER_AREA)
+        windows = [[scaled(index) for index in window if index in self._frames] for window in windows]
+        windows = [window for window in windows if window]
+        if not windows:
+            self._estimates[level] = 0
+            return 0
+
+        shared_palette = None
+        global_palette = None
+        if self.palette == 'global':
+            samples = [Image.fromarray(window[0]) for window in windows]
+            shared_palette = SharedPalette.from_images(samples, settings['colors'])
+            global_palette = shared_palette.palette
+        key_sizes = []
+        delta_sizes = []
+        for window in windows:
+            optimizer = GifFrameOptimizer(delta_threshold=settings['delta_threshold'])
+            quantizer = GifFrameQuantizer(self.palette, shared_palette, settings['colors'])
+            # 时间范围很短时窗口不足，缩短预热
+            window_warmup = max(0, min(warmup, len(window) - 2))
+            key_size = None
+            delta_bytes = 0
+            for position in range(len(window) + 1):
+                # 每一帧在下一帧加入时才输出，因此第position次加入输出的是第position-1帧（可能合并了相同的帧）
+                ready = optimizer.add(window[position], settings['duration']) if position < len(window) else optimizer.flush()
+                for frame in ready:
+                    if key_size is not None and position <= window_warmup + 1:
+                        continue
+                    p_img, transparency, offset, _, disposal = quantizer.quantize(*frame)
+                    # 延迟只影响固定长度的字段，不影响大小
+                    size = len(_encode_gif_frame(p_img, transparency, offset, 0, disposal, global_palette))
+                    if key_size is None:
+                        key_size = size
+                    else:
+                        delta_bytes += size
+            key_sizes.append(key_size)
+            if len(window) > 1:
+                delta_sizes.append(delta_bytes / (len(window) - 1 - window_warmup))
+        # 文件头、逻辑屏幕描述符、全局调色板和循环扩展
+        header = 13 + (768 if global_palette is not None else 0) + 19 + 1
+        key_size = sum(key_sizes) / len(key_sizes)
+        delta_size = sum(delta_sizes) / len(delta_sizes) if delta_sizes else key_size
+        estimate = int(header + key_size + (count - 1) * delta_size)
+        self._estimates[level] = estimate
+        return estimate
+
+    def choose(self, max_bytes, first_level=0, progress=None):
+        """
+        在MAX_BYTES_LADDER中二分查找估算大小不超过max_bytes的第一级
+
+        参数:
+            max_bytes: 估算大小的上限（字节）
+            first_level: 从该级开始查找
+            progress: GifProgress对象，用于取消
+
+        返回:
+            int: 选中的级别，所有级别都超出时返回最后一级
+        """
+        low, high = first_level, len(MAX_BYTES_LADDER) - 1
+        while low < high:
+            if progress is not None:
+                progress.check()
+            middle = (low + high) // 2
+            if self.estimate(middle) <= max_bytes:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+def _create_gif_within_size(video_path, output_file, max_bytes, start_time=0, end_time=None, fps=10, duration=None, target_size=None, keep_aspect_ratio=True, fill_mode='fill', palette='per-frame', delta_threshold=0, progress=None, resample='area', colors=256, select='fixed', select_threshold=SELECT_DUPLICATE_THRESHOLD, scene_boost=1, spool_dir=None, spool_max_bytes=FRAME_SPOOL_MAX_BYTES, encode_workers=None):
+    """
+    create_gif_from_video的--max-bytes模式：先估算大小选出参数，再完整编码一次
+
+    估算偏小导致实际大小超出目标时，按实际与估算之比修正，从更小的一级重新编码，
+    最多完整编码MAX_BYTES_ATTEMPTS次。估算按固定帧率抽帧，adaptive帧选择合并的重复帧几乎不占空间，
+    因此估算对它同样适用（略微偏大）。
+
+    返回:
+        bool: 是否成功创建不超过max_bytes的GIF
+    """
+    try:
+        with GifSizeEstimator(video_path, start_time, end_time, fps, duration, target_size, keep_aspect_ratio, fill_mode, palette, delta_threshold, colors) as estimator:
+            correction = 1.0
+            level = 0
+            for attempt in range(MAX_BYTES_ATTEMPTS):
+                started = time.perf_counter()
+                level = estimator.choose(max_bytes * MAX_BYTES_SAFETY / correction, level, progress)
+                settings = estimator.settings(level)
+                estimate = estimator.estimate(level)
+                elapsed = time.perf_counter() - started
+                if progress is not None:
+                    progress.add_time('估算', elapsed)
+                size = settings['target_size'] or estimator.base_size
+                print(f"目标大小: {max_bytes}字节，选择第{level + 1}/{len(MAX_BYTES_LADDER)}级参数: "
+                      f"{size[0]}x{size[1]}, {settings['fps']:g}fps, {settings['colors']}色, "
+                      f"delta_threshold={settings['delta_threshold']}，估算大小: {estimate}字节（估算耗时 {elapsed:.2f}秒）")
+
+                if not create_gif_from_video(video_path, output_file, start_time, end_time, settings['fps'], settings['duration'],
+                                             settings['target_size'], keep_aspect_ratio, fill_mode, palette, settings['delta_threshold'],
+                                             progress, resample, settings['colors'], None, select, select_threshold, scene_boost,
+                                             spool_dir, spool_max_bytes, encode_workers, 'gif'):
+                    return False
+                actual = os.path.getsize(output_file)
+                print(f"估算大小: {estimate}字节，实际大小: {actual}字节，误差: {(estimate - actual) / actual * 100:+.1f}%")
+                if actual <= max_bytes:
+                    return True
+                if level == len(MAX_BYTES_LADDER) - 1:
+                    break
+                correction = actual / max(1, estimate)
+                level += 1
+                print(f"实际大小超出目标，按估算误差修正后重新选择参数（第{attempt + 2}次编码）")
+    except Exception as e:
+        return _report_failure(f"创建GIF时出错: {e}", progress)
+    # 超出目标的文件不保留
+    os.remove(output_file)
+    return _report_failure(f"错误: 无法生成不超过{max_bytes}字节的GIF（最后一次为{actual}字节），请缩短时间范围", progress)
+
+# 视频转GIF时每个输出可以单独设置的参数及其默认值，与create_gif_from_video的同名参数相同
+VIDEO_OUTPUT_DEFAULTS = {
+    'output': None,
+    'fps': 10,
+    'duration': None,
+    'target_size': None,
+    'keep_aspect_ratio': True,
+    'fill_mode': 'fill',
+    'palette': 'per-frame',
+    'delta_threshold': 0,
+    'resample': 'area',
+    'colors': 256,
+    'select': 'fixed',
+    'select_threshold': SELECT_DUPLICATE_THRESHOLD,
+    'scene_boost': 1,
+    'encode_workers': None,
+    'output_format': None,
+    'quality': None,
+    'segments': None,
+}
+
+def resolve_video_output(spec):
+    """
+    检查一个视频转GIF的输出规格并补全默认值
+
+    参数:
+        spec: 输出规格字典，键见VIDEO_OUTPUT_DEFAULTS，其中output为必填项，值为None的项使用默认值
+
+    返回:
+        dict: 补全后的规格。palette、resample和select已检查，duration已根据fps计算，
+            scene_boost在fixed模式下为1（即解码时每秒提取fps * scene_boost帧），
+            output_format已根据扩展名推断，webp和apng的palette为per-frame（不量化，也不需要共享调色板），
+            segments已检查并排序
+    """
+    unknown = set(spec) - set(VIDEO_OUTPUT_DEFAULTS)
+    if unknown:
+        raise ValueError(f"未知的输出参数: {', '.join(sorted(unknown))}")
+    resolved = dict(VIDEO_OUTPUT_DEFAULTS)
+    resolved.update((key, value) for key, value in spec.items() if value is not None)
+    if not resolved['output']:
+        raise ValueError("输出规格缺少output")
+    resolved['target_size'] = tuple(resolved['target_size']) if resolved['target_size'] else None
+    if resolved['duration'] is None:
+        resolved['duration'] = 1000 / resolved['fps']  # 将fps转换为毫秒延迟
+    resolved['palette'] = resolve_palette_mode(resolved['palette'])
+    resolved['resample'] = resolve_resample(resolved['resample'])
+    resolved['select'] = resolve_select_mode(resolved['select'])
+    resolved['output_format'] = resolve_output_format(resolved['output_format'], resolved['output'])
+    resolved['segments'] = resolve_segments(resolved['segments'])
+    if resolved['output_format'] != 'gif':
+        resolved['palette'] = 'per-frame'
+    if resolved['scene_boost'] < 1:
+        raise ValueError(f"scene_boost必须是正整数: {resolved['scene_boost']}")
+    if resolved['select'] != 'adaptive':
+        resolved['scene_boost'] = 1
+    return resolved
+
+def _sample_video_palettes(video_path, start_time, end_time, specs, progress=None):
+    """
+    为global调色板模式的输出构建共享调色板，抽样帧只解码一次，按各输出的大小分别转换
+
+    返回:
+        list: 与specs对应的SharedPalette，不需要或无法抽样时为None
+    """
+    palettes = [None] * len(specs)
+    wanted = [index for index, spec in enumerate(specs) if spec['palette'] == 'global']
+    if not wanted:
+        return palettes
+    samples = {index: [] for index in wanted}
+    # 时间片段相同的输出共用抽样帧
+    groups = collections.defaultdict(list)
+    for index in wanted:
+        groups[tuple(specs[index]['segments'] or ())].append(index)
+    start = time.perf_counter()
+    for segments, indices in groups.items():
+        for frame in iter_video_sample_frames(video_path, start_time, end_time, PALETTE_SAMPLE_FRAMES, list(segments) or None):
+            for index in indices:
+                spec = specs[index]
+                samples[index].append(_video_frame_to_image(frame, spec['target_size'], spec['keep_aspect_ratio'], spec['fill_mode'], spec['resample']))
+    if progress is not None:
+        progress.add_time('解码', time.perf_counter() - start)
+    start = time.perf_counter()
+    for index in wanted:
+        if samples[index]:
+            palettes[index] = SharedPalette.from_images(samples[index], specs[index]['colors'])
+    if progress is not None:
+        progress.add_time('量化', time.perf_counter() - start)
+    return palettes
+
+def _video_frame_stages(spec):
+    """
+    返回视频转GIF在解码之后、帧间优化之前的阶段：adaptive模式下的筛选，以及调整大小
+
+    参数:
+        spec: resolve_video_output返回的输出规格
+
+    返回:
+        list: PipelineStage列表，输入为OpenCV的BGR帧（adaptive模式下按fps * scene_boost抽取），
+            最后一个阶段输出(帧, 延迟毫秒)
+    """
+    duration = spec['duration']
+    boost = spec['scene_boost']
+    target_size, keep_aspect_ratio, fill_mode = spec['target_size'], spec['keep_aspect_ratio'], spec['fill_mode']
+
+    def convert(frames):
+        return _iter_video_transformed(frames, target_size, keep_aspect_ratio, fill_mode, spec['resample'])
+
+    if spec['select'] == 'adaptive':
+        # 筛选之后的每一帧带有各自的延迟
+        return [
+            PipelineStage('筛选', lambda frames: select_video_frames(frames, duration / boost, spec['select_threshold'], boost)),
+            PipelineStage('调整大小', lambda frames: _map_timed(convert, frames)),
+        ]
+    return [PipelineStage('调整大小', lambda frames: ((frame, duration) for frame in convert(frames)))]
+
+def _write_video_gif(stages, spec, shared_palette=None, progress=None):
+    """
+    在给定的阶段之后加上帧间优化、量化和编码（webp和apng格式只有编码），以流水线方式运行并写入spec['output']
+
+    参数:
+        stages: 流水线前面的阶段，最后一个阶段输出(帧, 延迟毫秒)
+        spec: resolve_video_output返回的输出规格
+        shared_palette: global模式下预先构建的SharedPalette
+        progress: GifProgress对象，用于取消和记录各阶段耗时
+
+    返回:
+        tuple: (写入的帧数, 流水线各阶段)
+    """
+    if spec['output_format'] != 'gif':
+        # WebP和APNG直接保存调整大小后的真彩色帧
+        with AnimationWriter(spec['output'], spec['output_format'], spec['duration'], quality=spec['quality'], progress=progress) as writer:
+            stages = stages + [PipelineStage('编码', lambda frames: (writer.write(frame, duration) for frame, duration in frames), record=False)]
+            run_pipeline(stages, progress=progress)
+        return writer.frame_count, stages
+    with GifStreamWriter(spec['output'], spec['duration'], palette=spec['palette'], shared_palette=shared_palette, progress=progress, encode_workers=spec['encode_workers']) as writer:
+        stages = stages + [
+            PipelineStage('优化', lambda images: GifFrameOptimizer(delta_threshold=spec['delta_threshold']).iter_optimized(images, None)),
+            PipelineStage('量化', lambda frames: GifFrameQuantizer(spec['palette'], shared_palette, spec['colors']).iter_quantized(frames)),
+            # 由GifStreamWriter分别记录LZW编码和写入文件的耗时
+            PipelineStage('编码', lambda quantized: (writer.write_quantized(*frame) for frame in quantized), record=False),
+        ]
+        run_pipeline(stages, progress=progress)
+    return writer.frame_count, stages
+
+def _spool_video_frames(stages, spool, progress=None):
+    """
+    运行解码、筛选和调整大小阶段，把输出的(帧, 延迟毫秒)依次写入帧缓冲
+
+    返回:
+        list: 流水线各阶段
+    """
+    def write(frames):
+        for frame, duration in frames:
+            spool.append(frame, duration)
+            yield duration
+
+    stages = stages + [PipelineStage('缓冲', write)]
+    run_pipeline(stages, progress=progress)
+    return stages
+
+def _iter_spooled_frames(spool, progress=None):
+    """按顺序从帧缓冲中读取(帧, 延迟毫秒)"""
+    for index in range(len(spool)):
+        if progress is not None:
+            progress.check()
+        yield spool[index], spool.durations[index]
+
+def create_gif_from_video(video_path, output_file, start_time=0, end_time=None, fps=10, duration=None, target_size=None, keep_aspect_ratio=True, fill_mode='fill', palette='per-frame', delta_threshold=0, progress=None, resample='area', colors=256, max_bytes=None, select='fixed', select_threshold=SELECT_DUPLICATE_THRESHOLD, scene_boost=1, spool_dir=None, spool_max_bytes=FRAME_SPOOL_MAX_BYTES, encode_workers=None, output_format=None, quality=None, output_cache=None, segments=None):
     """
     从视频文件创建GIF
+
+    解码、调整大小、帧间优化、量化和编码五个阶段在各自的线程中以流水线方式并发运行，
+    阶段之间通过有界队列连接，峰值内存只与单帧大小有关，与视频长度无关。
+    完成后会打印各阶段的吞吐量，便于判断瓶颈所在。
     
     参数:
         video_path: 视频文件路径
@@ -366,49 +3726,459 @@ def create_gif_from_video(video_path, output_file, start_time=0, end_time=None,
         duration: 每一帧的延迟时间（毫秒），如果为None则根据fps自动计算
         target_size: 目标大小，格式为(宽, 高)
         keep_aspect_ratio: 是否保持原始宽高比
-    
+        palette: 调色板模式，见PALETTE_MODES。global模式会先从整段视频中均匀抽帧构建调色板
+        delta_threshold: 帧间优化时像素视为未变化的最大通道差值，0表示必须完全相同。
+            视频解码后存在轻微噪声，适当调大（例如8）可以显著减小静止画面较多的视频的文件大小
+        progress: GifProgress对象，用于取消以及获取帧数、文件大小和各阶段耗时
+        resample: 重采样滤镜，见RESAMPLE_FILTERS。默认的area直接在NumPy数组上用cv2.resize缩放，
+            不创建中间的Image对象，速度最快；其他滤镜使用Pillow缩放
+        colors: 每个调色板最多包含的颜色数（2-256）
+        max_bytes: 输出文件大小上限（字节）。指定时先从少量抽样帧估算大小（见GifSizeEstimator），
+            按MAX_BYTES_LADDER自动降低颜色数、分辨率和帧率，使一次完整编码即可落在上限以内，
+            并打印估算大小与实际大小的误差
+        select: 帧选择模式，见FRAME_SELECT_MODES。adaptive模式在解码之后增加一个“筛选”阶段（见select_video_frames），
+            近似重复的帧不再调整大小和编码，静止画面较多的视频帧数和耗时都明显减少
+        select_threshold: adaptive模式下视为重复帧的缩略图最大像素差（0-255）
+        scene_boost: adaptive模式下按fps的多少倍抽取候选帧，额外的帧只在场景变化或剧烈运动处保留，1表示不额外抽帧
+        spool_dir: global模式下使用的帧缓冲（FrameSpool）的目录，None表示不使用。使用时分两遍处理：
+            第一遍解码并调整大小，把所有输出帧写入帧缓冲；调色板从这些帧中均匀抽样构建；
+            第二遍从帧缓冲读取帧进行编码。抽样不再需要定位并重新解码视频（长视频的关键帧间隔较大时很慢），
+            调色板也来自实际输出的帧。帧缓冲超出大小上限时改为原来的抽样方式
+        spool_max_bytes: 帧缓冲文件的大小上限（字节）
+        encode_workers: LZW编码使用的进程数，None或1表示在当前线程中编码，0表示使用全部CPU核心，见GifStreamWriter
+        output_format: 输出格式，见OUTPUT_FORMATS，None表示根据output_file的扩展名推断（.webp、.png/.apng，其他为gif）。
+            webp和apng保存真彩色帧，palette、delta_threshold、colors、spool_dir和max_bytes不起作用
+            （max_bytes只支持gif），见AnimationWriter
+        quality: 动画WebP的有损压缩质量（0-100），None表示使用WEBP_QUALITY
+        output_cache: OutputCache对象，输入和参数与之前某次生成相同时直接使用缓存的文件，None表示不使用
+        segments: 时间片段列表[(开始秒, 结束秒), ...]或字符串"0-2,10-12.5"（见resolve_segments），
+            指定时按时间顺序提取各片段并连接成一个GIF，忽略start_time和end_time。所有片段在一次顺序读取中完成，
+            见iter_video_source_frame_groups。使用max_bytes时只能指定一个片段
+
     返回:
         bool: 是否成功创建GIF
     """
-    # 提取视频帧
-    frames = extract_frames_from_video(video_path, start_time, end_time, fps, target_size, keep_aspect_ratio, fill_mode)
-    
-    if not frames:
-        print("错误: 没有从视频中提取到有效帧")
-        return False
-    
-    # 如果未指定duration，则根据fps计算
-    if duration is None:
-        duration = int(1000 / fps)  # 将fps转换为毫秒延迟
+    if output_cache is not None:
+        options = dict(video_path=video_path, output_file=output_file, start_time=start_time, end_time=end_time, fps=fps,
+                       duration=duration, target_size=target_size, keep_aspect_ratio=keep_aspect_ratio, fill_mode=fill_mode,
+                       palette=palette, delta_threshold=delta_threshold, progress=progress, resample=resample, colors=colors,
+                       max_bytes=max_bytes, select=select, select_threshold=select_threshold, scene_boost=scene_boost,
+                       spool_dir=spool_dir, spool_max_bytes=spool_max_bytes, encode_workers=encode_workers,
+                       output_format=output_format, quality=quality, output_cache=None, segments=segments)
+        return output_cache.render(create_gif_from_video, options, [video_path])
+    if max_bytes:
+        if segments is not None:
+            try:
+                segments = resolve_segments(segments)
+            except ValueError as e:
+                return _report_failure(f"错误: {e}", progress)
+            if len(segments) > 1:
+                return _report_failure("错误: 目标文件大小模式不支持多个时间片段", progress)
+            # 只有一个片段时等同于指定开始和结束时间
+            start_time, end_time = segments[0]
+        try:
+            gif_output = resolve_output_format(output_format, output_file) == 'gif'
+        except ValueError as e:
+            return _report_failure(f"错误: {e}", progress)
+        if not gif_output:
+            return _report_failure("错误: 目标文件大小模式只支持GIF格式", progress)
+        return _create_gif_within_size(video_path, output_file, max_bytes, start_time, end_time, fps, duration, target_size, keep_aspect_ratio, fill_mode, palette, delta_threshold, progress, resample, colors, select, select_threshold, scene_boost, spool_dir, spool_max_bytes, encode_workers)
     
     # 创建GIF
     try:
-        # 确保输出目录存在
-        output_dir = os.path.dirname(output_file)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            print(f"创建输出目录: {output_dir}")
+        spec = resolve_video_output({
+            'output': output_file,
+            'fps': fps,
+            'duration': duration,
+            'target_size': target_size,
+            'keep_aspect_ratio': keep_aspect_ratio,
+            'fill_mode': fill_mode,
+            'palette': palette,
+            'delta_threshold': delta_threshold,
+            'resample': resample,
+            'colors': colors,
+            'select': select,
+            'select_threshold': select_threshold,
+            'scene_boost': scene_boost,
+            'encode_workers': encode_workers,
+            'output_format': output_format,
+            'quality': quality,
+            'segments': segments,
+        })
         
-        # 保存为GIF
-        frames[0].save(
-            output_file,
-            format='GIF',
-            append_images=frames[1:],
-            save_all=True,
-            duration=duration,  # 毫秒
-            loop=0  # 0表示无限循环
-        )
+        def decode(_):
+            frames = iter_video_source_frames(video_path, start_time, end_time, spec['fps'] * spec['scene_boost'], spec['segments'])
+            return progress.watch(frames) if progress is not None else frames
+
+        spool = None
+        spooled_stages = []
+        if spool_dir is not None and spec['palette'] == 'global':
+            spool = FrameSpool(spool_dir, spool_max_bytes)
+            try:
+                spooled_stages = _spool_video_frames([PipelineStage('解码', decode)] + _video_frame_stages(spec), spool, progress)
+            except FrameSpoolFull as e:
+                spool.close()
+                spool = None
+                print(f"警告: {e}，改为抽样构建调色板并重新解码视频")
+        try:
+            if spool is not None:
+                print(f"帧缓冲: {len(spool)} 帧, {spool.nbytes / (1024 * 1024):.1f} MB")
+                shared_palette = None
+                if len(spool):
+                    start = time.perf_counter()
+                    shared_palette = SharedPalette.from_images([Image.fromarray(frame) for frame in _sample_evenly(spool, PALETTE_SAMPLE_FRAMES)], spec['colors'])
+                    if progress is not None:
+                        progress.add_time('量化', time.perf_counter() - start)
+                stages = [PipelineStage('缓冲', lambda _: _iter_spooled_frames(spool, progress))]
+            else:
+                shared_palette = _sample_video_palettes(video_path, start_time, end_time, [spec], progress)[0]
+                stages = [PipelineStage('解码', decode)] + _video_frame_stages(spec)
+            frame_count, stages = _write_video_gif(stages, spec, shared_palette, progress)
+        finally:
+            if spool is not None:
+                spool.close()
+        
+        if frame_count == 0:
+            return _report_failure("错误: 没有从视频中提取到有效帧", progress)
         
+        if spooled_stages:
+            print_pipeline_stats(spooled_stages)
+        print_pipeline_stats(stages)
+        if progress is not None:
+            progress.finish(output_file, frame_count)
         print(f"成功创建GIF: {output_file}")
         return True
     
     except Exception as e:
-        print(f"创建GIF时出错: {e}")
-        return False
+        return _report_failure(f"创建GIF时出错: {e}", progress)
 
-def main():
-    # 解析命令行参数
-    parser = argparse.ArgumentParser(description='将多张图片或视频片段合并成GIF动态图片')
+def create_gifs_from_video(video_path, outputs, start_time=0, end_time=None, progress=None):
+    """
+    只解码一次，从同一段视频同时生成多个GIF（例如缩略图、中等尺寸和完整尺寸）
+
+    各输出需要的源帧合并后只读取一次（见iter_video_source_frame_groups），每一帧分发给各输出自己的流水线
+    （筛选、调整大小、帧间优化、量化和编码），各输出的流水线并发运行。分发队列有界，
+    最慢的输出会让解码等待，峰值内存与视频长度无关。一个输出失败不影响其他输出。
+
+    参数:
+        video_path: 视频文件路径
+        outputs: 输出规格字典的列表，键见VIDEO_OUTPUT_DEFAULTS，其中output为必填项
+        start_time: 开始时间（秒）
+        end_time: 结束时间（秒），如果为None则提取到视频结束
+        progress: 所有输出共用的GifProgress对象。解码耗时只记录一次，其余各阶段为所有输出的合计，
+            成功时帧数和字节数也是所有输出的合计
+
+    返回:
+        list: 与outputs一一对应，是否成功创建了各个GIF
+    """
+    results = [False] * len(outputs)
+    try:
+        specs = [resolve_video_output(spec) for spec in outputs]
+        paths = [os.path.abspath(spec['output']) for spec in specs]
+        if len(set(paths)) < len(paths):
+            raise ValueError("多个输出使用了同一个文件")
+        if not specs:
+            raise ValueError("没有指定输出")
+        if not _load_cv2():
+            raise ValueError("未安装opencv-python库，无法处理视频文件。请使用 'pip install opencv-python' 安装。")
+        palettes = _sample_video_palettes(video_path, start_time, end_time, specs, progress)
+    except Exception as e:
+        _report_failure(f"创建GIF时出错: {e}", progress)
+        return results
+
+    queues = [queue.Queue(maxsize=PIPELINE_QUEUE_SIZE) for _ in specs]
+    # 输出的流水线结束（完成或出错）后不再向它分发
+    closed = [threading.Event() for _ in specs]
+    decode_errors = []
+    outcomes = [None] * len(specs)  # (帧数, 流水线各阶段) 或异常
+
+    def run_output(index):
+        def receive(_):
+            while True:
+                start = time.perf_counter()
+                item = queues[index].get()
+                source.wait_time += time.perf_counter() - start
+                if item is _PIPELINE_END:
+                    break
+                frame, count = item
+                for _ in range(count):
+                    yield frame
+            if decode_errors:
+                raise decode_errors[0]
+
+        # 解码耗时由分发线程记录，这个阶段只是等待分发的帧
+        source = PipelineStage('分发', receive, record=False)
+        try:
+            outcomes[index] = _write_video_gif([source] + _video_frame_stages(specs[index]), specs[index], palettes[index], progress)
+        except Exception as e:
+            outcomes[index] = e
+        finally:
+            closed[index].set()
+
+    def put(index, item):
+        while not closed[index].is_set():
+            try:
+                queues[index].put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    threads = [threading.Thread(target=run_output, args=(index,), name=f'output-{index}', daemon=True) for index in range(len(specs))]
+    for thread in threads:
+        thread.start()
+    decode_time = 0.0
+    decoded = 0
+    try:
+        frames = iter_video_source_frame_groups(video_path, start_time, end_time, [spec['fps'] * spec['scene_boost'] for spec in specs], [spec['segments'] for spec in specs])
+        if progress is not None:
+            frames = progress.watch(frames)
+        mark = time.perf_counter()
+        for frame, counts in frames:
+            decode_time += time.perf_counter() - mark
+            decoded += 1
+            for index, count in enumerate(counts):
+                if count:
+                    put(index, (frame, count))
+            if all(event.is_set() for event in closed):
+                break
+            mark = time.perf_counter()
+    except BaseException as e:
+        decode_errors.append(e)
+    finally:
+        for index in range(len(specs)):
+            put(index, _PIPELINE_END)
+        for thread in threads:
+            thread.join()
+    if progress is not None:
+        progress.add_time('解码', decode_time, decoded)
+    if decode_errors and not isinstance(decode_errors[0], Exception):
+        raise decode_errors[0]
+
+    errors = []
+    frame_total = 0
+    for index, (spec, outcome) in enumerate(zip(specs, outcomes)):
+        if isinstance(outcome, Exception):
+            errors.append(f"创建GIF {spec['output']} 时出错: {outcome}")
+        elif outcome[0] == 0:
+            errors.append(f"错误: 没有从视频中提取到有效帧，未创建 {spec['output']}")
+        else:
+            print(f"{spec['output']}:")
+            print_pipeline_stats(outcome[1])
+            print(f"成功创建GIF: {spec['output']}（{outcome[0]} 帧）")
+            frame_total += outcome[0]
+            results[index] = True
+    for message in errors:
+        print(message)
+    if progress is not None:
+        if errors:
+            progress.fail(errors[0])
+        else:
+            progress.finish([spec['output'] for spec in specs], frame_total)
+    return results
+
+# 异步接口默认同时执行的任务数
+ASYNC_MAX_CONCURRENCY = os.cpu_count() or 1
+
+class GifResult:
+    """
+    异步接口返回的GIF生成结果
+
+    属性:
+        output_file: 输出的GIF文件路径
+        success: 是否成功创建GIF
+        size: 输出文件大小（字节），失败时为0
+        frame_count: 写入GIF的帧数（合并相同帧之后）
+        stage_times: 各阶段耗时（秒）的字典，键为METRIC_STAGE_IDS中的阶段名
+        elapsed: 从提交到完成的总耗时（秒），包括排队等待的时间
+        error: 失败时的错误信息
+        metrics: GifProgress.metrics()返回的完整度量，包括各阶段帧数和峰值内存
+    """
+
+    def __init__(self, output_file, success, size=0, frame_count=0, stage_times=None, elapsed=0.0, error=None, metrics=None):
+        self.output_file = output_file
+        self.success = success
+        self.size = size
+        self.frame_count = frame_count
+        self.stage_times = stage_times or {}
+        self.elapsed = elapsed
+        self.error = error
+        self.metrics = metrics or {}
+
+    def to_dict(self):
+        """转换为可以JSON序列化的字典"""
+        return {
+            'output_file': self.output_file,
+            'success': self.success,
+            'size': self.size,
+            'frame_count': self.frame_count,
+            'stage_times': self.stage_times,
+            'elapsed': self.elapsed,
+            'error': self.error,
+            'metrics': self.metrics,
+        }
+
+    def __repr__(self):
+        return (f"GifResult(output_file={self.output_file!r}, success={self.success}, size={self.size}, "
+                f"frame_count={self.frame_count}, elapsed={self.elapsed:.3f}, error={self.error!r})")
+
+# 异步接口支持的输入类型及对应的同步函数
+_ASYNC_SOURCES = {
+    'images': create_gif_from_directory,
+    'video': create_gif_from_video,
+}
+
+class AsyncGifMaker:
+    """
+    在asyncio程序中创建GIF，不阻塞事件循环
+
+    解码、缩放、量化和编码都在专用线程池中执行，线程数即同时执行的任务上限，超出的任务排队等待，
+    不会占用事件循环的默认线程池。任务被取消或超时时会通知工作线程在处理下一帧之前停止，
+    并删除未完成的输出文件。
+
+    用法:
+        async with AsyncGifMaker(max_concurrency=4) as maker:
+            result = await maker.make_gif('video', 'input.mp4', 'output.gif', timeout=60, fps=10)
+    """
+
+    def __init__(self, max_concurrency=None):
+        """
+        参数:
+            max_concurrency: 同时执行的任务数上限，None表示使用ASYNC_MAX_CONCURRENCY
+        """
+        self.max_concurrency = max_concurrency or ASYNC_MAX_CONCURRENCY
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='gif-maker')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """关闭线程池，已开始的任务会继续执行完毕"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def make_gif(self, source, input_path, output_file, timeout=None, callback=None, **options):
+        """
+        异步创建GIF
+
+        参数:
+            source: 输入类型，'images'表示图片目录（同create_gif_from_directory），'video'表示视频文件（同create_gif_from_video）
+            input_path: 输入图片目录或视频文件路径
+            output_file: 输出的GIF文件路径
+            timeout: 超时时间（秒），包括排队等待的时间，None表示不限制
+            callback: 进度回调，见GifProgress，在工作线程中调用，None表示不回调
+            **options: 传给对应同步函数的其他参数，例如duration、target_size、fps或palette
+
+        返回:
+            GifResult: 生成结果。超时时success为False；任务被取消时抛出asyncio.CancelledError
+        """
+        if source not in _ASYNC_SOURCES:
+            raise ValueError(f"不支持的输入类型: {source}，可选值为 {', '.join(_ASYNC_SOURCES)}")
+        import asyncio
+        loop = asyncio.get_running_loop()
+        progress = GifProgress(callback)
+        func = functools.partial(_ASYNC_SOURCES[source], input_path, output_file, progress=progress, **options)
+        start = time.perf_counter()
+        try:
+            success = await asyncio.wait_for(loop.run_in_executor(self._executor, func), timeout)
+        except asyncio.TimeoutError:
+            progress.cancel()
+            return GifResult(output_file, False, stage_times=progress.stage_times,
+                             elapsed=time.perf_counter() - start, error=f"超时（{timeout}秒）", metrics=progress.metrics())
+        except asyncio.CancelledError:
+            progress.cancel()
+            raise
+        return GifResult(output_file, success, progress.bytes, progress.frames, progress.stage_times,
+                         time.perf_counter() - start, progress.error, progress.metrics())
+
+_default_async_maker = None
+
+async def make_gif_async(source, input_path, output_file, timeout=None, callback=None, **options):
+    """
+    使用模块默认的AsyncGifMaker异步创建GIF，参数和返回值见AsyncGifMaker.make_gif
+
+    默认实例最多同时执行ASYNC_MAX_CONCURRENCY个任务，需要其他并发上限时请自行创建AsyncGifMaker。
+    """
+    global _default_async_maker
+    if _default_async_maker is None:
+        _default_async_maker = AsyncGifMaker()
+    return await _default_async_maker.make_gif(source, input_path, output_file, timeout, callback, **options)
+
+# --output-spec中需要转换为数值的参数
+OUTPUT_SPEC_TYPES = {
+    'fps': float,
+    'duration': int,
+    'delta_threshold': int,
+    'colors': int,
+    'select_threshold': float,
+    'scene_boost': int,
+    'encode_workers': int,
+    'quality': int,
+}
+
+def parse_output_spec(text):
+    """
+    解析video子命令的--output-spec参数
+
+    格式为逗号分隔的key=value，例如"output=thumb.gif,size=160x90,fps=5,fill_mode=center,palette=global"。
+    size为"宽x高"，format为输出格式（即output_format），segments为分号分隔的时间片段（例如"0-2;10-12"），其余键与VIDEO_OUTPUT_DEFAULTS相同（也可以写成fill-mode），路径中不能包含逗号。
+
+    参数:
+        text: 参数字符串
+
+    返回:
+        dict: 输出规格，只包含指定了的键
+    """
+    spec = {}
+    for item in text.split(','):
+        key, sep, value = item.partition('=')
+        key = key.strip().replace('-', '_')
+        if not sep or not key:
+            raise ValueError(f"无效的输出规格: {text}，格式为key=value,key=value,...")
+        try:
+            if key == 'size':
+                width, height = value.lower().split('x')
+                spec['target_size'] = (int(width), int(height))
+            elif key == 'format':
+                spec['output_format'] = value.lower()
+            elif key == 'keep_aspect_ratio':
+                spec[key] = value.lower() in ('1', 'true', 'yes')
+            elif key == 'segments':
+                # 逗号已用于分隔键值对，多个片段用分号分隔
+                spec[key] = resolve_segments(value.replace(';', ','))
+            else:
+                spec[key] = OUTPUT_SPEC_TYPES.get(key, str)(value)
+        except ValueError:
+            raise ValueError(f"输出规格 {text} 中 {key} 的值无效: {value}")
+    return spec
+
+class JobArgumentParser(argparse.ArgumentParser):
+    """
+    解析清单任务参数用的解析器：参数有误时抛出ValueError，而不是打印用法后退出进程
+
+    不接受参数名的缩写，任务字典的键必须是完整的参数名。
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('allow_abbrev', False)
+        super().__init__(*args, **kwargs)
+
+    def error(self, message):
+        raise ValueError(f"无效的任务参数: {message}")
+
+def build_parser(parser_class=argparse.ArgumentParser):
+    """
+    创建命令行参数解析器
+
+    参数:
+        parser_class: 解析器类，子命令的解析器也使用该类，解析清单任务时为JobArgumentParser
+
+    返回:
+        ArgumentParser: 包含images、video、batch和serve子命令的解析器，
+            subcommand_parsers属性为子命令名到子命令解析器的字典
+    """
+    parser = parser_class(description='将多张图片或视频片段合并成GIF动态图片')
     
     # 创建子命令解析器
     subparsers = parser.add_subparsers(dest='command', help='命令')
@@ -424,13 +4194,29 @@ def main():
     img_parser.add_argument('--height', type=int, help='调整后的图片高度')
     img_parser.add_argument('-k', '--keep-aspect-ratio', action='store_true', default=True, help='是否保持原始宽高比')
     img_parser.add_argument('--fill-mode', choices=['center', 'fill'], default='fill', help='填充模式，当保持宽高比时：center=居中放置，fill=缩放裁剪填满画面（默认）')
+    img_parser.add_argument('--resample', choices=list(RESAMPLE_FILTERS), default='lanczos', help='调整大小时的重采样滤镜：lanczos=质量最好（默认），bilinear=较快，area=区域平均，缩小时最快')
+    img_parser.add_argument('--palette', choices=PALETTE_MODES, default='per-frame', help='调色板模式：per-frame=每帧单独量化（默认），global=所有帧共享一个调色板，adaptive=共享调色板并在画面变化较大时重建')
+    img_parser.add_argument('--delta-threshold', type=int, default=0, help='帧间优化时像素视为未变化的最大通道差值（0-255），默认0表示必须完全相同')
+    img_parser.add_argument('-j', '--jobs', type=int, default=1, help='调整图片大小时使用的并行进程数，0表示使用全部CPU核心，默认1')
+    img_parser.add_argument('--encode-jobs', type=int, default=1, help='LZW编码使用的并行进程数，0表示使用全部CPU核心，默认1（在当前进程中编码）。只有不小于256x256像素的帧交给进程池，单核时忽略。输出与逐帧编码完全相同')
+    img_parser.add_argument('--format', choices=OUTPUT_FORMATS, help='输出格式：gif、webp（动画WebP）或apng，默认根据输出文件扩展名推断（.webp、.png/.apng，其他为gif）')
+    img_parser.add_argument('--quality', type=int, help=f'动画WebP的有损压缩质量（0-100），默认{WEBP_QUALITY}')
+    img_parser.add_argument('--cache-dir', help='调整大小后的帧的缓存目录，重复生成时跳过未变化图片的解码和缩放，默认不使用缓存')
+    img_parser.add_argument('--append', action='store_true', help='增量更新：只把上次运行之后新增的图片追加到已有的GIF，状态保存在输出文件旁的.state.npz文件中')
+    img_parser.add_argument('--output-cache', help='输出缓存目录：图片和参数都与之前某次生成相同时，直接硬链接（或复制）缓存的文件。默认不使用')
+    img_parser.add_argument('--output-cache-size', type=int, default=OUTPUT_CACHE_MAX_BYTES // (1024 * 1024), help='输出缓存大小上限(MB)，超出时淘汰最久未使用的条目，默认1024')
+    img_parser.add_argument('--cache-size', type=int, default=FRAME_CACHE_MAX_BYTES // (1024 * 1024), help='帧缓存大小上限(MB)，超出时淘汰最久未使用的帧，默认1024')
+    img_parser.add_argument('--stats', choices=['text', 'json'], help='完成后输出各阶段耗时、帧数、字节数和峰值内存：text=易读的表格，json=一行JSON（最后一行输出）')
+    img_parser.add_argument('--prometheus', help='把统计信息以Prometheus文本格式写入该文件（例如node_exporter的textfile目录）')
     
     # 从视频创建GIF的子命令
     video_parser = subparsers.add_parser('video', help='从视频创建GIF')
     video_parser.add_argument('-i', '--input', required=True, help='输入视频文件路径')
-    video_parser.add_argument('-o', '--output', required=True, help='输出GIF文件路径')
+    video_parser.add_argument('-o', '--output', help='输出GIF文件路径，使用--output-spec时可以省略')
     video_parser.add_argument('-s', '--start', type=float, default=0, help='开始时间(秒)，默认0')
     video_parser.add_argument('-e', '--end', type=float, help='结束时间(秒)，默认为视频结束')
+    video_parser.add_argument('--segments', help='只提取若干时间片段，例如"0-2,10-12.5,40-43"（秒），按时间顺序在一遍读取中提取并连接成一个GIF，不能与-s和-e同时使用')
+    video_parser.add_argument('--split-segments', action='store_true', help='配合--segments，每个片段输出一个文件（输出文件名后加_1、_2……），视频仍只读取一遍')
     video_parser.add_argument('-f', '--fps', type=float, default=10, help='每秒提取的帧数，默认10')
     video_parser.add_argument('-d', '--duration', type=int, help='每一帧的延迟时间(毫秒)，默认根据fps自动计算')
     video_parser.add_argument('-r', '--resize', action='store_true', help='是否调整图片大小')
@@ -438,19 +4224,55 @@ def main():
     video_parser.add_argument('--height', type=int, help='调整后的图片高度')
     video_parser.add_argument('-k', '--keep-aspect-ratio', action='store_true', default=True, help='是否保持原始宽高比')
     video_parser.add_argument('--fill-mode', choices=['center', 'fill'], default='fill', help='填充模式，当保持宽高比时：center=居中放置，fill=缩放裁剪填满画面（默认）')
+    video_parser.add_argument('--resample', choices=list(RESAMPLE_FILTERS), default='area', help='调整大小时的重采样滤镜：area=区域平均，直接在NumPy数组上缩放，速度最快（默认），lanczos=质量最好，bilinear=较快')
+    video_parser.add_argument('--palette', choices=PALETTE_MODES, default='per-frame', help='调色板模式：per-frame=每帧单独量化（默认），global=所有帧共享一个调色板，adaptive=共享调色板并在画面变化较大时重建')
+    video_parser.add_argument('--delta-threshold', type=int, default=0, help='帧间优化时像素视为未变化的最大通道差值（0-255），默认0表示必须完全相同')
+    video_parser.add_argument('--colors', type=int, default=256, help='每个调色板最多包含的颜色数（2-256），默认256')
+    video_parser.add_argument('--select', choices=FRAME_SELECT_MODES, default='fixed', help='帧选择模式：fixed=按固定帧率抽帧（默认），adaptive=合并近似重复的帧，并可在场景变化处保留额外的帧')
+    video_parser.add_argument('--select-threshold', type=float, default=SELECT_DUPLICATE_THRESHOLD, help=f'adaptive模式下缩小的灰度画面最大像素差（0-255）不超过该值时视为重复帧，默认{SELECT_DUPLICATE_THRESHOLD}')
+    video_parser.add_argument('--scene-boost', type=int, default=1, help='adaptive模式下按fps的多少倍抽取候选帧，额外的帧只在场景变化或剧烈运动处保留，默认1表示不额外抽帧')
+    video_parser.add_argument('--output-spec', action='append', metavar='KEY=VALUE,...', help='额外的输出，可以重复指定，视频只解码一次。例如"output=thumb.gif,size=160x90,fps=5"，'
+                              '可用的键为output、size（宽x高）、fps、duration、fill_mode、palette、colors、delta_threshold、resample、select、select_threshold、scene_boost和segments（分号分隔，例如0-2;10-12），未指定的键使用本命令的参数')
+    video_parser.add_argument('--encode-jobs', type=int, default=1, help='LZW编码使用的并行进程数，0表示使用全部CPU核心，默认1（在当前进程中编码）。只有不小于256x256像素的帧交给进程池，单核时忽略。输出与逐帧编码完全相同')
+    video_parser.add_argument('--format', choices=OUTPUT_FORMATS, help='输出格式：gif、webp（动画WebP）或apng，默认根据输出文件扩展名推断（.webp、.png/.apng，其他为gif）')
+    video_parser.add_argument('--quality', type=int, help=f'动画WebP的有损压缩质量（0-100），默认{WEBP_QUALITY}')
+    video_parser.add_argument('--output-cache', help='输出缓存目录：视频文件和参数都与之前某次生成相同时，直接硬链接（或复制）缓存的文件。默认不使用，不适用于--output-spec')
+    video_parser.add_argument('--output-cache-size', type=int, default=OUTPUT_CACHE_MAX_BYTES // (1024 * 1024), help='输出缓存大小上限(MB)，超出时淘汰最久未使用的条目，默认1024')
+    video_parser.add_argument('--spool', action='store_true', help='global调色板模式下把调整大小后的帧写入磁盘上的帧缓冲，调色板从全部输出帧中抽样，编码时从缓冲读取而不重新解码视频')
+    video_parser.add_argument('--spool-dir', help='帧缓冲文件所在的目录（同时启用--spool），默认为系统临时目录')
+    video_parser.add_argument('--spool-size', type=int, default=FRAME_SPOOL_MAX_BYTES // (1024 * 1024), help='帧缓冲文件大小上限(MB)，超出时改为抽样构建调色板，默认16384')
+    video_parser.add_argument('--max-bytes', type=int, help='输出文件大小上限(字节)，先抽样估算大小，自动降低颜色数、分辨率和帧率以满足上限')
+    video_parser.add_argument('--stats', choices=['text', 'json'], help='完成后输出各阶段耗时、帧数、字节数和峰值内存：text=易读的表格，json=一行JSON（最后一行输出）')
+    video_parser.add_argument('--prometheus', help='把统计信息以Prometheus文本格式写入该文件（例如node_exporter的textfile目录）')
     
-    args = parser.parse_args()
-    
-    # 如果没有指定子命令，默认使用images命令（向后兼容）
-    if not args.command:
-        print("未指定命令，默认使用'images'命令处理图片目录")
-        args.command = 'images'
-        
-        # 为兼容旧版本，检查是否提供了必要的参数
-        if not hasattr(args, 'input') or not hasattr(args, 'output'):
-            parser.print_help()
-            return
+    # 批量任务的子命令
+    batch_parser = subparsers.add_parser('batch', help='按清单文件在一个进程池中批量创建GIF')
+    batch_parser.add_argument('-m', '--manifest', required=True, help='任务清单文件（JSON数组或每行一个任务的JSONL）')
+    batch_parser.add_argument('-j', '--jobs', type=int, default=0, help='同时执行任务的进程数，0表示使用全部CPU核心（默认），1表示在当前进程中依次执行')
+    batch_parser.add_argument('--report', help='把每个任务的执行结果以JSONL格式写入该文件')
+    batch_parser.add_argument('--prometheus', help='把所有任务的统计信息以Prometheus文本格式写入该文件，以任务序号和输出文件作为标签')
+
+    # 本地HTTP渲染服务
+    serve_parser = subparsers.add_parser('serve', help='运行本地HTTP渲染服务，在预热的进程池中执行与batch清单格式相同的任务')
+    serve_parser.add_argument('--host', default=SERVE_HOST, help=f'监听地址，默认{SERVE_HOST}（只接受本机连接）')
+    serve_parser.add_argument('--port', type=int, default=SERVE_PORT, help=f'监听端口，默认{SERVE_PORT}')
+    serve_parser.add_argument('-j', '--jobs', type=int, default=0, help='工作进程数，0表示使用全部CPU核心（默认）')
+    serve_parser.add_argument('--queue-size', type=int, default=SERVE_QUEUE_SIZE, help=f'排队和执行中的不同任务数上限，超出时返回503，默认{SERVE_QUEUE_SIZE}')
     
+    parser.subcommand_parsers = {'images': img_parser, 'video': video_parser, 'batch': batch_parser, 'serve': serve_parser}
+    return parser
+
+def run_command(args, progress=None):
+    """
+    按解析后的参数执行images或video命令
+
+    参数:
+        args: build_parser()解析得到的参数
+        progress: GifProgress对象，用于取消以及获取各阶段耗时等统计信息，None表示不需要
+
+    返回:
+        bool: 是否成功创建GIF
+    """
     # 设置目标大小
     target_size = None
     if hasattr(args, 'width') and hasattr(args, 'height') and args.width and args.height:
@@ -460,7 +4282,7 @@ def main():
     if args.command == 'images':
         # 从图片创建GIF
         fill_mode = getattr(args, 'fill_mode', 'fill')  # 兼容旧版本
-        create_gif_from_directory(
+        return create_gif_from_directory(
             args.input, 
             args.output, 
             args.duration, 
@@ -468,16 +4290,72 @@ def main():
             args.resize, 
             target_size, 
             args.keep_aspect_ratio,
-            fill_mode
+            fill_mode,
+            args.jobs,
+            args.palette,
+            args.delta_threshold,
+            open_frame_cache(args.cache_dir, args.cache_size * 1024 * 1024),
+            progress,
+            args.resample,
+            args.append,
+            args.encode_jobs,
+            args.format,
+            args.quality,
+            open_output_cache(args.output_cache, args.output_cache_size * 1024 * 1024)
         )
     elif args.command == 'video':
         # 从视频创建GIF
-        if not OPENCV_AVAILABLE:
-            print("错误: 未安装opencv-python库，无法处理视频文件。请使用 'pip install opencv-python' 安装。")
-            return
+        if not _load_cv2():
+            return _report_failure("错误: 未安装opencv-python库，无法处理视频文件。请使用 'pip install opencv-python' 安装。", progress)
         
         fill_mode = getattr(args, 'fill_mode', 'fill')  # 兼容旧版本
-        create_gif_from_video(
+        try:
+            segments = resolve_segments(args.segments)
+        except ValueError as e:
+            return _report_failure(f"错误: {e}", progress)
+        if segments is not None and (args.start or args.end is not None):
+            return _report_failure("错误: --segments不能与-s/--start或-e/--end同时使用", progress)
+        if args.split_segments and segments is None:
+            return _report_failure("错误: --split-segments需要同时指定--segments", progress)
+        if args.output_spec or args.split_segments:
+            if args.max_bytes:
+                return _report_failure("错误: --output-spec和--split-segments不能与--max-bytes同时使用", progress)
+            defaults = {
+                'fps': args.fps,
+                'duration': args.duration,
+                'target_size': target_size,
+                'keep_aspect_ratio': args.keep_aspect_ratio,
+                'fill_mode': fill_mode,
+                'palette': args.palette,
+                'delta_threshold': args.delta_threshold,
+                'resample': args.resample,
+                'colors': args.colors,
+                'select': args.select,
+                'select_threshold': args.select_threshold,
+                'scene_boost': args.scene_boost,
+                'encode_workers': args.encode_jobs,
+                'output_format': args.format,
+                'quality': args.quality,
+                'segments': segments,
+            }
+            if args.split_segments:
+                # 每个片段作为一个输出，所有片段仍在一遍读取中提取
+                if args.output_spec:
+                    return _report_failure("错误: --split-segments不能与--output-spec同时使用", progress)
+                if not args.output:
+                    return _report_failure("错误: 请使用-o指定输出文件", progress)
+                outputs = [dict(defaults, output=segment_output_path(args.output, index), segments=[segment]) for index, segment in enumerate(segments)]
+                return all(create_gifs_from_video(args.input, outputs, progress=progress))
+            try:
+                outputs = [dict(defaults, **parse_output_spec(text)) for text in args.output_spec]
+            except ValueError as e:
+                return _report_failure(f"错误: {e}", progress)
+            if args.output:
+                outputs.insert(0, dict(defaults, output=args.output))
+            return all(create_gifs_from_video(args.input, outputs, args.start, args.end, progress))
+        if not args.output:
+            return _report_failure("错误: 请使用-o指定输出文件，或使用--output-spec指定一个或多个输出", progress)
+        return create_gif_from_video(
             args.input,
             args.output,
             args.start,
@@ -486,8 +4364,472 @@ def main():
             args.duration,
             target_size,
             args.keep_aspect_ratio,
-            fill_mode
+            fill_mode,
+            args.palette,
+            args.delta_threshold,
+            progress,
+            args.resample,
+            args.colors,
+            args.max_bytes,
+            args.select,
+            args.select_threshold,
+            args.scene_boost,
+            (args.spool_dir or tempfile.gettempdir()) if args.spool or args.spool_dir else None,
+            args.spool_size * 1024 * 1024,
+            args.encode_jobs,
+            args.format,
+            args.quality,
+            open_output_cache(args.output_cache, args.output_cache_size * 1024 * 1024),
+            segments
         )
+    return False
+
+def report_stats(progress, stats_format=None, prometheus_file=None, labels=None):
+    """
+    输出一次生成过程的统计信息
+
+    参数:
+        progress: 已结束的GifProgress对象
+        stats_format: 'text'打印易读的表格，'json'打印一行JSON，None表示不打印
+        prometheus_file: Prometheus文本格式的输出文件，None表示不写入
+        labels: Prometheus指标的标签字典
+    """
+    metrics = progress.metrics()
+    if stats_format == 'json':
+        print(json.dumps(metrics, ensure_ascii=False))
+    elif stats_format == 'text':
+        peak = metrics['peak_rss_bytes']
+        peak_text = f"{peak / (1024 * 1024):.1f} MB" if peak is not None else "未知"
+        print("统计信息:")
+        for stage, seconds in progress.stage_times.items():
+            print(f"  {stage}: {progress.stage_frames.get(stage, 0)} 帧, 耗时 {seconds:.2f}秒")
+        print(f"  共 {metrics['frames']} 帧, {metrics['bytes']} 字节, 总耗时 {metrics['elapsed']:.2f}秒, 峰值内存 {peak_text}")
+    if prometheus_file:
+        try:
+            write_prometheus(prometheus_file, [(labels or {}, metrics)])
+        except OSError as e:
+            print(f"写入Prometheus统计文件时出错: {e}")
+
+# 批量任务可以使用的任务类型，与同名子命令的参数一致
+BATCH_JOB_TYPES = ('images', 'video')
+# 清单任务中值为true或false的开关参数（对应命令行中不带值的参数）
+JOB_FLAG_OPTIONS = frozenset({'resize', 'keep_aspect_ratio', 'append', 'split_segments', 'spool'})
+# 清单任务中值可以是列表的参数（对应命令行中可以重复指定的参数）
+JOB_LIST_OPTIONS = frozenset({'output_spec'})
+
+def load_manifest(manifest_path):
+    """
+    读取批量任务清单
+
+    清单可以是任务对象组成的JSON数组、带有"jobs"数组的JSON对象，或者每行一个任务对象的JSONL文件。
+
+    参数:
+        manifest_path: 清单文件路径
+
+    返回:
+        list: 任务字典列表
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        return data['jobs'] if 'jobs' in data else [data]
+    return data
+
+def parse_job_args(job):
+    """
+    把清单中的一个任务转换为与对应子命令相同的参数
+
+    任务字典中"type"为images或video，"input"和"output"为必填项，其余键与子命令的长参数名相同
+    （例如"fill_mode"或"fill-mode"），未指定（或为null）的参数使用子命令的默认值。
+    每个键被转换为命令行参数后由子命令的解析器解析，类型转换和可选值检查与命令行完全相同：
+    开关参数的值为true或false，可以重复指定的参数（例如output_spec）的值为列表。
+
+    参数:
+        job: 任务字典
+
+    返回:
+        Namespace: 可以直接传给run_command的参数
+    """
+    if not isinstance(job, dict):
+        raise ValueError(f"任务必须是JSON对象: {job!r}")
+    options = {key.replace('-', '_'): value for key, value in job.items()}
+    command = options.pop('type', None)
+    if command not in BATCH_JOB_TYPES:
+        raise ValueError(f"不支持的任务类型: {command}，可选值为 {', '.join(BATCH_JOB_TYPES)}")
+    for key in ('input', 'output'):
+        if not options.get(key):
+            raise ValueError(f"任务缺少必填参数: {key}")
+
+    argv = []
+    disabled = []  # 值为false的开关参数，解析后再设置（例如默认开启的keep_aspect_ratio）
+    for key, value in options.items():
+        if value is None:
+            continue
+        option = '--' + key.replace('_', '-')
+        if key in JOB_FLAG_OPTIONS:
+            if not isinstance(value, bool):
+                raise ValueError(f"任务参数 {key} 的值必须是true或false: {value!r}")
+            if value:
+                argv.append(option)
+            else:
+                disabled.append(key)
+            continue
+        if key == 'segments' and isinstance(value, list):
+            # 时间片段也可以写成[[开始, 结束], ...]
+            try:
+                value = ','.join(f"{start}-{end}" for start, end in value)
+            except (TypeError, ValueError):
+                raise ValueError(f"任务参数 segments 的值无效: {value!r}") from None
+        if key in JOB_LIST_OPTIONS:
+            values = value if isinstance(value, list) else [value]
+        elif isinstance(value, (list, dict)):
+            raise ValueError(f"任务参数 {key} 的值不能是列表或对象: {value!r}")
+        else:
+            values = [value]
+        argv += [f"{option}={item}" for item in values]
+
+    parser = build_parser(JobArgumentParser).subcommand_parsers[command]
+    args, unknown = parser.parse_known_args(argv)
+    if unknown:
+        keys = sorted({item.split('=', 1)[0].lstrip('-').replace('-', '_') for item in unknown})
+        raise ValueError(f"未知的{command}任务参数: {', '.join(keys)}")
+    args.command = command
+    for key in disabled:
+        setattr(args, key, False)
+    return args
+
+def _run_batch_job(task):
+    """
+    批量任务的工作函数：执行一个任务并返回执行记录
+
+    任务的输出被收集起来（不打印），避免多个任务的输出交错；失败时的错误信息来自任务自己的GifProgress。
+
+    参数:
+        task: (任务序号, 任务字典)
+
+    返回:
+        dict: 执行记录
+    """
+    index, job = task
+    known = job if isinstance(job, dict) else {}
+    record = {'index': index, 'type': known.get('type'), 'output': known.get('output'), 'success': False, 'error': None}
+    start = time.perf_counter()
+    log = io.StringIO()
+    progress = GifProgress()
+    try:
+        args = parse_job_args(job)
+        record['type'], record['output'] = args.command, args.output
+        with contextlib.redirect_stdout(log):
+            record['success'] = bool(run_command(args, progress))
+        if not record['success']:
+            record['error'] = progress.error or '未知错误'
+    except Exception as e:
+        record['error'] = str(e)
+    if progress.success is None:
+        progress.fail(record['error'])
+    record['elapsed'] = round(time.perf_counter() - start, 3)
+    record['stats'] = progress.metrics()
+    return record
+
+def run_batch(manifest_path, workers=0, report_file=None, prometheus_file=None):
+    """
+    按清单批量创建GIF
+
+    所有任务在同一个进程池中执行，每个工作进程只在启动时导入一次依赖库，之后连续处理多个任务。
+    单个任务失败不影响其他任务，每个任务的结果都会记录下来。
+
+    参数:
+        manifest_path: 任务清单文件路径，格式见load_manifest
+        workers: 同时执行任务的进程数，1表示在当前进程中依次执行，0或负数表示使用全部CPU核心
+        report_file: 执行结果的输出文件（JSONL，每行一个任务），None表示不写入
+        prometheus_file: 所有任务统计信息的Prometheus文本格式输出文件，None表示不写入
+
+    返回:
+        list: 按任务顺序排列的执行记录，每条记录包含index、type、output、success、error、elapsed
+            和stats（GifProgress.metrics()的各阶段耗时等统计信息）
+    """
+    try:
+        jobs = load_manifest(manifest_path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"读取任务清单时出错: {e}")
+        return []
+    if not jobs:
+        print(f"错误: 任务清单 {manifest_path} 中没有任务")
+        return []
+    
+    workers = min(resolve_workers(workers), len(jobs))
+    print(f"共 {len(jobs)} 个任务，使用 {workers} 个进程")
+    
+    start = time.perf_counter()
+    tasks = list(enumerate(jobs))
+    records = []
+    report = open(report_file, 'w', encoding='utf-8') if report_file else None
+    try:
+        if workers > 1:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            results = executor.map(_run_batch_job, tasks)
+        else:
+            executor = None
+            results = map(_run_batch_job, tasks)
+        try:
+            for record in results:
+                records.append(record)
+                if report:
+                    report.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    report.flush()
+                if not record['success']:
+                    print(f"任务 {record['index']} 失败: {record['error']}")
+        finally:
+            if executor:
+                executor.shutdown()
+    finally:
+        if report:
+            report.close()
+    
+    if prometheus_file:
+        write_prometheus(prometheus_file, [({'index': record['index'], 'output': record['output']}, record['stats']) for record in records])
+    elapsed = time.perf_counter() - start
+    succeeded = sum(1 for record in records if record['success'])
+    print(f"批量任务完成: 成功 {succeeded} 个，失败 {len(records) - succeeded} 个，"
+          f"耗时 {elapsed:.2f}秒，吞吐量 {len(records) / elapsed:.2f} 个/秒")
+    return records
+
+# serve子命令默认监听的地址和端口
+SERVE_HOST = '127.0.0.1'
+SERVE_PORT = 8765
+# 渲染服务中排队和执行中的不同任务数上限，超出时新的请求立即得到503，由客户端稍后重试
+SERVE_QUEUE_SIZE = 16
+# 渲染请求正文的大小上限（字节），任务参数只是一个小的JSON对象，超出时返回413
+SERVE_MAX_REQUEST_BYTES = 64 * 1024
+
+def _warm_worker():
+    """渲染服务工作进程的初始化函数：预先导入cv2和Pillow的图片插件，请求到来时不再等待导入"""
+    _load_cv2()
+    Image.init()
+
+def render_job_key(job):
+    """
+    返回任务的合并键：参数名统一为下划线形式后，把任务字典序列化为规范的JSON并取SHA-256
+
+    参数:
+        job: 任务字典，格式见parse_job_args
+
+    返回:
+        str: 十六进制摘要，输入、输出和所有参数都相同的任务得到相同的键
+    """
+    options = {key.replace('-', '_'): value for key, value in job.items()}
+    return hashlib.sha256(json.dumps(options, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+class RenderService:
+    """
+    常驻的渲染服务：在预热的进程池中执行与batch清单格式相同的任务
+
+    工作进程启动时就导入了cv2和Pillow（见_warm_worker），之后一直保留，每个请求只需要执行渲染本身。
+    同时到达的相同任务（见render_job_key）合并为一次渲染，结果返回给所有请求，
+    它们写的是同一个输出文件，因此合并也避免了互相覆盖。排队和执行中的不同任务最多queue_size个，
+    超出时submit()立即拒绝，而不是让请求无限排队。
+    """
+
+    def __init__(self, workers=0, queue_size=SERVE_QUEUE_SIZE):
+        """
+        参数:
+            workers: 工作进程数，0或负数表示使用全部CPU核心
+            queue_size: 排队和执行中的不同任务数上限
+        """
+        self.workers = resolve_workers(workers)
+        self.queue_size = queue_size
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._next_index = 0
+        self.stats = {'requests': 0, 'renders': 0, 'coalesced': 0, 'rejected': 0}
+
+    def warm_up(self):
+        """启动全部工作进程并等待它们完成导入"""
+        for future in [self._executor.submit(_warm_worker) for _ in range(self.workers)]:
+            future.result()
+
+    @property
+    def pending(self):
+        """排队和执行中的不同任务数"""
+        with self._lock:
+            return len(self._inflight)
+
+    def submit(self, job):
+        """
+        提交一个任务，与执行中的相同任务合并
+
+        参数:
+            job: 任务字典，格式见parse_job_args
+
+        返回:
+            tuple: (Future, 是否与已有的任务合并)，Future的结果为_run_batch_job返回的执行记录；
+                队列已满时为(None, False)
+        """
+        key = render_job_key(job)
+        with self._lock:
+            self.stats['requests'] += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future, True
+            if len(self._inflight) >= self.queue_size:
+                self.stats['rejected'] += 1
+                return None, False
+            future = self._executor.submit(_run_batch_job, (self._next_index, job))
+            self._next_index += 1
+            self.stats['renders'] += 1
+            self._inflight[key] = future
+        future.add_done_callback(lambda _: self._finish(key))
+        return future, False
+
+    def _finish(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def close(self):
+        """关闭进程池，等待执行中的任务结束"""
+        self._executor.shutdown(cancel_futures=True)
+
+def create_render_server(host=SERVE_HOST, port=SERVE_PORT, workers=0, queue_size=SERVE_QUEUE_SIZE):
+    """
+    创建本地HTTP渲染服务，工作进程启动并预热后才返回
+
+    接口:
+        POST /render  请求体为一个任务对象（JSON，格式与batch清单中的任务相同），渲染完成后返回执行记录
+                      （见_run_batch_job，另加coalesced表示是否与同时到达的相同请求合并）。
+                      成功为200，任务参数有误为400，渲染失败为500，队列已满为503（带Retry-After）
+        GET /health   返回工作进程数、排队和执行中的任务数以及请求计数
+
+    参数:
+        host: 监听地址，默认只接受本机连接
+        port: 监听端口，0表示由系统分配（见返回对象的server_address）
+        workers: 工作进程数，0或负数表示使用全部CPU核心
+        queue_size: 排队和执行中的不同任务数上限
+
+    返回:
+        ThreadingHTTPServer: 调用serve_forever()开始服务，service属性为RenderService
+    """
+    # 只有serve子命令用到http.server，不在模块加载时导入
+    import http.server
+
+    class RenderRequestHandler(http.server.BaseHTTPRequestHandler):
+        def _send_json(self, status, data, headers=None):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != '/health':
+                self._send_json(404, {'error': f"未知的路径: {self.path}"})
+                return
+            service = self.server.service
+            with service._lock:
+                stats = dict(service.stats)
+            self._send_json(200, dict(stats, workers=service.workers, pending=service.pending, queue_size=service.queue_size))
+
+        def do_POST(self):
+            if self.path != '/render':
+                self._send_json(404, {'error': f"未知的路径: {self.path}"})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', ''))
+            except ValueError:
+                length = -1
+            if length < 0:
+                self._send_json(400, {'success': False, 'error': '缺少或无效的Content-Length'})
+                return
+            if length > SERVE_MAX_REQUEST_BYTES:
+                self._send_json(413, {'success': False, 'error': f"请求正文超过 {SERVE_MAX_REQUEST_BYTES} 字节"})
+                return
+            try:
+                job = json.loads(self.rfile.read(length))
+                # 参数的类型和可选值与命令行一样在这里检查，有误时直接返回400，不占用队列和工作进程
+                parse_job_args(job)
+            except ValueError as e:
+                self._send_json(400, {'success': False, 'error': str(e)})
+                return
+            except SystemExit:
+                # argparse在个别情况下仍会直接退出（例如请求了help），同样视为参数错误
+                self._send_json(400, {'success': False, 'error': '无效的任务参数'})
+                return
+            future, coalesced = self.server.service.submit(job)
+            if future is None:
+                self._send_json(503, {'success': False, 'error': '渲染队列已满，请稍后重试'}, {'Retry-After': '1'})
+                return
+            try:
+                record = dict(future.result(), coalesced=coalesced)
+            except Exception as e:
+                record = {'success': False, 'error': f"工作进程出错: {e}", 'coalesced': coalesced}
+            self._send_json(200 if record['success'] else 500, record)
+
+        def log_message(self, format, *args):
+            print(f"{self.address_string()} {format % args}")
+
+    service = RenderService(workers, queue_size)
+    try:
+        service.warm_up()
+        server = http.server.ThreadingHTTPServer((host, port), RenderRequestHandler)
+    except BaseException:
+        service.close()
+        raise
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+def serve(host=SERVE_HOST, port=SERVE_PORT, workers=0, queue_size=SERVE_QUEUE_SIZE):
+    """
+    运行本地HTTP渲染服务，直到按Ctrl+C，接口见create_render_server
+
+    与每个请求启动一次命令行进程相比，省去了每次启动Python和导入cv2、Pillow的时间
+    """
+    server = create_render_server(host, port, workers, queue_size)
+    address = server.server_address
+    print(f"渲染服务已启动: http://{address[0]}:{address[1]}，{server.service.workers} 个工作进程，队列上限 {server.service.queue_size}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("正在停止渲染服务")
+    finally:
+        server.server_close()
+        server.service.close()
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    
+    # 如果没有指定子命令，默认使用images命令（向后兼容）
+    if not args.command:
+        print("未指定命令，默认使用'images'命令处理图片目录")
+        args.command = 'images'
+        
+        # 为兼容旧版本，检查是否提供了必要的参数
+        if not hasattr(args, 'input') or not hasattr(args, 'output'):
+            parser.print_help()
+            return
+    
+    if args.command == 'batch':
+        run_batch(args.manifest, args.jobs, args.report, args.prometheus)
+    elif args.command == 'serve':
+        serve(args.host, args.port, args.jobs, args.queue_size)
+    else:
+        progress = GifProgress()
+        run_command(args, progress)
+        # 使用--output-spec一次生成多个文件时，统计信息是所有输出的合计
+        outputs = [args.output] + (getattr(args, 'output_spec', None) or [])
+        report_stats(progress, getattr(args, 'stats', None), getattr(args, 'prometheus', None),
+                     {'command': args.command, 'output': ';'.join(filter(None, outputs))})
 
 if __name__ == "__main__":
+    # PyInstaller打包后使用进程池需要
+    multiprocessing.freeze_support()
     main()
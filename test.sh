@@ -1 +1,12 @@
-./dist/macos/arm64/gif-maker -i test_image -o test_output/prototype1.gif -d 1000 -p "*.png"
\ No newline at end of file
+# 与平台无关的单元测试，直接使用源码运行
+python -m pytest -q tests || echo "失败: pytest测试未通过"
+
+./dist/macos/arm64/gif-maker -i test_image -o test_output/prototype1.gif -d 1000 -p "*.png"
+
+# batch清单中的参数与命令行一样转换类型并检查可选值：字符串"80"按整数处理，无效的fill_mode报告出错的参数
+mkdir -p test_output
+printf '%s\n' '{"type": "images", "input": "test_image", "output": "test_output/job_width.gif", "resize": true, "width": "80", "height": "60"}' \
+    '{"type": "images", "input": "test_image", "output": "test_output/job_fill_mode.gif", "fill_mode": "zzz"}' > test_output/jobs.jsonl
+./dist/macos/arm64/gif-maker batch -m test_output/jobs.jsonl -j 1 --report test_output/jobs_report.jsonl
+grep -q '"index": 0, .*"success": true' test_output/jobs_report.jsonl || echo "失败: width为字符串的任务应当成功"
+grep -q '"index": 1, .*"success": false, "error": "无效的任务参数: argument --fill-mode: invalid choice' test_output/jobs_report.jsonl || echo "失败: 无效的fill_mode应当在解析参数时报告"
@@ -0,0 +1,168 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence, features
+
+import gif_maker
+
+
+def quiet(func, *args, **kwargs):
+    """调用func并丢弃它打印的进度信息"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def decoded_frames(path):
+    """解码动画文件的每一帧，返回RGBA数组列表"""
+    with Image.open(path) as im:
+        return [np.asarray(frame.convert('RGBA')).copy() for frame in ImageSequence.Iterator(im)]
+
+
+def make_images(directory, sizes):
+    """在directory中生成大小依次为sizes、内容各不相同的PNG图片，颜色不超过16种，GIF可以无损保存"""
+    rng = np.random.default_rng(0)
+    colors = rng.integers(0, 256, (16, 3), dtype=np.uint8)
+    for i, (width, height) in enumerate(sizes):
+        pixels = colors[rng.integers(0, len(colors), (height, width))]
+        Image.fromarray(pixels).save(directory / f"frame_{i:03d}.png")
+
+
+MIXED_FORMATS = ['gif', 'apng'] + (['webp'] if features.check('webp') else [])
+
+
+@pytest.mark.parametrize('output_format', MIXED_FORMATS)
+def test_mixed_size_frames_use_first_frame_size(tmp_path, output_format):
+    src = tmp_path / 'src'
+    src.mkdir()
+    make_images(src, [(30, 20), (36, 24), (12, 10)])
+    output = tmp_path / f"out.{output_format}"
+
+    assert quiet(gif_maker.create_gif_from_directory, str(src), str(output), output_format=output_format)
+
+    with Image.open(output) as im:
+        assert im.size == (30, 20)
+        assert im.n_frames == 3
+    if output_format == 'gif':
+        # 更大的第二帧按画布裁剪，内容与原图左上角一致
+        source = np.asarray(Image.open(src / 'frame_001.png'))
+        assert np.array_equal(decoded_frames(output)[1][..., :3], source[:20, :30])
+
+
+def test_gif_frame_descriptor_never_exceeds_screen(tmp_path):
+    output = tmp_path / 'out.gif'
+    with gif_maker.GifStreamWriter(str(output)) as writer:
+        writer.write(Image.new('RGB', (8, 8), 'red'))
+        writer.write(Image.new('RGB', (16, 4), 'blue'))
+
+    frames = decoded_frames(output)
+    assert frames[0].shape[:2] == (8, 8)
+    assert (frames[1][:4, :, :3] == (0, 0, 255)).all()
+    # 画布中没有被第二帧覆盖的部分为透明
+    assert (frames[1][4:, :, 3] == 0).all()
+
+
+@pytest.mark.parametrize('palette', gif_maker.PALETTE_MODES)
+def test_gif_round_trip_matches_source_frames(tmp_path, palette):
+    src = tmp_path / 'src'
+    src.mkdir()
+    make_images(src, [(40, 30)] * 6)
+    output = tmp_path / 'out.gif'
+
+    assert quiet(gif_maker.create_gif_from_directory, str(src), str(output), palette=palette)
+
+    sources = [np.asarray(Image.open(path).convert('RGB')) for path in sorted(src.iterdir())]
+    frames = decoded_frames(output)
+    assert len(frames) == len(sources)
+    for source, frame in zip(sources, frames):
+        assert (frame[..., 3] == 255).all()
+        assert np.array_equal(frame[..., :3], source)
+
+
+@pytest.mark.parametrize('palette', gif_maker.PALETTE_MODES)
+def test_append_matches_full_rebuild(tmp_path, palette):
+    src = tmp_path / 'src'
+    src.mkdir()
+    make_images(src, [(40, 30)] * 8)
+    paths = sorted(src.iterdir())
+    # 先只用前5张生成，再加入后3张续写
+    later = tmp_path / 'later'
+    later.mkdir()
+    for path in paths[5:]:
+        path.rename(later / path.name)
+    appended = tmp_path / 'appended.gif'
+    assert quiet(gif_maker.create_gif_from_directory, str(src), str(appended), palette=palette, append=True)
+    for path in paths[5:]:
+        (later / path.name).rename(path)
+    assert quiet(gif_maker.create_gif_from_directory, str(src), str(appended), palette=palette, append=True)
+
+    rebuilt = tmp_path / 'rebuilt.gif'
+    assert quiet(gif_maker.create_gif_from_directory, str(src), str(rebuilt), palette=palette)
+
+    appended_frames, rebuilt_frames = decoded_frames(appended), decoded_frames(rebuilt)
+    assert len(appended_frames) == len(rebuilt_frames) == 8
+    assert all(np.array_equal(a, b) for a, b in zip(appended_frames, rebuilt_frames))
+
+
+def test_frame_cache_hits_on_second_run(tmp_path, capsys):
+    src = tmp_path / 'src'
+    src.mkdir()
+    make_images(src, [(40, 30)] * 4)
+    cache = gif_maker.FrameCache(str(tmp_path / 'cache'))
+    options = dict(resize=True, target_size=(20, 16), cache=cache)
+
+    assert gif_maker.create_gif_from_directory(str(src), str(tmp_path / 'first.gif'), **options)
+    assert "帧缓存: 命中 0 张，新缓存 4 张" in capsys.readouterr().out
+    assert gif_maker.create_gif_from_directory(str(src), str(tmp_path / 'second.gif'), **options)
+    assert "帧缓存: 命中 4 张，新缓存 0 张" in capsys.readouterr().out
+
+    assert (tmp_path / 'first.gif').read_bytes() == (tmp_path / 'second.gif').read_bytes()
+
+
+def test_output_cache_hits_and_misses(tmp_path, capsys):
+    src = tmp_path / 'src'
+    src.mkdir()
+    make_images(src, [(40, 30)] * 4)
+    cache = gif_maker.OutputCache(str(tmp_path / 'cache'))
+
+    assert gif_maker.create_gif_from_directory(str(src), str(tmp_path / 'first.gif'), output_cache=cache)
+    assert "命中输出缓存" not in capsys.readouterr().out
+    progress = gif_maker.GifProgress()
+    assert gif_maker.create_gif_from_directory(str(src), str(tmp_path / 'second.gif'), output_cache=cache, progress=progress)
+    assert "命中输出缓存" in capsys.readouterr().out
+    assert progress.frames == 4
+    assert (tmp_path / 'first.gif').read_bytes() == (tmp_path / 'second.gif').read_bytes()
+
+    # 影响输出的参数变化后不命中
+    assert gif_maker.create_gif_from_directory(str(src), str(tmp_path / 'third.gif'), duration=50, output_cache=cache)
+    assert "命中输出缓存" not in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('job', [
+    ['not', 'an', 'object'],
+    {'type': 'audio', 'input': 'a', 'output': 'b.gif'},
+    {'type': 'images', 'output': 'b.gif'},
+    {'type': 'images', 'input': 'a', 'output': 'b.gif', 'bogus': 1},
+    {'type': 'images', 'input': 'a', 'output': 'b.gif', 'fill': 'center'},
+    {'type': 'images', 'input': 'a', 'output': 'b.gif', 'fill_mode': 'zzz'},
+    {'type': 'images', 'input': 'a', 'output': 'b.gif', 'width': 'wide'},
+    {'type': 'images', 'input': 'a', 'output': 'b.gif', 'resize': 'yes'},
+    {'type': 'images', 'input': 'a', 'output': 'b.gif', 'duration': [100]},
+    {'type': 'images', 'input': 'a', 'output': 'b.gif', 'help': True},
+    {'type': 'video', 'input': 'a.mp4', 'output': 'b.gif', 'segments': [[0, 1, 2]]},
+])
+def test_parse_job_args_rejects_invalid_jobs(job):
+    with pytest.raises(ValueError):
+        gif_maker.parse_job_args(job)
+
+
+def test_parse_job_args_matches_command_line():
+    job = {'type': 'video', 'input': 'a.mp4', 'output': 'b.gif', 'width': '80', 'height': 60,
+           'keep_aspect_ratio': False, 'output-spec': ['output=c.gif,fps=5'], 'segments': [[0, 1], [2, 3]]}
+    args = gif_maker.parse_job_args(job)
+    expected = gif_maker.build_parser().parse_args(
+        ['video', '-i', 'a.mp4', '-o', 'b.gif', '-w', '80', '--height', '60',
+         '--output-spec', 'output=c.gif,fps=5', '--segments', '0-1,2-3'])
+    expected.keep_aspect_ratio = False
+    assert vars(args) == vars(expected)